@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""
+    Benchmarks of tabulation hot paths on synthetic survey data (see pymeera.utils.synthetic).
+
+    Run and store results of current commit:
+        python -m benchmarks.suite --sizes 1e3 1e4 1e5 1e6 1e7
+    Compare two stored runs, cases slower by more than threshold are reported as regressions:
+        python -m benchmarks.suite --compare benchmarks/results/a.json benchmarks/results/b.json
+"""
+
+from __future__ import print_function, unicode_literals, division
+
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.utils.exprparser import Expression
+from pymeera.utils.synthetic import make_frame, make_structure
+from pymeera.tools.crosstab import Crosstab
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+DEFAULT_SIZES = (1e3, 1e4, 1e5, 1e6, 1e7)
+
+# number of variables of data does not depend on size, so time of cases is linear in size
+DATA = dict(single=6, multi=2, choices=5, values=5, missing=.1)
+EXPRESSION = 'q1 + q2 > q3 + m1_1 + m1_2 + m1_3 + m1_4 + m1_5 by q4 + q5 > q6'
+
+# size of cases that do not scan data is capped: it is number of expressions or variables
+MAX_ITEMS = 10 ** 5
+
+
+def _data(size):
+    return make_frame(respondents=size, **DATA)
+
+
+def case_parse(size):
+    expressions = ['q%d + q%d > q%d by q%d + (q%d + q%d) > q%d' % tuple(range(i, i + 7))
+                   for i in range(min(size, MAX_ITEMS) // 100 or 1)]
+
+    def run():
+        Expression.cache_clear()
+        for expression in expressions:
+            Expression.parse(expression=expression)
+    return run
+
+
+def case_to_hierarchical(size):
+    data = make_frame(respondents=1, single=0, multi=max(min(size, MAX_ITEMS) // 10, 1), choices=10, weight=None)
+    structure = make_structure(data)
+    return structure.to_hierarchical
+
+
+def case_crosstab(size):
+    data = _data(size)
+    return lambda: Crosstab(data, expression=EXPRESSION, weight='weight')
+
+
+def case_compute_total_and_weights(size):
+    data = _data(size)
+    table = Crosstab(data.iloc[:10], expression=EXPRESSION, weight='weight')
+    table.data = data.copy()
+
+    def setup():
+        # every run adds generated columns to data as the first one does
+        table.data.drop(columns=['__TOTAL__', '__WEIGHT__'], errors='ignore', inplace=True)
+        table._answered = {}
+
+    def run():
+        table._compute_total_and_weights()
+    return run, setup
+
+
+def case_as_cpct(size):
+    table = Crosstab(_data(size), expression=EXPRESSION, weight='weight')
+
+    def run():
+        # view is cached, it is rendered again on every run
+        table._views = {}
+        table.as_cpct()
+    return run
+
+
+CASES = OrderedDict([
+    ('parse', case_parse),
+    ('to_hierarchical', case_to_hierarchical),
+    ('crosstab', case_crosstab),
+    ('compute_total_and_weights', case_compute_total_and_weights),
+    ('as_cpct', case_as_cpct),
+])
+
+
+def measure(function, repeat=5, budget=10., setup=None):
+    """
+    Time of function, repeated while time budget allows
+
+    :param setup: function called before every repeat, it is not timed
+    :return: dict, min and median time in seconds and number of runs
+    """
+    times = []
+    started = time.perf_counter()
+    while len(times) < repeat and (not times or time.perf_counter() - started < budget):
+        if setup is not None:
+            setup()
+        begin = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - begin)
+    return {'min': min(times), 'median': float(np.median(times)), 'runs': len(times)}
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(sizes=DEFAULT_SIZES, cases=None, repeat=5, budget=10., verbose=True):
+    """
+    :param sizes: list of numbers of rows
+    :param cases: list of names of CASES, default is all cases
+    :return: dict of results with environment and commit
+    """
+    results = []
+    for name in cases or list(CASES):
+        for size in sizes:
+            # case is function or tuple of function and its setup
+            case = CASES[name](int(size))
+            function, setup = case if isinstance(case, tuple) else (case, None)
+            result = OrderedDict([('case', name), ('size', int(size))])
+            result.update(measure(function, repeat=repeat, budget=budget, setup=setup))
+            results.append(result)
+            if verbose:
+                print('%-28s %10d %12.6f s' % (name, size, result['min']))
+
+    return OrderedDict([
+        ('commit', _commit()),
+        ('timestamp', time.strftime('%Y-%m-%dT%H:%M:%S')),
+        ('python', platform.python_version()),
+        ('numpy', np.__version__),
+        ('pandas', pd.__version__),
+        ('machine', platform.platform()),
+        ('results', results),
+    ])
+
+
+def save(report, path=None):
+    """
+    Store report as json, default path is results/<commit>-<timestamp>.json
+    """
+    if path is None:
+        if not os.path.isdir(RESULTS_DIR):
+            os.makedirs(RESULTS_DIR)
+        name = '%s-%s.json' % ((report['commit'] or 'unknown')[:10], report['timestamp'].replace(':', ''))
+        path = os.path.join(RESULTS_DIR, name)
+
+    with io.open(path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    return path
+
+
+def compare(base, new, threshold=.1):
+    """
+    Ratio of minimal times of new and base reports for cases measured in both
+
+    :param threshold: float, relative slowdown reported as regression
+    :return: list of tuples, (case, size, base time, new time, ratio, is regression)
+    """
+    base_times = dict(((r['case'], r['size']), r['min']) for r in base['results'])
+    rows = []
+    for r in new['results']:
+        key = (r['case'], r['size'])
+        if key in base_times:
+            ratio = r['min'] / base_times[key]
+            rows.append(key + (base_times[key], r['min'], ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks of pymeera')
+    parser.add_argument('--sizes', nargs='+', type=float, default=DEFAULT_SIZES)
+    parser.add_argument('--cases', nargs='+', choices=list(CASES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=10., help='seconds of repeats of one case')
+    parser.add_argument('--output', help='json file of results')
+    parser.add_argument('--compare', nargs=2, metavar=('BASE', 'NEW'), help='compare two json files of results')
+    parser.add_argument('--threshold', type=float, default=.1)
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with io.open(path, encoding='utf-8') as f:
+                reports.append(json.load(f))
+
+        rows = compare(reports[0], reports[1], threshold=args.threshold)
+        for case, size, base_time, new_time, ratio, regression in rows:
+            print('%-28s %10d %12.6f %12.6f %8.2fx%s' % (
+                case, size, base_time, new_time, ratio, '  REGRESSION' if regression else ''
+            ))
+        return 1 if any(row[-1] for row in rows) else 0
+
+    report = run(sizes=args.sizes, cases=args.cases, repeat=args.repeat, budget=args.budget)
+    print('Results are stored in %s' % (save(report, args.output), ))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -3,11 +3,32 @@ from __future__ import print_function, unicode_literals, division
 from copy import deepcopy
 from collections import OrderedDict
 
+import os
+import re
 import warnings
 
+import numpy as np
+
+from pymeera.utils.compact import compact_frame
+from pymeera.utils.index import VariableIndex
+from pymeera.utils import binary, loaders
+from pymeera.utils.binary import to_json_values
+from pymeera.utils.exprparser import split_filter
+from pymeera.utils.store import ColumnStore, write_store
+from pymeera.tools.crosstab import Crosstab
+from pymeera.tools.tablebook import TableBook
+from pymeera.tools.parallel import ParallelTableBook
+from pymeera.tools.weighting import rake
+from pymeera.tools.counting import CodeBook
+from pymeera.tools.recode import Recoder, make_step
+from pymeera.tools.reshape import grid, melt, pivot
+
 __author__ = 'norecces'
 __contact__ = 'https://github.com/norecces'
 
+# variable id with glob wildcards in expression
+_PATTERN = re.compile(r'[\w.]*[*?][\w.*?]*')
+
 
 class VariableStructure(object):
     __slots__ = ['variable_id', 'variable_type', 'variable_label', 'variable_children',
@@ -36,6 +57,58 @@ class VariableStructure(object):
     def __repr__(self):
         return '%s' % (self.variable_id, )
 
+    def to_dict(self):
+        """
+        Plain representation of variable, children are converted recursively
+
+        :return: dict, accepted by from_dict
+        """
+        return {
+            'variable_id': self.variable_id,
+            'variable_type': self.variable_type,
+            'variable_label': self.variable_label,
+            'variable_children': [
+                c.to_dict() if isinstance(c, VariableStructure) else c for c in self.variable_children
+            ],
+            'variable_survey_type': self.variable_survey_type,
+            'variable_values': list(self.variable_values.items())
+        }
+
+    @classmethod
+    def from_dict(cls, dct):
+        children = [
+            cls.from_dict(c) if isinstance(c, dict) else c for c in dct.get('variable_children') or []
+        ]
+        return cls(
+            variable_id=dct['variable_id'],
+            variable_type=dct.get('variable_type'),
+            variable_label=dct.get('variable_label', ''),
+            variable_children=children,
+            variable_survey_type=dct.get('variable_survey_type'),
+            variable_values=OrderedDict(dct.get('variable_values') or [])
+        )
+
+
+class _Pool(object):
+    """
+        Unique values in order of addition
+    """
+
+    def __init__(self):
+        self._positions = {}
+        self.keys = []
+        self.values = []
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, key, value=None):
+        if key not in self._positions:
+            self._positions[key] = len(self.keys)
+            self.keys.append(key)
+            self.values.append(value)
+        return self._positions[key]
+
 
 class SurveyStructure(object):
     """
@@ -47,9 +120,10 @@ class SurveyStructure(object):
         self._variables_list = OrderedDict()
         self.is_hierarchical = is_hierarchical
         self.multiple_choices_separator = multiple_choice_separator
+        self._index = VariableIndex(separator=multiple_choice_separator)
 
     def __contains__(self, key):
-        return key in self._variables_list.keys()
+        return key in self._variables_list
 
     @classmethod
     def from_list(cls, lst):
@@ -61,6 +135,103 @@ class SurveyStructure(object):
                 raise TypeError('item type %s is not instance of dict' % (type(item), ))
         return survey_structure
 
+    def to_list(self):
+        """
+        Plain representation of structure, e.g. to store it as json
+
+        :return: list of dicts, see VariableStructure.to_dict
+        """
+        return [variable.to_dict() for variable in self._variables_list.values()]
+
+    @classmethod
+    def from_dicts(cls, lst, is_hierarchical=False, multiple_choice_separator='_'):
+        """
+        Inverse of to_list
+        """
+        survey_structure = cls(is_hierarchical=is_hierarchical, multiple_choice_separator=multiple_choice_separator)
+        for item in lst:
+            survey_structure.add_variable(VariableStructure.from_dict(item))
+        return survey_structure
+
+    def save(self, path):
+        """
+        Write structure as binary file (see utils.binary)
+
+        Strings and sets of value labels are stored once in pools, e.g. the same scale of many questions,
+        fields of variables are int32 indexes of pools, children are flat array of references,
+        so loading parses only the pools.
+        """
+        strings, value_sets, variables = _Pool(), _Pool(), _Pool()
+        string = lambda value: -1 if value is None else strings.add(value)
+
+        def _add(variable):
+            return variables.add(id(variable), variable)
+
+        top = [_add(variable) for variable in self._variables_list.values()]
+
+        fields, offsets, children = [], [0], []
+        idx = 0
+        while idx < len(variables):
+            variable = variables.values[idx]
+            labels = tuple((key, string(label)) for key, label in variable.variable_values.items())
+            # 1 and 1.0 are equal keys, so type of value is part of key of pool
+            typed_labels = tuple((type(key).__name__, key, label) for key, label in labels)
+            fields.append([
+                string(variable.variable_id), string(variable.variable_type), string(variable.variable_label),
+                string(variable.variable_survey_type), value_sets.add(typed_labels, labels)
+            ])
+            for child in variable.variable_children:
+                # plain ids of children are negative references to strings
+                children.append(_add(child) if isinstance(child, VariableStructure) else -1 - string(child))
+            offsets.append(len(children))
+            idx += 1
+
+        binary.dump(path, 'structure', {
+            'is_hierarchical': self.is_hierarchical,
+            'multiple_choice_separator': self.multiple_choices_separator,
+            'strings': strings.keys,
+            'value_sets': [[to_json_values(pair) for pair in values] for values in value_sets.values],
+        }, {
+            'top': np.array(top, dtype=np.int32),
+            'fields': np.array(fields, dtype=np.int32).reshape(-1, 5),
+            'offsets': np.array(offsets, dtype=np.int64),
+            'children': np.array(children, dtype=np.int32),
+        })
+
+    @classmethod
+    def load(cls, path):
+        """
+        Read structure written by save
+        """
+        meta, arrays = binary.load(path, 'structure', mmap=False)
+
+        strings = meta['strings'] + [None]
+        value_sets = [[(key, strings[label]) for key, label in values] for values in meta['value_sets']]
+
+        variables = [
+            VariableStructure(
+                variable_id=strings[variable_id],
+                variable_type=strings[variable_type],
+                variable_label=strings[variable_label],
+                variable_survey_type=strings[survey_type],
+                variable_values=OrderedDict(value_sets[values])
+            )
+            for variable_id, variable_type, variable_label, survey_type, values in arrays['fields'].tolist()
+        ]
+
+        offsets, children = arrays['offsets'].tolist(), arrays['children'].tolist()
+        for idx, variable in enumerate(variables):
+            if offsets[idx] != offsets[idx + 1]:
+                variable.variable_children = [
+                    variables[c] if c >= 0 else strings[-1 - c] for c in children[offsets[idx]:offsets[idx + 1]]
+                ]
+
+        survey_structure = cls(is_hierarchical=meta['is_hierarchical'],
+                               multiple_choice_separator=meta['multiple_choice_separator'])
+        for idx in arrays['top'].tolist():
+            survey_structure.add_variable(variables[idx])
+        return survey_structure
+
     def add_variable(self, variable):
         if isinstance(variable, (dict, OrderedDict)):
             variable = VariableStructure(**variable)
@@ -74,6 +245,7 @@ class SurveyStructure(object):
             self.remove(variable.variable_id)
 
         self._variables_list[variable.variable_id] = variable
+        self._index.add(variable.variable_id)
 
     def get_variable_by_id(self, variable_id):
         return self._variables_list[variable_id]
@@ -83,6 +255,42 @@ class SurveyStructure(object):
 
     def remove(self, variable_id):
         self._variables_list.pop(variable_id)
+        self._index.remove(variable_id)
+
+    def children(self, question_id):
+        """
+        Variable ids of question by multiple choice separator, e.g. q12 -> q12_1, q12_2, ...
+        """
+        return self._index.children(question_id)
+
+    def with_prefix(self, prefix):
+        """
+        Variable ids that start with prefix
+        """
+        return self._index.prefix(prefix)
+
+    def select(self, pattern):
+        """
+        Variable ids matched by glob pattern, e.g. q1*_3 or q12_?
+        """
+        return self._index.match(pattern)
+
+    def expand(self, expression):
+        """
+        Replace glob patterns in expression by sum of matched variables,
+        filter clause is left as is, e.g. quoted value "a*b" is not a pattern
+
+        Example:
+            structure.expand('q1*_3 by q2') -> '(q1_3 + q10_3) by q2'
+        """
+        def _expand(match):
+            variables = self.select(match.group(0))
+            if not variables:
+                raise Exception('There are no variables matched by "%s"' % (match.group(0), ))
+            return '(%s)' % (' + '.join(variables), )
+
+        tables = split_filter(expression)[0]
+        return _PATTERN.sub(_expand, tables) + expression[len(tables):]
 
     def to_hierarchical(self, convert_exceptions=None):
         """
@@ -106,39 +314,34 @@ class SurveyStructure(object):
         if convert_exceptions and not isinstance(convert_exceptions, (list, set)):
             raise Exception('convert_exceptions must be iterable got instead %s' % (type(convert_exceptions),))
 
+        exceptions = set(convert_exceptions or [])
+
         # question_id is more powerful thing that may contains more than one variable
         # basic example – multiple choice question, which consist of number of variables - maximum
         # number of choices respondent could made in question
-        question_ids = []
-        for variable_id in self._variables_list:
-            if convert_exceptions:
-                if variable_id in convert_exceptions:
-                    # if variable is in exceptions than it is independent variable
-                    question_ids.append(variable_id)
-                    continue
-
-            question_ids.append(variable_id.split(self.multiple_choices_separator)[0])
-
         temp_structure = OrderedDict()
-
-        for variable_id_idx, question_id in enumerate(question_ids):
-            if question_id in temp_structure:
-                temp_structure[question_id].append(list(self._variables_list.values())[variable_id_idx])
+        for variable_id, variable in self._variables_list.items():
+            if variable_id in exceptions:
+                # if variable is in exceptions than it is independent variable
+                question_id = variable_id
             else:
-                temp_structure[question_id] = [list(self._variables_list.values())[variable_id_idx]]
+                question_id = variable_id.split(self.multiple_choices_separator)[0]
+            temp_structure.setdefault(question_id, []).append(variable)
 
-        new_survey_structure = SurveyStructure(is_hierarchical=True)
+        new_survey_structure = SurveyStructure(is_hierarchical=True,
+                                               multiple_choice_separator=self.multiple_choices_separator)
         for question_id in temp_structure:
 
             variable_structure = temp_structure[question_id][0]
 
+            # children are shared with plain structure, only containers of question are new
             question_structure = VariableStructure(
                 variable_id=question_id,
                 variable_type=variable_structure.variable_type,
                 variable_label=variable_structure.variable_label,
-                variable_children=deepcopy(variable_structure.variable_children),
+                variable_children=list(variable_structure.variable_children),
                 variable_survey_type=variable_structure.variable_survey_type,
-                variable_values=deepcopy(variable_structure.variable_values)
+                variable_values=OrderedDict(variable_structure.variable_values)
             )
 
             for variable in temp_structure[question_id]:
@@ -152,6 +355,29 @@ class SurveyStructure(object):
         return new_survey_structure
 
 
+def _projection(columns, expressions, weight=None, filter=None, structure=None):
+    """
+    Columns of file referenced by expressions, glob patterns are matched by variables of structure
+    or by columns of file
+
+    :param columns: list of variable ids of file
+    :return: list of variable ids, None if all columns are read
+    """
+    if expressions is None:
+        return None
+
+    if structure is None:
+        structure = SurveyStructure.from_list([{'variable_id': variable_id} for variable_id in columns])
+    variables = loaders.referenced_variables([structure.expand(e) for e in expressions], weight=weight,
+                                             filter=filter)
+
+    columns = set(columns)
+    missing = [variable_id for variable_id in variables if variable_id not in columns]
+    if missing:
+        raise Exception('Variables %s are not found in file' % (', '.join(missing), ))
+    return variables
+
+
 class SurveyData(object):
     """
         sd = SurveyData(data=pd.DataFrame, var_labs, val_labs)
@@ -171,15 +397,21 @@ class SurveyData(object):
                         show_sampling_error=True)
     """
 
-    def __init__(self, data, variable_labels=None, value_labels=None):
+    def __init__(self, data, variable_labels=None, value_labels=None, structure=None, compact=False):
         """
 
-        :param data: pd.DataFrame
+        :param data: pd.DataFrame or ColumnStore
         :param variable_labels: dict, {variable_id: variable_label}
         :param value_labels: nested dict, {variable_id: {value_id: value_label}}
+        :param structure: SurveyStructure
+        :param compact: bool, if True answers are stored as categorical with smallest integer codes,
+            value_labels and structure define categories (see utils.compact)
         :return: instance of SurveyData
         """
+        if compact:
+            data = compact_frame(data, value_labels=value_labels, structure=structure)
         self.data = data
+        self.structure = structure
 
         if variable_labels is not None:
             self._variable_labels = variable_labels
@@ -187,6 +419,109 @@ class SurveyData(object):
             self._value_labels = value_labels
 
         self.data_transformation_history = []
+        self._recoder = Recoder()
+
+    @property
+    def data(self):
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+        # fingerprints of columns shared by codebooks, derived variables are evaluated again only when they change
+        self._fingerprints = {}
+
+    def __setitem__(self, variable_id, values):
+        """
+        Assign column of data. Columns must be changed by assignment to survey data, not to its data,
+        otherwise cached derived variables of recode are not evaluated again
+
+            sd['q5'] = sd.data['q5'].replace(1, 5)
+        """
+        self._data[variable_id] = values
+        self._fingerprints.pop(variable_id, None)
+
+    @classmethod
+    def open(cls, path):
+        """
+        Open survey data written by save, columns are memory mapped and loaded
+        only when crosstab or other operation references them
+
+        :param path: str, directory of column store
+        :return: instance of SurveyData
+        """
+        store = ColumnStore(path)
+
+        structure = None
+        if store.meta['structure'] is not None:
+            structure = SurveyStructure.load(os.path.join(path, store.meta['structure']))
+
+        variable_labels, value_labels = store.labels()
+        return cls(store, variable_labels=variable_labels, value_labels=value_labels, structure=structure)
+
+    @classmethod
+    def read_csv(cls, path, expressions=None, weight=None, filter=None, variable_labels=None, value_labels=None,
+                 structure=None, compact=True, chunksize=loaders.CHUNK_SIZE, **kwargs):
+        """
+        Load csv file, only variables referenced by expressions are read
+
+            sd = SurveyData.read_csv('wave3.csv', expressions=['q1 by q2 + q3', 'q5_* by q2'], weight='w')
+
+        :param path: str
+        :param expressions: list of str, expressions of tables to be counted, default is all columns
+        :param weight: str, id of weight variable
+        :param filter: str, filter of tables, its variables are read too
+        :param variable_labels: dict, {variable_id: variable_label}, labels of read variables are kept
+        :param value_labels: nested dict, {variable_id: {value_id: value_label}}
+        :param structure: SurveyStructure, default is structure of read variables described by labels
+        :param compact: bool, see SurveyData
+        :param chunksize: int, rows converted at once
+        :param kwargs: pd.read_csv arguments, e.g. sep or encoding
+        :return: instance of SurveyData
+        """
+        variables = _projection(loaders.csv_columns(path, **kwargs), expressions, weight, filter, structure)
+        data = loaders.read_csv(path, variables=variables, chunksize=chunksize, **kwargs)
+        return cls._loaded(data, variable_labels, value_labels, structure, compact)
+
+    @classmethod
+    def read_sav(cls, path, expressions=None, weight=None, filter=None, structure=None, compact=True,
+                 chunksize=loaders.CHUNK_SIZE):
+        """
+        Load SPSS file with variable and value labels, only variables referenced by expressions are read,
+        requires pyreadstat
+
+        :param path: str
+        :param expressions: list of str, expressions of tables to be counted, default is all columns
+        :param weight: str, id of weight variable
+        :param filter: str, filter of tables, its variables are read too
+        :param structure: SurveyStructure, default is structure of read variables described by labels
+        :param compact: bool, see SurveyData
+        :param chunksize: int, rows converted at once
+        :return: instance of SurveyData
+        """
+        variables = _projection(loaders.sav_columns(path), expressions, weight, filter, structure)
+        data, variable_labels, value_labels = loaders.read_sav(path, variables=variables, chunksize=chunksize)
+        return cls._loaded(data, variable_labels, value_labels, structure, compact)
+
+    @classmethod
+    def _loaded(cls, data, variable_labels, value_labels, structure, compact):
+        variables = list(data.columns)
+        if variable_labels is not None:
+            variable_labels = dict((k, v) for k, v in variable_labels.items() if k in data)
+        if value_labels is not None:
+            value_labels = dict((k, v) for k, v in value_labels.items() if k in data)
+        if structure is None:
+            structure = SurveyStructure.from_list(loaders.structure_items(variables, variable_labels, value_labels))
+        return cls(data, variable_labels=variable_labels, value_labels=value_labels, structure=structure,
+                   compact=compact)
+
+    def save(self, path):
+        """
+        Write survey data as columnar store, see utils.store.write_store
+        """
+        data = self.data.to_frame() if isinstance(self.data, ColumnStore) else self.data
+        write_store(path, data, variable_labels=getattr(self, '_variable_labels', None),
+                    value_labels=getattr(self, '_value_labels', None), structure=self.structure)
 
     @property
     def variable_labels(self):
@@ -214,21 +549,140 @@ class SurveyData(object):
         raise NotImplementedError
 
     def cross(self, expression=None, **kwargs):
-        raise NotImplementedError
+        """
+        Crosstab of survey data
+
+        :param expression: str, expression of table, e.g. 'q1 by q2 + q3>q4',
+            or list of expressions for batch of tables
+        :param kwargs: Crosstab arguments, banner and stubs for batch of tables
+        :return: Crosstab for single expression,
+            generator of Crosstabs for list of expressions or banner with stubs
+
+        Batch of tables shares factorized variables and banner bases (see TableBook):
+            tables = sd.cross(banner='q2 + q3>q4', stubs=['q1', 'q5'], weight='w')
+        Batch is evaluated by pool of processes if number of workers is set (see ParallelTableBook):
+            tables = sd.cross(expressions, workers=8, chunksize=16)
+        Glob patterns are expanded by variables of structure (see SurveyStructure.expand):
+            table = sd.cross('q1*_3 by q2')
+        """
+        if self.structure is not None:
+            # glob patterns of variables, e.g. 'q1*_3 by q2'
+            if isinstance(expression, (list, tuple)):
+                expression = [self.structure.expand(e) for e in expression]
+            elif expression is not None:
+                expression = self.structure.expand(expression)
+            if kwargs.get('banner') is not None:
+                kwargs['banner'] = self.structure.expand(kwargs['banner'])
+            if kwargs.get('stubs') is not None:
+                kwargs['stubs'] = [self.structure.expand(stub) for stub in kwargs['stubs']]
+
+        data = self.data if kwargs.get('engine') == 'pandas' else self.codebook()
+
+        if 'workers' in kwargs:
+            return iter(ParallelTableBook(data, expressions=expression, **kwargs))
+        if isinstance(expression, (list, tuple)) or 'stubs' in kwargs:
+            return iter(TableBook(data, expressions=expression, **kwargs))
+        return Crosstab(data, expression=expression, **kwargs)
+
+    def codebook(self):
+        """
+        New CodeBook of data that resolves derived variables defined by recode
+        """
+        return CodeBook(self.data, recoder=self._recoder, fingerprints=self._fingerprints)
 
-    def melt(self, **kwargs):
-        raise NotImplementedError
+    def rake(self, targets, weight_id='weight', **kwargs):
+        """
+        Rim weighting to target marginal distributions, see tools.weighting.rake
+
+        :param targets: dict, {variable_id: {value: target share or count}}
+        :param weight_id: str, variable to store weights, it can be used as Crosstab weight
+        :param kwargs: rake arguments: weight (base weight variable), tolerance, max_iterations, trim
+        :return: RakingResult
+        """
+        result = rake(self.data, targets, **kwargs)
+        self[weight_id] = result.weights
+        return result
+
+    def melt(self, questions=None, id_vars=None, **kwargs):
+        """
+        Variables to cases: children of loop and grid questions become cases of respondent, see tools.reshape.melt
+
+        :param questions: list of question ids of hierarchical structure, default is all questions with several children
+        :param id_vars: list of variables repeated for every case, e.g. weight
+        :param kwargs: respondent_id, case_id
+        :return: SurveyData in long layout, question gets value labels of its children
+
+        Example:
+            long = sd.melt(questions=['q1', 'q2'], id_vars=['w'])
+            long.cross('q1 by q2', weight='w')
+        """
+        if self.structure is None:
+            raise Exception('Structure must be defined to melt survey data')
+
+        data = melt(self.data, self.structure, questions=questions, id_vars=id_vars, **kwargs)
+
+        variable_labels = getattr(self, '_variable_labels', None)
+        value_labels = None
+        if getattr(self, '_value_labels', None) is not None:
+            children, _ = grid(self.structure, questions)
+            value_labels = dict((v, self._value_labels[v]) for v in id_vars or [] if v in self._value_labels)
+            for question_id, question_cases in children.items():
+                value_labels[question_id] = {}
+                for variable_id in question_cases.values():
+                    value_labels[question_id].update(self._value_labels.get(variable_id, {}))
+
+        return SurveyData(data, variable_labels=variable_labels, value_labels=value_labels)
 
     def vars_to_cases(self, **kwargs):
         return self.melt(**kwargs)
 
-    def pivot(self, **kwargs):
-        raise NotImplementedError
+    def pivot(self, questions=None, id_vars=None, **kwargs):
+        """
+        Cases to variables: inverse of melt, see tools.reshape.pivot
+
+        :param questions: list of columns to spread, default is all except respondent, case and id_vars
+        :param id_vars: list of variables constant for respondent
+        :param kwargs: respondent_id, case_id, separator (default is separator of structure)
+        :return: SurveyData in wide layout
+        """
+        if self.structure is not None:
+            kwargs.setdefault('separator', self.structure.multiple_choices_separator)
+        data = pivot(self.data, questions=questions, id_vars=id_vars, **kwargs)
+        return SurveyData(data, variable_labels=getattr(self, '_variable_labels', None))
 
     def cases_to_vars(self, **kwargs):
         return self.pivot(**kwargs)
 
-    def recode(self, **kwargs):
-        raise NotImplementedError
+    def recode(self, step=None, **kwargs):
+        """
+        Define derived variable. It is recorded in data_transformation_history and evaluated lazily
+        on integer codes only when crosstab references it, see tools.recode.
+        Result is cached until any of its inputs is assigned, see __setitem__
+
+        :param step: RecodeStep, e.g. ValueMap, RangeBins, Net, Computed
+        :param kwargs: arguments of make_step, if step is not defined
+        :return: RecodeStep
+
+        Example:
+            sd.recode(variable_id='age_group', source='age', edges=[18, 35, 55, 100])
+            sd.recode(variable_id='top2', source='q5', mapping={4: 1, 5: 1}, keep_unmapped=False)
+            sd.recode(variable_id='any_brand', sources=['q1_1', 'q1_2', 'q1_3'])
+            sd.cross('top2 + any_brand by age_group')
+        """
+        if step is None:
+            step = make_step(**kwargs)
+
+        self._recoder.add(step)
+        self.data_transformation_history.append(step)
+        return step
+
+    def replay(self, history):
+        """
+        Apply recode steps of other survey data, e.g. new wave of tracker
+
+        :param history: list of RecodeStep, data_transformation_history of other SurveyData
+        """
+        for step in history:
+            self.recode(step)
 
 
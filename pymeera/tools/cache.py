@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import hashlib
+import json
+import os
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from pymeera.utils.exprparser import CacheInfo, filter_text, filter_variables
+from pymeera.tools.counting import CrossCounts
+
+# version of keys, it is changed when counting changes, so old entries are never hit
+KEY_VERSION = 1
+ENTRY_SUFFIX = '.counts'
+LOCK_FILE = '.lock'
+
+
+class ResultCache(object):
+    """
+        Persistent cache of count tensors of crosstabs shared by processes and runs.
+
+        Entry is addressed by content: fingerprints of referenced variables and weight,
+        normalized rows, columns and filter of expression and options that change counts.
+        Entries are written atomically, so readers never see partial files.
+        Eviction of least recently used entries keeps total size under max_size,
+        it is serialized between processes by lock file.
+
+        cache = ResultCache('/var/cache/pymeera', max_size=2 ** 30)
+        table = sd.cross('q1 by q2', weight='w', cache=cache)
+        cache.info()
+    """
+
+    def __init__(self, path, max_size=2 ** 30):
+        """
+
+        :param path: str, directory of entries, is created if not exists
+        :param max_size: int, maximum total size of entries in bytes
+        """
+        if not os.path.isdir(path):
+            os.makedirs(path, exist_ok=True)
+
+        self.path = path
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, codebook, rows, columns, weight=None, condition=None, **options):
+        """
+        :param codebook: CodeBook of data
+        :param rows: list of row groups
+        :param columns: list of column groups
+        :param weight: str, weight variable
+        :param condition: filter condition, see Expression.parse_filter
+        :param options: json serializable options that change counts
+        :return: str, hex digest
+        """
+        variables = set(v for group in rows + columns for v in group) | ({weight} if weight else set())
+        variables = sorted(variables.union(filter_variables(condition)))
+        content = [KEY_VERSION, rows, columns, weight, sorted(options.items())]
+        if condition is not None:
+            # keys of tables without filter are the same as before filters were introduced
+            content.append(filter_text(condition))
+        content.append([(v, codebook.fingerprint(v)) for v in variables])
+        content = json.dumps(content, ensure_ascii=False)
+        return hashlib.blake2b(content.encode('utf-8'), digest_size=20).hexdigest()
+
+    def _entry(self, key):
+        return os.path.join(self.path, key + ENTRY_SUFFIX)
+
+    @contextmanager
+    def _lock(self):
+        with open(os.path.join(self.path, LOCK_FILE), 'a') as f:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_UN)
+
+    def get(self, key):
+        """
+        :return: CrossCounts or None
+        """
+        entry = self._entry(key)
+        try:
+            counts, _ = CrossCounts.load(entry)
+        except FileNotFoundError:
+            # absent or evicted by other process
+            self.misses += 1
+            return None
+        except Exception:
+            # corrupt, truncated or written by other version, it is counted again
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+            self.misses += 1
+            return None
+
+        try:
+            # access time of entry is its recency for eviction
+            os.utime(entry)
+        except OSError:
+            pass
+
+        self.hits += 1
+        return counts
+
+    def put(self, key, counts):
+        """
+        :param key: str, see key
+        :param counts: CrossCounts
+        """
+        counts.save(self._entry(key))
+        with self._lock():
+            self._evict()
+
+    def _entries(self):
+        entries = []
+        for item in os.scandir(self.path):
+            if item.name.endswith(ENTRY_SUFFIX):
+                try:
+                    stat = item.stat()
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, item.path))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        size = sum(e[1] for e in entries)
+        for _, entry_size, entry in entries:
+            if size <= self.max_size:
+                break
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
+            size -= entry_size
+
+    def info(self):
+        """
+        :return: CacheInfo, hits and misses of this process, currsize is total size of entries in bytes
+        """
+        return CacheInfo(self.hits, self.misses, self.max_size, sum(e[1] for e in self._entries()))
+
+    def clear(self):
+        with self._lock():
+            for _, _, entry in self._entries():
+                try:
+                    os.remove(entry)
+                except OSError:
+                    pass
+        self.hits = 0
+        self.misses = 0
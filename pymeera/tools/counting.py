@@ -0,0 +1,902 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import numpy as np
+import pandas as pd
+
+from pymeera.utils import binary
+from pymeera.utils.binary import to_json_values
+from pymeera.utils.support import flatten, fingerprint
+from pymeera.utils.exprparser import filter_text, filter_variables
+from pymeera.tools.profiling import stage
+
+# nested group is coded by its observed combinations only (see CodeBook.observed_group)
+# and block of (row group, column group) stores only its observed cells (see SparseBlock)
+# if its code space has at least SPARSE_MIN_SIZE cells and respondents can fill less than SPARSE_DENSITY of them,
+# so counts grow with number of respondents, not with product of numbers of values
+SPARSE_MIN_SIZE = 2 ** 16
+SPARSE_DENSITY = .25
+
+
+class Factor(object):
+    """
+        Variable encoded as integer codes into sorted array of its unique values.
+        Missing answers are encoded as -1.
+    """
+    __slots__ = ['variable_id', 'codes', 'uniques']
+
+    def __init__(self, variable_id, codes, uniques):
+        self.variable_id = variable_id
+        self.codes = codes
+        self.uniques = uniques
+
+    def __len__(self):
+        return len(self.uniques)
+
+    def __repr__(self):
+        return 'Factor(%s, %d values)' % (self.variable_id, len(self.uniques))
+
+
+def factorize(variable_id, values):
+    """
+    Encode values of variable into integer codes
+
+    :param variable_id: str
+    :param values: pd.Series or array-like
+    :return: Factor
+    """
+    if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        # compact storage already holds codes (-1 is missing), they are used as is
+        return Factor(variable_id, np.asarray(values.cat.codes), np.asarray(values.cat.categories))
+
+    codes, uniques = pd.factorize(values, sort=True)
+    return Factor(variable_id, codes, np.asarray(uniques))
+
+
+_COMPARISONS = {
+    '=': np.equal, '!=': np.not_equal, '<': np.less, '<=': np.less_equal, '>': np.greater, '>=': np.greater_equal
+}
+
+
+def _matched_values(condition, uniques):
+    operator, value = condition[0], condition[2]
+    if operator == 'in':
+        return pd.Index(uniques).isin(value)
+    try:
+        return np.asarray(_COMPARISONS[operator](uniques, value), dtype=bool)
+    except TypeError:
+        raise Exception('Values of "%s" can not be compared with %r' % (condition[1], value))
+
+
+def compile_filter(condition, factor):
+    """
+    Mask of respondents who satisfy filter condition. Comparison is evaluated once per unique value
+    of variable and is spread to respondents by their codes, missing answers never match.
+
+    :param condition: tree of lists, see Expression.parse_filter
+    :param factor: callable, returns Factor of variable_id
+    :return: np.array of bool
+    """
+    operator = condition[0]
+    if operator == 'and':
+        return np.logical_and.reduce([compile_filter(c, factor) for c in condition[1:]])
+    if operator == 'or':
+        return np.logical_or.reduce([compile_filter(c, factor) for c in condition[1:]])
+    if operator == 'not':
+        return ~compile_filter(condition[1], factor)
+
+    variable = factor(condition[1])
+    # the last item is matched by code -1 of missing answer
+    matched = np.append(_matched_values(condition, variable.uniques), False)
+    return matched[variable.codes]
+
+
+def combine_codes(factors):
+    """
+    Combine codes of several variables into one flat code of their cartesian product
+    (row-major order, the same as np.ravel_multi_index)
+
+    :param factors: list of Factor
+    :return: tuple, (codes, shape), codes is -1 if any of variables is missing
+    """
+    shape = tuple(len(f) for f in factors)
+
+    codes = factors[0].codes.astype(np.int64)
+    valid = codes >= 0
+    for factor in factors[1:]:
+        codes *= len(factor)
+        codes += factor.codes
+        valid &= factor.codes >= 0
+
+    codes[~valid] = -1
+    return codes, shape
+
+
+class CodeBook(object):
+    """
+        Lazy cache of factorized variables of a data frame.
+        Every variable is factorized at most once, whatever number of groups and tables references it.
+        Combined codes of variable groups and column bases are cached too,
+        so tables sharing a banner reuse its work.
+    """
+
+    def __init__(self, data, recoder=None, fingerprints=None):
+        """
+
+        :param data: pd.DataFrame
+        :param recoder: Recoder, derived variables evaluated on demand (see tools.recode)
+        :param fingerprints: dict, fingerprints of columns of data shared by codebooks of the same data
+            (see SurveyData), owner of data clears it when columns change
+        :return: instance of CodeBook
+        """
+        self.data = data
+        self.recoder = recoder
+        self._factors = {}
+        self._groups = {}
+        self._observed = {}
+        self._weights = {}
+        self._answered = {}
+        self._bases = {}
+        self._masks = {}
+        self._fingerprints = {}
+        self._data_fingerprints = {} if fingerprints is None else fingerprints
+
+    def __len__(self):
+        return len(self.data)
+
+    @property
+    def columns(self):
+        if self.recoder is None:
+            return self.data.columns
+        return self.data.columns.append(pd.Index(self.recoder.variables, dtype=object))
+
+    def factor(self, variable_id):
+        if variable_id not in self._factors and self.recoder is not None and variable_id in self.recoder:
+            self._factors[variable_id] = self.recoder.factor(variable_id, self)
+
+        if variable_id not in self._factors:
+            # column store (see utils.store) gives codes of categorical variables without loading them
+            stored = self.data.codes(variable_id) if hasattr(self.data, 'codes') else None
+            if stored is not None:
+                self._factors[variable_id] = Factor(variable_id, *stored)
+            else:
+                self._factors[variable_id] = factorize(variable_id, self.data[variable_id])
+        return self._factors[variable_id]
+
+    def fingerprint(self, variable_id):
+        """
+        Content hash of variable, see support.fingerprint
+
+        :return: str
+        """
+        if variable_id not in self._fingerprints:
+            if self.recoder is not None and variable_id in self.recoder:
+                self._fingerprints[variable_id] = self.recoder.fingerprint(variable_id, self)
+            else:
+                if variable_id not in self._data_fingerprints:
+                    self._data_fingerprints[variable_id] = fingerprint(self.data[variable_id])
+                self._fingerprints[variable_id] = self._data_fingerprints[variable_id]
+        return self._fingerprints[variable_id]
+
+    def group(self, variables):
+        """
+        Combined codes of group of variables
+
+        :param variables: list of variable_ids
+        :return: tuple, (codes, shape)
+        """
+        key = tuple(variables)
+        if key not in self._groups:
+            self._groups[key] = combine_codes([self.factor(v) for v in key])
+        return self._groups[key]
+
+    def observed_group(self, variables):
+        """
+        Codes of group of variables in space of its observed combinations,
+        e.g. of deeply nested columns whose cartesian product is mostly empty
+
+        :param variables: list of variable_ids
+        :return: tuple, (codes, keys), codes are positions in keys or -1,
+            keys are sorted flat codes of observed combinations (see combine_codes)
+        """
+        key = tuple(variables)
+        if key not in self._observed:
+            codes, _ = self.group(key)
+            valid = codes >= 0
+            keys, positions = np.unique(codes[valid], return_inverse=True)
+            observed_codes = np.full(len(codes), -1, dtype=np.int64)
+            observed_codes[valid] = positions
+            self._observed[key] = (observed_codes, keys)
+        return self._observed[key]
+
+    def mask(self, condition):
+        """
+        Mask of respondents who satisfy filter condition, cached by its normalized text,
+        so tables of a book with the same filter share one mask
+
+        :param condition: tree of lists, see Expression.parse_filter
+        :return: np.array of bool
+        """
+        key = filter_text(condition)
+        if key not in self._masks:
+            self._masks[key] = (frozenset(filter_variables(condition)), compile_filter(condition, self.factor))
+        return self._masks[key][1]
+
+    def weights(self, variable_id=None):
+        """
+        :param variable_id: str, weight variable, if None all weights are equal to 1
+        :return: np.array of float or None
+        """
+        if variable_id is None:
+            return None
+        if variable_id not in self._weights:
+            self._weights[variable_id] = np.nan_to_num(np.asarray(self.data[variable_id], dtype=np.float64))
+        return self._weights[variable_id]
+
+    def answered(self, variables):
+        """
+        Mask of respondents who have at least one answer in variables,
+        e.g. base of checkbox question that is stored as several variables
+
+        :param variables: list of variable_ids
+        :return: np.array of bool
+        """
+        key = frozenset(variables)
+        if key not in self._answered:
+            mask = np.zeros(len(self), dtype=bool)
+            for variable_id in key:
+                mask |= self.factor(variable_id).codes >= 0
+            self._answered[key] = mask
+        return self._answered[key]
+
+    def base(self, variables, column_group, weight=None, sparse=False, condition=None):
+        """
+        Weighted number of respondents who answered at least one of variables
+        in every cell of column group
+
+        :param variables: list of variable_ids (rows of crosstab)
+        :param column_group: list of variable_ids
+        :param weight: str, weight variable
+        :param sparse: bool, count observed combinations of column group, see observed_group
+        :param condition: filter condition, see mask
+        :return: tuple of 1-dimensional arrays, (weighted counts, number of observations)
+        """
+        key = (frozenset(variables), tuple(column_group), weight, sparse,
+               None if condition is None else (filter_text(condition), frozenset(filter_variables(condition))))
+        if key not in self._bases:
+            if sparse:
+                codes, keys = self.observed_group(column_group)
+                size = len(keys)
+            else:
+                codes, shape = self.group(column_group)
+                size = int(np.prod(shape))
+            in_base = self.answered(variables)
+            if condition is not None:
+                in_base = in_base & self.mask(condition)
+            self._bases[key] = count_codes(np.where(in_base, codes, -1), size, self.weights(weight))
+        return self._bases[key]
+
+    def drop(self, variables):
+        """
+        Forget cached codes of variables and everything derived from them
+        """
+        variables = set(variables)
+        for variable_id in variables:
+            self._factors.pop(variable_id, None)
+            self._weights.pop(variable_id, None)
+            self._fingerprints.pop(variable_id, None)
+        self._drop_derived(variables)
+
+    def _drop_derived(self, variables):
+        for key in [k for k in self._groups if variables.intersection(k)]:
+            del self._groups[key]
+        for key in [k for k in self._observed if variables.intersection(k)]:
+            del self._observed[key]
+        for key in [k for k in self._answered if variables.intersection(k)]:
+            del self._answered[key]
+        for key in [k for k in self._bases if variables.intersection(k[0]) or variables.intersection(k[1])
+                    or (k[4] is not None and variables.intersection(k[4][1]))]:
+            del self._bases[key]
+        for key in [k for k, (mask_variables, _) in self._masks.items() if variables.intersection(mask_variables)]:
+            del self._masks[key]
+
+
+def count_codes(codes, size, weights=None):
+    """
+    Weighted counts of codes with single np.bincount pass, negative codes are skipped
+
+    :return: tuple of 1-dimensional arrays, (weighted counts, number of observations)
+    """
+    valid = codes >= 0
+    observed = np.bincount(codes[valid], minlength=size)
+    if weights is None:
+        counts = observed.astype(np.float64)
+    else:
+        # bincount of empty codes is integer even with weights
+        counts = np.bincount(codes[valid], weights=weights[valid], minlength=size).astype(np.float64, copy=False)
+    return counts, observed
+
+
+def count_block(row_codes, row_size, column_codes, column_size, weights=None, mask=None):
+    """
+    Weighted counts of every (row, column) cell
+
+    :param mask: np.array of bool, respondents who are counted, default is all
+    :return: tuple of 2-dimensional arrays, (weighted counts, number of observations)
+    """
+    valid = (row_codes >= 0) & (column_codes >= 0)
+    if mask is not None:
+        valid &= mask
+    cells = np.where(valid, row_codes * column_size + column_codes, -1)
+    counts, observed = count_codes(cells, row_size * column_size, weights)
+    return counts.reshape(row_size, column_size), observed.reshape(row_size, column_size)
+
+
+def count_sparse_block(row_codes, row_size, column_codes, column_size, weights=None, mask=None):
+    """
+    Weighted counts of observed (row, column) cells only, memory is defined by number of respondents,
+    not by number of cells of block
+
+    :param mask: np.array of bool, respondents who are counted, default is all
+    :return: tuple of SparseBlock, (weighted counts, number of observations)
+    """
+    valid = (row_codes >= 0) & (column_codes >= 0)
+    if mask is not None:
+        valid &= mask
+    cells = row_codes[valid].astype(np.int64) * column_size + column_codes[valid]
+    keys, positions = np.unique(cells, return_inverse=True)
+
+    observed = np.bincount(positions, minlength=len(keys))
+    if weights is None:
+        counts = observed.astype(np.float64)
+    else:
+        counts = np.bincount(positions, weights=weights[valid], minlength=len(keys)).astype(np.float64, copy=False)
+
+    shape = (row_size, column_size)
+    return SparseBlock(shape, keys, counts), SparseBlock(shape, keys, observed)
+
+
+class SparseBlock(object):
+    """
+        Block of counts in coordinate format: flat codes of its observed cells
+        (row code * number of columns + column code) in ascending order and their values.
+        It is expanded to dense array only for selected rows and columns, e.g. observed ones when table is rendered.
+    """
+
+    def __init__(self, shape, keys, values):
+        """
+
+        :param shape: tuple, (number of row codes, number of column codes)
+        :param keys: sorted np.array of int64 flat codes of cells
+        :param values: np.array of values of cells
+        :return: instance of SparseBlock
+        """
+        self.shape = tuple(shape)
+        self.keys = keys
+        self.values = values
+
+    def coordinates(self):
+        """
+        :return: tuple of np.arrays, (row codes, column codes) of stored cells
+        """
+        return np.divmod(self.keys, self.shape[1])
+
+    def take(self, rows, columns):
+        """
+        Dense block of rows and columns, cells that are not stored are 0
+
+        :param rows: np.array of unique row codes
+        :param columns: np.array of unique column codes
+        :return: 2-dimensional np.array
+        """
+        row_codes, column_codes = self.coordinates()
+        row_positions = pd.Index(rows).get_indexer(row_codes)
+        column_positions = pd.Index(columns).get_indexer(column_codes)
+        stored = (row_positions >= 0) & (column_positions >= 0)
+
+        block = np.zeros((len(rows), len(columns)), dtype=self.values.dtype)
+        block[row_positions[stored], column_positions[stored]] = self.values[stored]
+        return block
+
+    def sum(self, axis=0):
+        """
+        Sums of columns (axis 0) or rows (axis 1) as of dense block
+        """
+        codes = self.coordinates()[1 - axis]
+        sums = np.bincount(codes, weights=self.values, minlength=self.shape[1 - axis])
+        return sums.astype(self.values.dtype, copy=False)
+
+    def toarray(self):
+        block = np.zeros(self.shape[0] * self.shape[1], dtype=self.values.dtype)
+        block[self.keys] = self.values
+        return block.reshape(self.shape)
+
+    def move(self, row_map, column_map, shape):
+        """
+        The same block in other code space
+
+        :param row_map: np.array, new code of every row code
+        :param column_map: np.array, new code of every column code
+        :param shape: tuple, new shape
+        :return: SparseBlock
+        """
+        row_codes, column_codes = self.coordinates()
+        keys = row_map[row_codes] * np.int64(shape[1]) + column_map[column_codes]
+        order = np.argsort(keys, kind='stable')
+        return SparseBlock(shape, keys[order], self.values[order])
+
+    @classmethod
+    def from_dense(cls, block, stored):
+        """
+        :param block: 2-dimensional np.array
+        :param stored: 2-dimensional np.array of bool, cells to be stored
+        :return: SparseBlock
+        """
+        keys = np.flatnonzero(stored).astype(np.int64)
+        return cls(block.shape, keys, np.ravel(block)[keys])
+
+    def combine(self, other, sign):
+        """
+        Sum of blocks in the same code space, other is multiplied by sign
+        """
+        keys = np.union1d(self.keys, other.keys)
+        values = np.zeros(len(keys), dtype=np.result_type(self.values, other.values))
+        values[np.searchsorted(keys, self.keys)] += self.values
+        values[np.searchsorted(keys, other.keys)] += sign * other.values
+        return SparseBlock(self.shape, keys, values)
+
+
+class CrossCounts(object):
+    """
+        Count tensor of a crosstab: weighted counts of every (row_group, column_group)
+        pair and bases of every column group in factorized code space.
+
+        Code space of sparse group is the list of its observed combinations (keys),
+        cartesian product of values is used only to label them.
+        Sparse block stores only its observed cells (see SparseBlock), so counts of deeply nested rows
+        by deeply nested columns hold at most one cell per respondent.
+    """
+
+    def __init__(self, rows, columns, levels, cells, observed, base, base_observed, squares, keys=None):
+        """
+
+        :param rows: list of row groups (lists of variable_ids)
+        :param columns: list of column groups
+        :param levels: dict, {variable_id: np.array of unique values}
+        :param cells: dict, {(row_group_idx, column_group_idx): 2-dimensional np.array or SparseBlock}
+        :param observed: dict, same as cells but with unweighted number of observations
+        :param base: dict, {column_group_idx: 1-dimensional np.array}
+        :param base_observed: dict, same as base but unweighted
+        :param squares: dict, {(row_group_idx, column_group_idx): 1-dimensional np.array},
+            sum of squared weights of respondents counted in every column of block,
+            it defines effective base of weighted statistics
+        :param keys: dict, {tuple of variable_ids: sorted np.array of flat codes}, observed combinations of sparse groups
+        """
+        self.rows = rows
+        self.columns = columns
+        self.levels = levels
+        self.cells = cells
+        self.observed = observed
+        self.base = base
+        self.base_observed = base_observed
+        self.squares = squares
+        self.keys = keys or {}
+
+    def shape(self, group):
+        return tuple(len(self.levels[v]) for v in group)
+
+    def size(self, group):
+        """
+        Number of codes of group in count tensor
+        """
+        if tuple(group) in self.keys:
+            return len(self.keys[tuple(group)])
+        return int(np.prod(self.shape(group)))
+
+    def flat(self, group, codes):
+        """
+        Flat codes of cartesian product of group (see combine_codes) for codes of count tensor
+        """
+        if tuple(group) in self.keys:
+            return self.keys[tuple(group)][codes]
+        return codes
+
+    def values(self, group, flat_codes):
+        """
+        Values of variables in group for flat (combined) codes
+
+        :return: list of np.arrays, one per variable in group
+        """
+        codes = np.unravel_index(flat_codes, self.shape(group))
+        return [self.levels[v][c] for v, c in zip(group, codes)]
+
+    def labels(self, group, codes):
+        """
+        Values of variables in group for codes of count tensor
+
+        :return: list of np.arrays, one per variable in group
+        """
+        return self.values(group, self.flat(group, codes))
+
+    def block(self, row_group_idx, column_group_idx, row_codes, column_codes, observed=False):
+        """
+        Dense part of block of rows and columns, sparse block is expanded only for them
+
+        :param row_codes: np.array of unique codes of row group in count tensor
+        :param column_codes: np.array of unique codes of column group
+        :param observed: bool, number of observations instead of weighted counts
+        :return: 2-dimensional np.array
+        """
+        block = (self.observed if observed else self.cells)[row_group_idx, column_group_idx]
+        if isinstance(block, SparseBlock):
+            return block.take(row_codes, column_codes)
+        return block[np.ix_(row_codes, column_codes)]
+
+    def observed_rows(self, row_group_idx, column_group_idx):
+        """
+        :return: np.array of bool, codes of row group observed in block
+        """
+        block = self.observed[row_group_idx, column_group_idx]
+        if not isinstance(block, SparseBlock):
+            return block.any(axis=1)
+
+        rows = np.zeros(block.shape[0], dtype=bool)
+        rows[block.coordinates()[0][block.values != 0]] = True
+        return rows
+
+    def dense(self, row_group_idx, column_group_idx):
+        """
+        Weighted counts of block in code space of cartesian products of its groups
+
+        :return: 2-dimensional np.array
+        """
+        row_group, column_group = self.rows[row_group_idx], self.columns[column_group_idx]
+        block = self.cells[row_group_idx, column_group_idx]
+        if isinstance(block, SparseBlock):
+            block = block.toarray()
+        if tuple(row_group) not in self.keys and tuple(column_group) not in self.keys:
+            return block
+
+        dense = np.zeros((int(np.prod(self.shape(row_group))), int(np.prod(self.shape(column_group)))))
+        dense[np.ix_(self.flat(row_group, np.arange(block.shape[0])),
+                     self.flat(column_group, np.arange(block.shape[1])))] = block
+        return dense
+
+    def _remap(self, levels, maps, keys):
+        """
+        The same counts in other code space
+
+        :param maps: dict, {tuple of variable_ids: (new codes of current codes, number of new codes)}
+        :param keys: dict, keys of sparse groups in new code space
+        :return: CrossCounts
+        """
+        def _move(array, groups):
+            if isinstance(array, SparseBlock):
+                (row_map, rows), (column_map, columns) = [maps[tuple(g)] for g in groups]
+                return array.move(row_map, column_map, (rows, columns))
+            moved = np.zeros(tuple(maps[tuple(g)][1] for g in groups), dtype=array.dtype)
+            moved[np.ix_(*[maps[tuple(g)][0] for g in groups])] = array
+            return moved
+
+        cells, observed, squares = {}, {}, {}
+        for (i, j), block in self.cells.items():
+            groups = (self.rows[i], self.columns[j])
+            cells[i, j] = _move(block, groups)
+            observed[i, j] = _move(self.observed[i, j], groups)
+            squares[i, j] = _move(self.squares[i, j], (self.columns[j], ))
+
+        base, base_observed = {}, {}
+        for j, block in self.base.items():
+            base[j] = _move(block, (self.columns[j], ))
+            base_observed[j] = _move(self.base_observed[j], (self.columns[j], ))
+
+        return CrossCounts(self.rows, self.columns, dict(levels), cells, observed, base, base_observed, squares,
+                           keys=keys)
+
+    def align(self, levels):
+        """
+        The same counts in code space of other levels
+
+        :param levels: dict, {variable_id: np.array of unique values}, must contain all current values
+        :return: CrossCounts
+        """
+        if all(_same_level(self.levels[v], levels[v]) for v in self.levels):
+            return self
+
+        positions = dict((v, pd.Index(levels[v]).get_indexer(self.levels[v])) for v in self.levels)
+
+        maps, keys = {}, {}
+        for group in self.rows + self.columns:
+            key = tuple(group)
+            codes = np.unravel_index(self.flat(group, np.arange(self.size(group))), self.shape(group))
+            new_shape = tuple(len(levels[v]) for v in group)
+            flat_codes = np.ravel_multi_index([positions[v][c] for v, c in zip(group, codes)], new_shape)
+
+            if key in self.keys:
+                # keys of sparse group stay sorted, its codes are positions in them
+                order = np.argsort(flat_codes, kind='stable')
+                keys[key] = flat_codes[order]
+                maps[key] = (np.argsort(order, kind='stable'), len(order))
+            else:
+                maps[key] = (flat_codes, int(np.prod(new_shape)))
+
+        return self._remap(levels, maps, keys)
+
+    def _sparsify(self, keys):
+        """
+        The same counts with sparse groups in space of other keys, which must contain all current ones
+        """
+        maps = {}
+        for group in self.rows + self.columns:
+            key = tuple(group)
+            codes = np.arange(self.size(group))
+            if key in keys:
+                maps[key] = (np.searchsorted(keys[key], self.flat(group, codes)), len(keys[key]))
+            else:
+                maps[key] = (codes, len(codes))
+        return self._remap(self.levels, maps, keys)
+
+    def _combine(self, other, sign):
+        if self.rows != other.rows or self.columns != other.columns:
+            raise Exception('Counts of different tables can not be combined')
+
+        levels = dict((v, _union_level(self.levels[v], other.levels[v])) for v in self.levels)
+        left, right = self.align(levels), other.align(levels)
+
+        # group that is sparse in any of counts is sparse in result with union of their keys
+        keys = {}
+        for group in self.rows + self.columns:
+            if tuple(group) in left.keys or tuple(group) in right.keys:
+                keys[tuple(group)] = np.union1d(left.flat(group, np.arange(left.size(group))),
+                                                right.flat(group, np.arange(right.size(group))))
+        if keys:
+            left, right = left._sparsify(keys), right._sparsify(keys)
+
+        cells, observed = {}, {}
+        for k in left.cells:
+            cells[k], observed[k] = _combine_blocks(left.cells[k], left.observed[k], right.cells[k],
+                                                    right.observed[k], sign)
+
+        return CrossCounts(
+            self.rows, self.columns, levels, cells, observed,
+            dict((k, left.base[k] + sign * right.base[k]) for k in left.base),
+            dict((k, left.base_observed[k] + sign * right.base_observed[k]) for k in left.base_observed),
+            dict((k, left.squares[k] + sign * right.squares[k]) for k in left.squares),
+            keys=keys
+        )
+
+    def save(self, path, meta=None):
+        """
+        Write count tensor as binary file (see utils.binary), levels of object dtype are stored in header
+
+        :param path: str
+        :param meta: json serializable object stored with counts, e.g. options of table
+        """
+        variables = list(self.levels)
+        arrays, object_levels = {}, {}
+        for idx, variable_id in enumerate(variables):
+            if self.levels[variable_id].dtype.hasobject:
+                object_levels[idx] = to_json_values(self.levels[variable_id])
+            else:
+                arrays['level/%d' % (idx, )] = self.levels[variable_id]
+
+        sparse_blocks = []
+        for (i, j), block in self.cells.items():
+            if isinstance(block, SparseBlock):
+                sparse_blocks.append([i, j, block.shape[0], block.shape[1]])
+                arrays['cell_keys/%d/%d' % (i, j)] = block.keys
+                arrays['cells/%d/%d' % (i, j)] = block.values
+                arrays['observed/%d/%d' % (i, j)] = self.observed[i, j].values
+            else:
+                arrays['cells/%d/%d' % (i, j)] = block
+                arrays['observed/%d/%d' % (i, j)] = self.observed[i, j]
+            arrays['squares/%d/%d' % (i, j)] = self.squares[i, j]
+        for j, block in self.base.items():
+            arrays['base/%d' % (j, )] = block
+            arrays['base_observed/%d' % (j, )] = self.base_observed[j]
+        for idx, key in enumerate(self.keys):
+            arrays['keys/%d' % (idx, )] = self.keys[key]
+
+        binary.dump(path, 'counts', {
+            'rows': self.rows,
+            'columns': self.columns,
+            'variables': variables,
+            'object_levels': object_levels,
+            'sparse': [list(key) for key in self.keys],
+            'sparse_blocks': sparse_blocks,
+            'meta': meta
+        }, arrays)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Read count tensor written by save
+
+        :param mmap: bool, if True arrays are read only views of memory map
+        :return: tuple, (CrossCounts, meta)
+        """
+        header, arrays = binary.load(path, 'counts', mmap=mmap)
+
+        levels = {}
+        for idx, variable_id in enumerate(header['variables']):
+            if str(idx) in header['object_levels']:
+                levels[variable_id] = np.array(header['object_levels'][str(idx)], dtype=object)
+            else:
+                levels[variable_id] = arrays['level/%d' % (idx, )]
+
+        cells, observed, squares, base, base_observed = {}, {}, {}, {}, {}
+        for i in range(len(header['rows'])):
+            for j in range(len(header['columns'])):
+                cells[i, j] = arrays['cells/%d/%d' % (i, j)]
+                observed[i, j] = arrays['observed/%d/%d' % (i, j)]
+                squares[i, j] = arrays['squares/%d/%d' % (i, j)]
+        for i, j, row_size, column_size in header.get('sparse_blocks', []):
+            keys = arrays['cell_keys/%d/%d' % (i, j)]
+            cells[i, j] = SparseBlock((row_size, column_size), keys, cells[i, j])
+            observed[i, j] = SparseBlock((row_size, column_size), keys, observed[i, j])
+        for j in range(len(header['columns'])):
+            base[j] = arrays['base/%d' % (j, )]
+            base_observed[j] = arrays['base_observed/%d' % (j, )]
+
+        keys = dict((tuple(group), arrays['keys/%d' % (idx, )]) for idx, group in enumerate(header.get('sparse', [])))
+
+        counts = cls(header['rows'], header['columns'], levels, cells, observed, base, base_observed, squares,
+                     keys=keys)
+        return counts, header['meta']
+
+    def __add__(self, other):
+        """
+        Counts of union of two disjoint sets of respondents, e.g. two chunks of data
+        """
+        return self._combine(other, 1)
+
+    def __sub__(self, other):
+        """
+        Counts without respondents of other, which must be counted in self
+        """
+        return self._combine(other, -1)
+
+
+def _same_level(left, right):
+    return left is right or (len(left) == len(right) and np.array_equal(left, right))
+
+
+def _union_level(left, right):
+    if _same_level(left, right):
+        return left
+    return np.asarray(pd.Index(left).union(pd.Index(right)))
+
+
+def _combine_blocks(left_cells, left_observed, right_cells, right_observed, sign):
+    if not isinstance(left_cells, SparseBlock) and not isinstance(right_cells, SparseBlock):
+        return left_cells + sign * right_cells, left_observed + sign * right_observed
+
+    # block sparse in any of counts is sparse in their sum
+    if not isinstance(left_cells, SparseBlock):
+        stored = (left_cells != 0) | (left_observed != 0)
+        left_cells = SparseBlock.from_dense(left_cells, stored)
+        left_observed = SparseBlock.from_dense(left_observed, stored)
+    if not isinstance(right_cells, SparseBlock):
+        stored = (right_cells != 0) | (right_observed != 0)
+        right_cells = SparseBlock.from_dense(right_cells, stored)
+        right_observed = SparseBlock.from_dense(right_observed, stored)
+    return left_cells.combine(right_cells, sign), left_observed.combine(right_observed, sign)
+
+
+def _is_sparse(shape, respondents, sparse=None):
+    if sparse is not None:
+        return bool(sparse)
+    size = int(np.prod(shape, dtype=np.float64))
+    return size >= SPARSE_MIN_SIZE and respondents < SPARSE_DENSITY * size
+
+
+def _group_codes(codebook, group, keys, sparse=None):
+    """
+    Codes of group and number of codes, sparse group is coded by its observed combinations and added to keys
+    """
+    codes, shape = codebook.group(group)
+    if not _is_sparse(shape, len(codebook), sparse):
+        return codes, int(np.prod(shape))
+
+    codes, keys[tuple(group)] = codebook.observed_group(group)
+    return codes, len(keys[tuple(group)])
+
+
+def cross_counts(codebook, rows, columns, weight=None, profiler=None, sparse=None, condition=None):
+    """
+    Count all cells of crosstab, every variable is factorized once
+    and every (row_group, column_group) pair is counted with one np.bincount
+
+    :param codebook: CodeBook
+    :param rows: list of row groups
+    :param columns: list of column groups
+    :param weight: str, weight variable
+    :param profiler: Profiler, see tools.profiling
+    :param sparse: bool, count groups over observed combinations and blocks over observed cells,
+        default is to choose by density of every group and block, see SPARSE_DENSITY
+    :param condition: filter condition, only respondents who satisfy it are counted, see CodeBook.mask
+    :return: CrossCounts
+    """
+    weights = codebook.weights(weight)
+    if condition is not None:
+        with stage(profiler, 'filter', rows=len(codebook)):
+            mask = codebook.mask(condition)
+    else:
+        mask = None
+    squared_weights = None if weights is None else weights ** 2
+
+    flat_rows = list(set(flatten(rows)))
+
+    cells, observed, squares = {}, {}, {}
+    base, base_observed = {}, {}
+    keys = {}
+
+    for column_group_idx, column_group in enumerate(columns):
+        with stage(profiler, 'codes', column_group=column_group_idx, rows=len(codebook)):
+            column_codes, column_size = _group_codes(codebook, column_group, keys, sparse)
+
+        for row_group_idx, row_group in enumerate(rows):
+            with stage(profiler, 'codes', row_group=row_group_idx, rows=len(codebook)):
+                row_codes, row_size = _group_codes(codebook, row_group, keys, sparse)
+            key = (row_group_idx, column_group_idx)
+            with stage(profiler, 'block', row_group=row_group_idx, column_group=column_group_idx,
+                       rows=len(codebook)) as counted:
+                # density of block is decided by its own cell space, not by spaces of its groups
+                if _is_sparse((row_size, column_size), len(codebook), sparse):
+                    cells[key], observed[key] = count_sparse_block(row_codes, row_size, column_codes, column_size,
+                                                                   weights, mask=mask)
+                    counted.cells = len(cells[key].keys)
+                else:
+                    cells[key], observed[key] = count_block(row_codes, row_size, column_codes, column_size, weights,
+                                                            mask=mask)
+                    counted.cells = row_size * column_size
+                if weights is None:
+                    squares[key] = observed[key].sum(axis=0).astype(np.float64)
+                else:
+                    answered = row_codes >= 0 if mask is None else (row_codes >= 0) & mask
+                    squares[key] = count_codes(np.where(answered, column_codes, -1), column_size, squared_weights)[0]
+
+        with stage(profiler, 'base', column_group=column_group_idx, rows=len(codebook), cells=column_size):
+            if len(flat_rows) == 1:
+                # everyone who answered the only row variable is counted in cells already
+                base[column_group_idx] = cells[0, column_group_idx].sum(axis=0)
+                base_observed[column_group_idx] = observed[0, column_group_idx].sum(axis=0)
+            else:
+                base[column_group_idx], base_observed[column_group_idx] = codebook.base(
+                    flat_rows, column_group, weight, sparse=tuple(column_group) in keys, condition=condition
+                )
+
+    flat_variables = set(flat_rows).union(*columns)
+    levels = dict((v, codebook.factor(v).uniques) for v in flat_variables)
+
+    return CrossCounts(rows, columns, levels, cells, observed, base, base_observed, squares, keys=keys)
+
+
+def stream_counts(chunks, rows, columns, weight=None, check=None, profiler=None, sparse=None, condition=None):
+    """
+    Count crosstab over chunks of respondents, partial counts of chunks are merged by addition,
+    so peak memory is defined by size of chunk
+
+    :param chunks: iterable of pd.DataFrame, e.g. pd.read_csv(..., chunksize=100000)
+    :param rows: list of row groups
+    :param columns: list of column groups
+    :param weight: str, weight variable
+    :param check: callable, is called with every chunk before counting
+    :param profiler: Profiler, see tools.profiling
+    :param sparse: bool, see cross_counts
+    :param condition: filter condition, see cross_counts
+    :return: CrossCounts
+    """
+    total = None
+    for chunk in chunks:
+        if check is not None:
+            check(chunk)
+        counts = cross_counts(CodeBook(chunk), rows, columns, weight=weight, profiler=profiler, sparse=sparse,
+                              condition=condition)
+        with stage(profiler, 'merge', rows=len(chunk)):
+            total = counts if total is None else total + counts
+
+    if total is None:
+        raise Exception('There are no chunks of data')
+    return total
@@ -1,14 +1,111 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import print_function, unicode_literals, division
-import warnings
+from collections import OrderedDict
+from collections.abc import Iterator
 
 import numpy as np
 import pandas as pd
 
-from utils.exprparser import Expression
-from utils.support import hash_index, unhash_index, equlize_size
-import itertools
+from pymeera.utils.exprparser import Expression, combine_filters, filter_variables
+from pymeera.utils.support import flatten
+from pymeera.tools.counting import CodeBook, CrossCounts, compile_filter, cross_counts, factorize, stream_counts
+from pymeera.tools.profiling import stage
+from pymeera.tools import statistics
+
+ENGINES = ('numpy', 'pandas')
+
+# options of statistics computed for every cell and their __STATISTICS__TYPE__
+CELL_STATISTICS = (
+    ('show_counts', '$COUNT$'),
+    ('show_column_percentage', '$COLUMN_PCT$'),
+    ('show_row_percentage', '$ROW_PCT$'),
+    ('show_table_percentage', '$TABLE_PCT$'),
+)
+
+# options of statistics computed for every column of numeric row variable
+SUMMARY_STATISTICS = (
+    ('show_mean', '$MEAN$'),
+    ('show_median', '$MEDIAN$'),
+    ('show_std', '$STD$'),
+    ('show_variance', '$VARIANCE$'),
+    ('show_sampling_error', '$SAMPLING_ERROR$'),
+)
+
+# state of table besides its counts, see Crosstab.save
+OPTIONS = (
+    ('rows', 'columns', 'additional_axis', 'filter', 'column_total', 'engine', 'title', 'subtitle', 'footer', 'corner',
+     'weight')
+    + tuple(option for option, _ in CELL_STATISTICS + SUMMARY_STATISTICS)
+)
+
+
+def _cell_statistics(statistics_type, cells, base):
+    if statistics_type == '$COLUMN_PCT$':
+        return statistics.column_percentage(cells, base)
+    if statistics_type == '$ROW_PCT$':
+        return statistics.row_percentage(cells)
+    if statistics_type == '$TABLE_PCT$':
+        return statistics.table_percentage(cells)
+    return cells
+
+
+def _level_values(index):
+    return [np.asarray(index.get_level_values(level)) for level in range(index.nlevels)]
+
+
+def _concat_level(parts):
+    """
+    Concatenate level parts keeping original dtypes of values,
+    parts of different dtypes are joined as objects, e.g. 1 stays int and 1.5 stays float
+    """
+    parts = [p for p in parts if len(p)]
+    if not parts:
+        return pd.Index([], dtype=object)
+    if len(set(p.dtype for p in parts)) == 1:
+        return pd.Index(np.concatenate(parts))
+    return pd.Index(np.concatenate([p.astype(object) for p in parts]), dtype=object)
+
+
+def _axis_arrays(groups, values, depth):
+    """
+    Level arrays of axis with (variable, value) level pair for every nesting level,
+    groups shorter than depth are padded with ''
+
+    :param groups: list of variable groups
+    :param values: list of lists of value arrays, one value array per variable of group
+    :param depth: number of level pairs
+    :return: list of pd.Index
+    """
+    levels = [[] for _ in range(2 * depth)]
+
+    for group, group_values in zip(groups, values):
+        size = len(group_values[0])
+        for level in range(depth):
+            if level < len(group):
+                levels[2 * level].append(np.full(size, group[level], dtype=object))
+                levels[2 * level + 1].append(np.asarray(group_values[level]))
+            else:
+                levels[2 * level].append(np.full(size, '', dtype=object))
+                levels[2 * level + 1].append(np.full(size, '', dtype=object))
+
+    return [_concat_level(parts) for parts in levels]
+
+
+def _label_axis(axis, variable_labels, value_labels):
+    """
+    Replace (variable, value) level pairs of axis by labels, other levels are kept
+    """
+    arrays = _level_values(axis)
+
+    for level in range(axis.nlevels // 2):
+        variables, values = arrays[2 * level], arrays[2 * level + 1]
+        arrays[2 * level + 1] = pd.Index([
+            value_labels.get(variable, {}).get(value, value) for variable, value in zip(variables, values)
+        ], dtype=object)
+        arrays[2 * level] = pd.Index([variable_labels.get(v, v) for v in variables], dtype=object)
+
+    return pd.MultiIndex.from_arrays(arrays, names=axis.names)
 
 
 class Crosstab(object):
@@ -19,21 +116,57 @@ class Crosstab(object):
         self.columns = kwargs.pop('columns', None)
         self.additional_axis = kwargs.pop('additional_axis', None)
 
-        if self.additional_axis:
-            warnings.warn('Additional axis is not supported now')
-
         self.column_total = kwargs.pop('column_total', True)
 
+        self.show_counts = kwargs.pop('show_counts', True)
+        self.show_column_percentage = kwargs.pop('show_column_percentage', False)
+        self.show_row_percentage = kwargs.pop('show_row_percentage', False)
+        self.show_table_percentage = kwargs.pop('show_table_percentage', False)
+        self.show_mean = kwargs.pop('show_mean', False)
+        self.show_median = kwargs.pop('show_median', False)
+        self.show_std = kwargs.pop('show_std', False)
+        self.show_variance = kwargs.pop('show_variance', False)
+        self.show_sampling_error = kwargs.pop('show_sampling_error', False)
+
+        # numpy – single pass counting over factorized codes, pandas – legacy pd.crosstab per cell group
+        self.engine = kwargs.pop('engine', 'numpy')
+        if self.engine not in ENGINES:
+            raise Exception('Unknown engine "%s", must be one of %s' % (self.engine, ENGINES))
+
+        # count groups over observed combinations only, None – by density of group, see counting.SPARSE_DENSITY
+        self.sparse = kwargs.pop('sparse', None)
+
         self.result = None
-        self._crosstab = None
+        self._table = None
+
+        # subsample of respondents, str or parsed condition (see Expression.parse_filter)
+        self.filter = kwargs.pop('filter', None)
+        if self.filter is not None and not isinstance(self.filter, list):
+            self.filter = Expression.parse_filter(self.filter)
 
         if expression is not None:
             parsed = Expression.parse(expression=expression)
             self.rows = parsed['rows']
             self.columns = parsed['columns']
             self.additional_axis = parsed['additional_axis']
+            # filter of expression and filter argument are both applied
+            self.filter = combine_filters(parsed['filter'], self.filter)
+
+        # timing of stages, see tools.profiling.Profiler
+        self._profiler = kwargs.pop('profiler', None)
+        self._profile_table = None
+        if self._profiler is not None:
+            self._profile_table = self._profiler.table(
+                expression if expression is not None else '%s by %s' % (self.rows, self.columns)
+            )
 
-        self._check(data)
+        # iterator of data frames is counted chunk by chunk, see counting.stream_counts
+        self._chunks = data if isinstance(data, Iterator) else None
+
+        if self._chunks is None:
+            self._check(data)
+        else:
+            self._check_axes()
 
         self.title = kwargs.pop('title', '')
         self.subtitle = kwargs.pop('subtitle', '')
@@ -42,27 +175,122 @@ class Crosstab(object):
 
         self.weight = kwargs.pop('weight', None)  # weight is variable
 
-        self.data = data[self._flat_variables()].copy()
+        # factorized variables may be shared between tables, see TableBook
+        self._codebook = kwargs.pop('codebook', None)
+        if isinstance(data, CodeBook):
+            self._codebook = data
 
-        self._evaluated_columns = None
-        self._evaluated_index = None
+        if self.engine == 'pandas':
+            if not isinstance(data, pd.DataFrame):
+                raise Exception('Engine "pandas" requires pd.DataFrame as data')
+            if not self.show_counts or any(getattr(self, option) for option, _ in CELL_STATISTICS[1:] + SUMMARY_STATISTICS):
+                raise Exception('Engine "pandas" computes only counts')
+            if self.additional_axis:
+                raise Exception('Engine "pandas" does not support additional axis')
 
-        self._evaluate()
+        self.data = data if self._chunks is None else None
 
-    def _flat_variables(self):
-        flat_rows = [item for sublist in self.rows for item in sublist]
-        flat_columns = [item for sublist in self.columns for item in sublist]
-        flat_3rd_axis = None if not self.additional_axis else [item for sublist in self.additional_axis for item in sublist]
+        self._counts = None
+        self._answered = {}
+        self._layers = OrderedDict()
+        self._views = {}
 
-        all_variables = flat_rows
-        all_variables.extend(flat_columns)
-        if flat_3rd_axis is not None:
-            all_variables.extend(flat_3rd_axis)
+        # persistent cache of counts, see tools.cache.ResultCache
+        self._cache = kwargs.pop('cache', None)
 
-        all_variables = list(set(all_variables))
-        return all_variables
+        # lazy table is only checked here, it is counted when its result is accessed first time
+        self.lazy = kwargs.pop('lazy', False)
+        if not self.lazy:
+            self.evaluate()
+
+    def evaluate(self):
+        """
+        Count the table unless it is counted already, e.g. to count lazy table at chosen moment
+
+        :return: self
+        """
+        if self._table is not None:
+            return self
+
+        if self.engine == 'pandas':
+            variables = self._flat_variables()
+            if self.weight and self.weight not in variables:
+                variables.append(self.weight)
+            with self._stage('copy', rows=len(self.data)):
+                if self.filter is None:
+                    self.data = self.data[variables].copy()
+                else:
+                    data = self.data
+                    mask = compile_filter(self.filter, lambda v: factorize(v, data[v]))
+                    self.data = data.loc[mask, variables].copy()
+
+        with self._stage('table'):
+            key = self._cache_key()
+            if key is not None:
+                with self._stage('cache'):
+                    self._counts = self._cache.get(key)
+
+            if self._counts is None:
+                self._evaluate()
+                if key is not None:
+                    with self._stage('cache'):
+                        self._cache.put(key, self._counts)
+            else:
+                self._render()
+        return self
+
+    @property
+    def _crosstab(self):
+        if self._table is None:
+            self.evaluate()
+        return self._table
+
+    @_crosstab.setter
+    def _crosstab(self, table):
+        self._table = table
+
+    def _stage(self, name, **info):
+        return stage(self._profiler, name, table=self._profile_table, **info)
+
+    @property
+    def stats(self):
+        """
+        Records of stages of the table, None if table is not profiled
+
+        :return: pd.DataFrame, see tools.profiling.Profiler.frame
+        """
+        if self._profiler is None:
+            return None
+        return self._profiler.frame(table=self._profile_table)
+
+    def _cache_key(self):
+        if self._cache is None or self.engine != 'numpy' or self._chunks is not None:
+            return None
+        if self._codebook is None:
+            self._codebook = CodeBook(self.data)
+        with self._stage('cache_key'):
+            return self._cache.key(self._codebook, self.rows, self._count_columns(), weight=self.weight,
+                                   condition=self.filter, column_total=self.column_total)
+
+    def _count_columns(self):
+        """
+        Column groups of count tensor. Layer group of additional axis is the outermost nesting level
+        of every column group, so layers are counted in the same pass as rows and columns
+        and block of layered group is (rows, layers * columns) tensor.
+        """
+        if not self.additional_axis:
+            return self.columns
+        return [list(layer) + list(column) for layer in self.additional_axis for column in self.columns]
+
+    def _flat_variables(self):
+        all_variables = flatten(self.rows) + flatten(self.columns) + flatten(self.additional_axis)
+        return list(set(all_variables))
 
     def _check(self, data):
+        self._check_axes()
+        self._check_variable_existence(data)
+
+    def _check_axes(self):
 
         if self.rows is None or self.columns is None:
             raise Exception('Rows are empty')
@@ -70,16 +298,23 @@ class Crosstab(object):
         if not len(self.rows) or not len(self.columns):
             raise Exception('Columns are empty')
 
-        self._check_variable_existence(data)
-
     def _check_variable_existence(self, data):
 
-        all_variables = self._flat_variables()
+        all_variables = self._flat_variables() + filter_variables(self.filter)
 
         for variable in all_variables:
             if variable not in data.columns:
                 raise Exception('Variable "%s" is not defined in columns' % (variable, ))
 
+    def _answered_mask(self, variables):
+        """
+        Mask of respondents who have at least one answer in variables, cached by set of variables
+        """
+        key = frozenset(variables)
+        if key not in self._answered:
+            self._answered[key] = self.data[list(key)].notna().to_numpy().any(axis=1)
+        return self._answered[key]
+
     def _compute_total_and_weights(self):
         """
             Adds __Total__ column to dataframe based on specific columns:
@@ -87,16 +322,15 @@ class Crosstab(object):
             will be evaluated including this respondent in base. It is needed to correctly
             compute percentage in checkbox(multi) questions.
         """
-        self.data.loc[:, '__TOTAL__'] = None
-        self.data.loc[:, '__WEIGHT__'] = None
-
-        flat_rows = list(set([item for sublist in self.rows for item in sublist]))
-
-        self.data.loc[df[flat_rows].count(axis=1).apply(lambda x: x > 0), '__TOTAL__'] = 1
-        self.data.loc[df[flat_rows].count(axis=1).apply(lambda x: x > 0), '__WEIGHT__'] = 1
+        in_base = self._answered_mask(flatten(self.rows))
 
         if self.weight:
-            self.data.loc[df[flat_rows].count(axis=1).apply(lambda x: x > 0), '__WEIGHT__'] = self.data.loc[df[flat_rows].count(axis=1).apply(lambda x: x > 0), self.weight]
+            weights = self.data[self.weight].to_numpy(dtype=np.float64)
+        else:
+            weights = np.ones(len(self.data))
+
+        self.data['__TOTAL__'] = np.where(in_base, 1., np.nan)
+        self.data['__WEIGHT__'] = np.where(in_base, weights, np.nan)
 
     def _compute_base(self, columns):
 
@@ -111,12 +345,8 @@ class Crosstab(object):
                                    values=self.data['__WEIGHT__'],
                                    aggfunc=np.sum
                                    )
-            base_row.columns = list(
-                map(lambda v: hash_index(v, columns), base_row.columns.values)
-            )
-
-            base_row.index = pd.MultiIndex.from_tuples((('$BASE$', '$COUNT$'), ))
-            base_row.index.names = ['__DESCRIPTION__', '__STATISTICS__TYPE__']
+            base_row.columns = self._column_index([columns], [_level_values(base_row.columns)])
+            base_row.index = self._row_index([(['$BASE$'], [np.array([''], dtype=object)], '$COUNT$')])
 
         # if base_total is None and base_column is None:
         #     return pd.crosstab(self.data['__TOTAL__'], self.data['__WEIGHT__'])
@@ -138,72 +368,450 @@ class Crosstab(object):
 
         return (
             max(map(lambda x: _shape_of_group(x), self.rows)),
-            max(map(lambda x: _shape_of_group(x), self.columns))
+            max(map(lambda x: _shape_of_group(x), self._count_columns()))
         )
 
     def _evaluate(self):
+        if self.engine == 'pandas':
+            self._evaluate_pandas()
+        else:
+            self._evaluate_numpy()
+
+    def _evaluate_numpy(self):
+        """
+            Counts every cell in factorized code space (see counting.cross_counts)
+            and assembles the table from blocks of observed rows and columns at once.
+            Cells without observations are NaN as in pd.crosstab.
+        """
+        with self._stage('count'):
+            if self._chunks is not None:
+                self._counts = stream_counts(self._chunks, self.rows, self._count_columns(), weight=self.weight,
+                                             check=self._check_variable_existence, profiler=self._profiler,
+                                             sparse=self.sparse, condition=self.filter)
+                self._chunks = None
+            else:
+                if self._codebook is None:
+                    self._codebook = CodeBook(self.data)
+                self._counts = cross_counts(self._codebook, self.rows, self._count_columns(), weight=self.weight,
+                                            profiler=self._profiler, sparse=self.sparse, condition=self.filter)
+
+        self._render()
+
+    def _render(self):
+        """
+            Assembles the table from count tensor: rows of every shown statistics type
+            for every row group and base row at the end
+        """
+        # views of previous counts are outdated
+        self._views = {}
+
+        cell_types = [statistics_type for option, statistics_type in CELL_STATISTICS if getattr(self, option)]
+        with self._stage('render') as rendered:
+            self._crosstab = self._assemble(cell_types, self._summary_types())
+            rendered.cells = self._crosstab.size
+
+    def _assemble(self, cell_types, summary_types):
+        """
+        :param cell_types: list of cell statistics types, see CELL_STATISTICS
+        :param summary_types: list of summary statistics types of numeric rows, see SUMMARY_STATISTICS
+        :return: pd.DataFrame
+        """
+        counts = self._counts
+        segments = self._segments()
+        bases = [counts.base[j][codes] for j, codes in segments]
+
+        blocks, entries = [], []
+        for i, row_group in enumerate(self.rows):
+            observed_rows = np.zeros(counts.size(row_group), dtype=bool)
+            for j in range(len(counts.columns)):
+                observed_rows |= counts.observed_rows(i, j)
+            row_codes = np.flatnonzero(observed_rows)
+
+            cells = []
+            for j, codes in segments:
+                # sparse block is expanded only for observed rows and columns
+                block = counts.block(i, j, row_codes, codes)
+                block[counts.block(i, j, row_codes, codes, observed=True) == 0] = np.nan
+                cells.append(block)
+
+            labels = counts.labels(row_group, row_codes)
+            for statistics_type in cell_types:
+                blocks.append(np.hstack([
+                    _cell_statistics(statistics_type, block, base) for block, base in zip(cells, bases)
+                ]))
+                entries.append((row_group, labels, statistics_type))
+
+            if summary_types and self._is_numeric(row_group):
+                with self._stage('summary', row_group=i):
+                    summary = self._summary(i, segments)
+                for statistics_type in summary_types:
+                    blocks.append(summary[statistics_type][np.newaxis, :])
+                    entries.append((row_group, [np.array([''], dtype=object)], statistics_type))
+
+        blocks.append(np.hstack(bases)[np.newaxis, :])
+        entries.append((['$BASE$'], [np.array([''], dtype=object)], '$COUNT$'))
+
+        groups = [counts.columns[j] for j, _ in segments]
+        column_values = [counts.labels(counts.columns[j], codes) for j, codes in segments]
+
+        return pd.DataFrame(
+            np.vstack(blocks),
+            index=self._row_index(entries),
+            columns=self._column_index(groups, column_values)
+        )
+
+    def _segments(self):
+        """
+        Observed columns of count tensor as list of (column group idx, flat codes).
+        Columns of layered group are split by layers and ordered by layer group, layer and column group,
+        so every layer is contiguous range of columns of the table and its statistics are computed separately.
+        """
+        counts = self._counts
+        column_codes = [np.flatnonzero(counts.base_observed[j]) for j in range(len(counts.columns))]
+        self._layers = OrderedDict()
+
+        if not self.additional_axis:
+            return list(enumerate(column_codes))
+
+        segments, start = [], 0
+        for k, layer_group in enumerate(self.additional_axis):
+            groups = range(k * len(self.columns), (k + 1) * len(self.columns))
+            # flat code of layered group is layer code * number of columns + column code
+            layer_codes = dict(
+                (j, counts.flat(counts.columns[j], column_codes[j])
+                 // int(np.prod(counts.shape(counts.columns[j][len(layer_group):]))))
+                for j in groups
+            )
+
+            for layer_code in np.unique(np.hstack([layer_codes[j] for j in groups])):
+                size = 0
+                for j in groups:
+                    codes = column_codes[j][layer_codes[j] == layer_code]
+                    if len(codes):
+                        segments.append((j, codes))
+                        size += len(codes)
+
+                values = tuple(level[0].item() if isinstance(level[0], np.generic) else level[0]
+                               for level in counts.values(layer_group, np.array([layer_code])))
+                self._layers[k, values] = slice(start, start + size)
+                start += size
+
+        return segments
+
+    def _summary_types(self):
+        return [statistics_type for option, statistics_type in SUMMARY_STATISTICS if getattr(self, option)]
+
+    def _is_numeric(self, row_group):
+        # summary statistics are defined only for single numeric variable
+        return len(row_group) == 1 and self._counts.levels[row_group[0]].dtype.kind in 'iuf'
+
+    def _summary(self, row_group_idx, segments):
+        """
+        Summary statistics of row variable for every shown column
+
+        :param segments: list of (column group idx, flat codes), see _segments
+        :return: dict, {statistics_type: 1-dimensional np.array}
+        """
+        counts = self._counts
+        row_group = self.rows[row_group_idx]
+        values = counts.labels(row_group, np.arange(counts.size(row_group)))[0]
+
+        summary = dict((statistics_type, []) for option, statistics_type in SUMMARY_STATISTICS)
+        for j, codes in segments:
+            cells = counts.block(row_group_idx, j, np.arange(counts.size(row_group)), codes)
+            total, mean, variance = statistics.moments(values, cells)
+
+            summary['$MEAN$'].append(mean)
+            summary['$MEDIAN$'].append(statistics.median(values, cells))
+            summary['$STD$'].append(np.sqrt(variance))
+            summary['$VARIANCE$'].append(variance)
+            summary['$SAMPLING_ERROR$'].append(
+                statistics.sampling_error(variance, total, counts.squares[row_group_idx, j][codes])
+            )
+
+        return dict((statistics_type, np.hstack(rows)) for statistics_type, rows in summary.items())
+
+    def _row_index(self, entries):
+        """
+        Row axis: (variable, value) level pair for every nesting level and statistics type level
+
+        :param entries: list of tuples, (row group, list of value arrays, statistics type)
+        :return: pd.MultiIndex
+        """
+        row_depth = self._compute_index_shape()[0]
+        arrays = _axis_arrays([e[0] for e in entries], [e[1] for e in entries], row_depth)
+
+        statistics_types = np.repeat(np.array([e[2] for e in entries], dtype=object), [len(e[1][0]) for e in entries])
+        arrays.append(pd.Index(statistics_types, dtype=object))
+        return pd.MultiIndex.from_arrays(arrays, names=[None] * (2 * row_depth) + ['__STATISTICS__TYPE__'])
 
-        self._compute_total_and_weights()
+    def _column_index(self, groups, values):
+        column_depth = self._compute_index_shape()[1]
+        return pd.MultiIndex.from_arrays(_axis_arrays(groups, values, column_depth))
+
+    def _evaluate_pandas(self):
+
+        with self._stage('total_and_weights', rows=len(self.data)):
+            self._compute_total_and_weights()
 
         row_result = None
 
         for row_group_idx, row_group in enumerate(self.rows):
             col_result = None
-            for column_group in self.columns:
-
-                ct = pd.crosstab(index=list(map(lambda v: self.data[v], row_group)),
-                                 columns=list(map(lambda v: self.data[v], column_group)),
-                                 values=self.data['__WEIGHT__'],
-                                 aggfunc=np.sum)
-
-                ct.index = list(
-                    map(lambda v: hash_index(v, row_group), ct.index.values)
-                )
-                ct.index.name = '__DESCRIPTION__'
+            for column_group_idx, column_group in enumerate(self.columns):
 
-                # append more info about cross
-                ct['__STATISTICS__TYPE__'] = '$COUNT$'
-                ct = ct.set_index('__STATISTICS__TYPE__', append=True)
+                with self._stage('crosstab', row_group=row_group_idx, column_group=column_group_idx,
+                                 rows=len(self.data)) as crossed:
+                    ct = pd.crosstab(index=list(map(lambda v: self.data[v], row_group)),
+                                     columns=list(map(lambda v: self.data[v], column_group)),
+                                     values=self.data['__WEIGHT__'],
+                                     aggfunc=np.sum)
 
-                ct.columns = list(
-                    map(lambda v: hash_index(v, column_group), ct.columns.values)
-                )
+                    ct.index = self._row_index([(row_group, _level_values(ct.index), '$COUNT$')])
+                    ct.columns = self._column_index([column_group], [_level_values(ct.columns)])
+                    crossed.cells = ct.size
 
                 if row_group_idx == len(self.rows) - 1:
                     # if last one iteration lets append base row
-                    base = self._compute_base(columns=column_group)
+                    with self._stage('base', column_group=column_group_idx, rows=len(self.data)):
+                        base = self._compute_base(columns=column_group)
                     ct = pd.concat([ct, base], axis=0)
-                col_result = pd.concat([col_result, ct], axis=1)
+                with self._stage('concat', row_group=row_group_idx, column_group=column_group_idx):
+                    col_result = pd.concat([col_result, ct], axis=1)
 
             #  without reindex column order will be lost
-            row_result = pd.concat([row_result, col_result], axis=0).reindex(columns=col_result.columns)
+            with self._stage('concat', row_group=row_group_idx):
+                row_result = pd.concat([row_result, col_result], axis=0).reindex(columns=col_result.columns)
 
         self._crosstab = row_result.copy()
         del row_result, col_result
 
-        self._evaluated_columns = self._crosstab.columns.copy()
-        self._evaluated_index = self._crosstab.index.copy()
+    def append(self, data, codebook=None):
+        """
+        Add respondents to the table, e.g. new completes during fieldwork.
+        Only the batch is counted, its counts are added to count tensor of the table.
+
+        :param data: pd.DataFrame, batch of respondents with the same variables
+        :param codebook: CodeBook of batch, to factorize batch once for several tables
+        """
+        self._update(data, codebook, 1)
+
+    def remove(self, data, codebook=None):
+        """
+        Remove respondents counted in the table before, e.g. rejected interviews.
+        Their counts are subtracted from count tensor of the table.
+
+        :param data: pd.DataFrame, batch of respondents with the same variables
+        :param codebook: CodeBook of batch
+        """
+        self._update(data, codebook, -1)
 
-        self._map_names()
+    def _update(self, data, codebook, sign):
+        self.evaluate()
+        if self._counts is None:
+            raise Exception('Only tables counted by "numpy" engine can be updated')
 
-    def _map_names(self):
-        unhashed_columns = list(map(lambda x: unhash_index(x), self._evaluated_columns))
-        cols = equlize_size(unhashed_columns)
-        # TODO: map labels to variables and values
-        cols = tuple(map(lambda x: tuple(itertools.chain(*x)), cols))
-        self._crosstab.columns = pd.MultiIndex.from_tuples(cols)
+        if codebook is None:
+            self._check_variable_existence(data)
+            codebook = CodeBook(data)
 
-        unhashed_index = list(map(lambda x: unhash_index(x[0]), self._evaluated_index))
-        idx = equlize_size(unhashed_index)
-        # TODO: map labels to variables and values
-        idx = tuple(map(lambda x: tuple(itertools.chain(*x)), idx))
-        self._crosstab.index = pd.MultiIndex.from_tuples(idx)
+        with self._stage('count'):
+            counts = cross_counts(codebook, self.rows, self._count_columns(), weight=self.weight,
+                                  profiler=self._profiler, sparse=self.sparse, condition=self.filter)
+        self._counts = self._counts + counts if sign > 0 else self._counts - counts
+
+        # source data does not describe the table anymore
+        self.data = None
+        self._codebook = None
+
+        self._render()
+
+    @property
+    def layers(self):
+        """
+        Layers of additional axis: list of (layer group idx, tuple of values of layer group)
+        """
+        self.evaluate()
+        return list(self._layers)
+
+    def layer(self, values, layer_group=0):
+        """
+        2-dimensional table of one layer, e.g. one wave of 'q1 by q2 by wave'.
+        Columns of layer are contiguous range of the table, so the layer is a slice of the table, not a copy.
+
+        :param values: value of layer variable or tuple of values of nested layer group
+        :param layer_group: int, index of group of additional axis
+        :return: pd.DataFrame
+        """
+        self.evaluate()
+        key = (layer_group, values if isinstance(values, tuple) else (values, ))
+        if key not in self._layers:
+            raise Exception('Layer %s is not defined' % (key, ))
+
+        # levels of layer and padding of deeper layer groups are dropped
+        layer_depth = len(self.additional_axis[layer_group])
+        column_depth = max(len(group) for group in self.columns)
+        levels = list(range(2 * layer_depth))
+        levels += list(range(2 * (layer_depth + column_depth), self._crosstab.columns.nlevels))
+
+        table = self._crosstab.iloc[:, self._layers[key]]
+        table.columns = table.columns.droplevel(levels)
+        return table
+
+    def tensor(self, row_group=0, column_group=0, layer_group=0):
+        """
+        Weighted counts of layered block as 3-dimensional view of count tensor
+
+        :return: np.array with shape (row codes, layer codes, column codes), see counting.CrossCounts.labels
+        """
+        if not self.additional_axis:
+            raise Exception('Table has no additional axis')
+
+        self.evaluate()
+        counts = self._counts
+        j = layer_group * len(self.columns) + column_group
+        shape = (
+            int(np.prod(counts.shape(self.rows[row_group]))),
+            int(np.prod(counts.shape(self.additional_axis[layer_group]))),
+            int(np.prod(counts.shape(self.columns[column_group])))
+        )
+        return counts.dense(row_group, j).reshape(shape)
+
+    def labeled(self, structure=None, variable_labels=None, value_labels=None):
+        """
+        Table with variables and values replaced by their labels.
+        Labels are taken from structure, explicit variable_labels and value_labels take precedence.
+        Variables and values without label are left as is.
+
+        :param structure: SurveyStructure
+        :param variable_labels: dict, {variable_id: variable_label}
+        :param value_labels: nested dict, {variable_id: {value_id: value_label}}
+        :return: pd.DataFrame
+        """
+        var_labs, val_labs = {}, {}
+
+        if structure is not None:
+            for variable_id in self._flat_variables():
+                if variable_id in structure:
+                    variable = structure.get_variable_by_id(variable_id)
+                    var_labs[variable_id] = variable.variable_label
+                    val_labs[variable_id] = variable.variable_values
+
+        var_labs.update(variable_labels or {})
+        val_labs.update(value_labels or {})
+
+        table = self._crosstab.copy()
+        table.index = _label_axis(table.index, var_labs, val_labs)
+        table.columns = _label_axis(table.columns, var_labs, val_labs)
+        return table
+
+    def save(self, path):
+        """
+        Write count tensor and options of the table as binary file, see counting.CrossCounts.save
+        """
+        self.evaluate()
+        if self._counts is None:
+            raise Exception('Only tables counted by "numpy" engine can be saved')
+        self._counts.save(path, meta=dict((option, getattr(self, option)) for option in OPTIONS))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Table written by save, it is rendered from stored counts without source data
+
+        :param mmap: bool, if True counts are read only views of memory map
+        :return: Crosstab
+        """
+        counts, options = CrossCounts.load(path, mmap=mmap)
+
+        table = cls.__new__(cls)
+        # tables saved before filters were introduced have no filter
+        table.filter = None
+        table.__dict__.update(options)
+        table.data = None
+        table.result = None
+        table._codebook = None
+        table._chunks = None
+        table._answered = {}
+        table._cache = None
+        table._profiler = None
+        table._profile_table = None
+        table.sparse = None
+        table.lazy = False
+        table._table = None
+        table._counts = counts
+        table._render()
+        return table
+
+    def __getstate__(self):
+        # evaluated table is pickled without source data, e.g. to send it from worker process
+        self.evaluate()
+        state = self.__dict__.copy()
+        state['data'] = None
+        state['_codebook'] = None
+        state['_cache'] = None
+        if self._profiler is not None:
+            # only records of the table are sent, see ParallelTableBook
+            state['_profiler'] = self._profiler.subset(self._profile_table)
+            state['_profile_table'] = 0
+        return state
 
     def __repr__(self):
         return self._crosstab.__repr__()
 
+    def view(self, statistics_type):
+        """
+        Table of one cell statistics with base row, derived from count tensor of the table.
+        Tensor is counted once for all views, e.g. counts and column percentages of one table,
+        views are cached and the table itself is not changed.
+
+        :param statistics_type: str, '$COUNT$', '$COLUMN_PCT$', '$ROW_PCT$' or '$TABLE_PCT$'
+        :return: pd.DataFrame, independent copy, it may be modified by caller
+        """
+        if statistics_type not in [t for _, t in CELL_STATISTICS]:
+            raise Exception('Unknown statistics type "%s"' % (statistics_type, ))
+
+        self.evaluate()
+        if self._counts is None:
+            raise Exception('Only tables counted by "numpy" engine have views')
+
+        cell_types = [t for option, t in CELL_STATISTICS if getattr(self, option)]
+        if cell_types == [statistics_type] and not self._summary_types():
+            # the table itself is the view
+            return self._crosstab.copy()
+
+        if statistics_type not in self._views:
+            with self._stage('view') as rendered:
+                self._views[statistics_type] = self._assemble([statistics_type], [])
+                rendered.cells = self._views[statistics_type].size
+        return self._views[statistics_type].copy()
+
+    def counts(self):
+        return self.view('$COUNT$')
+
+    def column_percentage(self):
+        return self.view('$COLUMN_PCT$')
+
+    def row_percentage(self):
+        return self.view('$ROW_PCT$')
+
+    def table_percentage(self):
+        return self.view('$TABLE_PCT$')
+
     def as_cpct(self):
-        self._crosstab.iloc[:-1, :] = self._crosstab.iloc[:-1, :] / self._crosstab.iloc[-1, :]
+        """
+        Column percentages as new table, the table itself is not changed, see view
+
+        :return: pd.DataFrame
+        """
+        self.evaluate()
+        if self._counts is not None:
+            return self.column_percentage()
+
+        # table of "pandas" engine has no count tensor, its counts are divided by base row
+        table = self._crosstab.copy()
+        table.iloc[:-1, :] = table.iloc[:-1, :] / table.iloc[-1, :]
+        return table
 
 
 if __name__ == '__main__':
@@ -219,9 +827,7 @@ if __name__ == '__main__':
     df.loc[[1, 3], 'r2'] = 3
     cross = Crosstab(data=df, rows=[['q1'], ['q2', 'q3']], columns=[['Всего'], ['r1', 'r2']])
 
-    cross.as_cpct()
-
-    print(cross)
+    print(cross.as_cpct())
 
 
 
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import multiprocessing
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from pymeera.utils.support import flatten, fingerprint
+from pymeera.tools.counting import CodeBook, Factor
+from pymeera.tools.crosstab import Crosstab
+from pymeera.tools.tablebook import TableBook
+
+
+class SharedCodeBook(CodeBook):
+    """
+        CodeBook over already factorized variables, e.g. views of shared memory.
+        Factors are never dropped, only derived groups and bases.
+    """
+
+    def __init__(self, factors, weights, size):
+        """
+
+        :param factors: dict, {variable_id: Factor}
+        :param weights: dict, {weight variable_id: np.array of float}
+        :param size: int, number of respondents
+        :return: instance of SharedCodeBook
+        """
+        super(SharedCodeBook, self).__init__(data=None)
+        self._factors = factors
+        self._weights = weights
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def columns(self):
+        return list(self._factors) + list(self._weights)
+
+    def factor(self, variable_id):
+        if variable_id not in self._factors:
+            raise Exception('Variable "%s" is not shared with worker' % (variable_id, ))
+        return self._factors[variable_id]
+
+    def weights(self, variable_id=None):
+        if variable_id is None:
+            return None
+        return self._weights[variable_id]
+
+    def fingerprint(self, variable_id):
+        if variable_id not in self._fingerprints:
+            if variable_id in self._weights:
+                self._fingerprints[variable_id] = fingerprint(self._weights[variable_id])
+            else:
+                factor = self.factor(variable_id)
+                self._fingerprints[variable_id] = fingerprint(factor.codes) + fingerprint(factor.uniques)
+        return self._fingerprints[variable_id]
+
+    def drop(self, variables):
+        self._drop_derived(set(variables))
+
+
+def _share(rows, shape, dtype):
+    """
+    Array allocated directly in new shared memory block and filled row by row
+
+    :param rows: iterable of np.array, rows of array
+    :return: tuple, (SharedMemory, spec for _attach)
+    """
+    dtype = np.dtype(dtype)
+    shm = shared_memory.SharedMemory(create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    shared = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    try:
+        for idx, row in enumerate(rows):
+            shared[idx] = row
+    except BaseException:
+        # view must be released before shared memory is closed
+        del shared
+        shm.close()
+        shm.unlink()
+        raise
+    return shm, (shm.name, shape, dtype.str)
+
+
+def _attach(spec):
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf)
+
+
+# state of worker process, set once by _init_worker
+_WORKER = {}
+
+
+def _init_worker(codes_spec, weights_spec, variables, uniques, weight_ids, kwargs):
+    codes_shm, codes = _attach(codes_spec)
+    weights_shm, weights = _attach(weights_spec)
+
+    factors = dict((v, Factor(v, codes[idx], uniques[idx])) for idx, v in enumerate(variables))
+    shared_weights = dict((w, weights[idx]) for idx, w in enumerate(weight_ids))
+
+    # shared memory handles must live as long as worker uses arrays
+    _WORKER['buffers'] = (codes_shm, weights_shm)
+    _WORKER['codebook'] = SharedCodeBook(factors, shared_weights, codes.shape[1])
+    _WORKER['kwargs'] = kwargs
+
+
+def _evaluate_table(expression):
+    codebook = _WORKER['codebook']
+    table = Crosstab(codebook, expression=expression, **_WORKER['kwargs']).evaluate()
+    codebook.drop(flatten(table.rows))
+
+    profiler = _WORKER['kwargs'].get('profiler')
+    if profiler is not None:
+        # only records of this table are sent, profiler of worker does not keep history of previous ones
+        table._profiler = profiler.subset(table._profile_table)
+        table._profile_table = 0
+        profiler.reset()
+    return table
+
+
+class ParallelTableBook(TableBook):
+    """
+        TableBook evaluated by pool of worker processes.
+
+        Variables of all tables are factorized once in the main process and their codes
+        and weights are placed in shared memory, workers read them without copying.
+        Tables are yielded in order of expressions.
+
+        book = ParallelTableBook(df, banner='q2 + q3', stubs=stubs, weight='w', workers=8, chunksize=16)
+        for table in book:
+            print(table)
+    """
+
+    def __init__(self, data, expressions=None, banner=None, stubs=None, workers=None, chunksize=1, **kwargs):
+        """
+
+        :param workers: int, number of worker processes, default is number of CPUs
+        :param chunksize: int, number of tables sent to worker at once
+        """
+        super(ParallelTableBook, self).__init__(data, expressions=expressions, banner=banner, stubs=stubs, **kwargs)
+
+        if self.kwargs.get('engine', 'numpy') != 'numpy':
+            raise Exception('ParallelTableBook supports only "numpy" engine')
+
+        self.workers = workers or multiprocessing.cpu_count()
+        self.chunksize = chunksize
+
+    def _referenced_variables(self):
+        variables = set()
+        for expression in self.expressions:
+            variables.update(self._variables(expression))
+        return sorted(variables)
+
+    def _release_codes(self, variables, uniques):
+        """
+        Codes of variables one at a time, factor of main process is released
+        as soon as its codes are copied, only uniques are kept
+
+        :param uniques: list, uniques of variables are appended to it
+        """
+        for variable_id in variables:
+            factor = self.codebook.factor(variable_id)
+            uniques.append(factor.uniques)
+            yield factor.codes
+            self.codebook.drop([variable_id])
+            del factor
+
+    def _release_weights(self, weight_ids):
+        for weight_id in weight_ids:
+            yield self.codebook.weights(weight_id)
+            self.codebook.drop([weight_id])
+
+    def __iter__(self):
+        variables = self._referenced_variables()
+        weight_ids = [self.kwargs['weight']] if self.kwargs.get('weight') else []
+
+        for variable_id in variables + weight_ids:
+            if variable_id not in self.codebook.columns:
+                raise Exception('Variable "%s" is not defined in columns' % (variable_id, ))
+
+        buffers = []
+        try:
+            uniques = []
+            codes_shm, codes_spec = _share(self._release_codes(variables, uniques),
+                                           (len(variables), len(self.codebook)), np.int32)
+            buffers.append(codes_shm)
+            weights_shm, weights_spec = _share(self._release_weights(weight_ids),
+                                               (len(weight_ids), len(self.codebook)), np.float64)
+            buffers.append(weights_shm)
+
+            initargs = (codes_spec, weights_spec, variables, uniques, weight_ids, self.kwargs)
+            pool = multiprocessing.Pool(processes=self.workers, initializer=_init_worker, initargs=initargs)
+            try:
+                profiler = self.kwargs.get('profiler')
+                for table in pool.imap(_evaluate_table, self.expressions, chunksize=self.chunksize):
+                    if profiler is not None:
+                        # records of worker are aggregated by profiler of main process
+                        table._profile_table = profiler.merge(table._profiler)
+                        table._profiler = profiler
+                    yield table
+            finally:
+                pool.terminate()
+                pool.join()
+        finally:
+            for shm in buffers:
+                shm.close()
+                shm.unlink()
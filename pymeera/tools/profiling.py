@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import time
+import tracemalloc
+from collections import namedtuple
+
+import pandas as pd
+
+StageRecord = namedtuple(
+    'StageRecord', ('table', 'expression', 'stage', 'row_group', 'column_group', 'seconds', 'rows', 'cells', 'peak')
+)
+
+
+class _NullStage(object):
+    """
+        Stage of disabled profiler, it does nothing
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def __setattr__(self, name, value):
+        # rows and cells set inside the block are ignored
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+def stage(profiler, name, **info):
+    """
+    Stage of profiler or shared no-op stage if profiler is None, so disabled profiling costs one call
+
+        with stage(self._profiler, 'render'):
+            ...
+
+    :param profiler: Profiler or None
+    :param name: str, name of stage
+    :param info: row_group, column_group, rows, cells, see Profiler.stage
+    """
+    if profiler is None:
+        return NULL_STAGE
+    return profiler.stage(name, **info)
+
+
+class _Stage(object):
+
+    def __init__(self, profiler, name, table, row_group, column_group, rows, cells):
+        self.profiler = profiler
+        self.name = name
+        self.table = table
+        self.row_group = row_group
+        self.column_group = column_group
+        self.rows = rows
+        self.cells = cells
+        self.peak = 0
+        self._current = 0
+        self._started = None
+
+    def __enter__(self):
+        self.profiler._enter(self)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        seconds = time.perf_counter() - self._started
+        self.profiler._exit(self, seconds)
+        return False
+
+
+class Profiler(object):
+    """
+        Wall time, number of rows and cells and peak allocation of stages of crosstabs.
+
+        One profiler may be passed to any number of tables, e.g. to all tables of TableBook,
+        its records are aggregated across the whole batch. Nested stages inherit table
+        and (row_group, column_group) of enclosing stage, time of nested stage is included in time of enclosing one.
+        Peak allocation is traced by tracemalloc only if memory is True, because tracing slows down allocations.
+
+        profiler = Profiler()
+        for table in TableBook(df, banner='q2 + q3', stubs=stubs, weight='w', profiler=profiler):
+            pass
+        profiler.summary()
+    """
+
+    def __init__(self, memory=False, callbacks=None):
+        """
+
+        :param memory: bool, trace peak allocation of every stage
+        :param callbacks: list of callables, every one is called with StageRecord when stage is finished
+        :return: instance of Profiler
+        """
+        self.memory = memory
+        self.callbacks = list(callbacks or [])
+        self.records = []
+        self._tables = []
+        self._stack = []
+        self._tracing = False
+
+    def table(self, expression):
+        """
+        Register table
+
+        :param expression: str, expression of table
+        :return: int, id of table in records
+        """
+        self._tables.append(expression)
+        return len(self._tables) - 1
+
+    def stage(self, name, table=None, row_group=None, column_group=None, rows=None, cells=None):
+        """
+        Context manager of stage, its rows and cells may be set inside the block
+
+        :param name: str, name of stage
+        :param table: int, id of table, see table
+        :param row_group: int, index of row group
+        :param column_group: int, index of column group
+        :param rows: int, number of respondents processed by stage
+        :param cells: int, number of cells produced by stage
+        """
+        if self._stack:
+            parent = self._stack[-1]
+            table = parent.table if table is None else table
+            row_group = parent.row_group if row_group is None else row_group
+            column_group = parent.column_group if column_group is None else column_group
+        return _Stage(self, name, table, row_group, column_group, rows, cells)
+
+    def _update_peaks(self):
+        _, peak = tracemalloc.get_traced_memory()
+        # peak of nested stage is peak of every enclosing stage too
+        for item in self._stack:
+            item.peak = max(item.peak, peak - item._current)
+        tracemalloc.reset_peak()
+
+    def _enter(self, item):
+        if self.memory:
+            if not self._stack and not tracemalloc.is_tracing():
+                tracemalloc.start()
+                self._tracing = True
+            self._update_peaks()
+            item._current = tracemalloc.get_traced_memory()[0]
+        self._stack.append(item)
+
+    def _exit(self, item, seconds):
+        if self.memory:
+            self._update_peaks()
+        self._stack.pop()
+
+        if self.memory and not self._stack and self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+
+        record = StageRecord(
+            item.table, None if item.table is None else self._tables[item.table], item.name,
+            item.row_group, item.column_group, seconds, item.rows, item.cells, item.peak if self.memory else None
+        )
+        self.records.append(record)
+        for callback in self.callbacks:
+            callback(record)
+
+    def frame(self, table=None):
+        """
+        :param table: int, id of table, default is all tables
+        :return: pd.DataFrame of records
+        """
+        records = self.records if table is None else [r for r in self.records if r.table == table]
+        return pd.DataFrame(records, columns=StageRecord._fields)
+
+    def summary(self, by='stage'):
+        """
+        Records aggregated by columns, e.g. by stage across all tables of batch
+
+        :param by: str or list of columns of records
+        :return: pd.DataFrame with calls, total, mean and max seconds, total rows and cells and max peak
+        """
+        return self.frame().groupby(by, sort=False, dropna=False).agg(
+            calls=('seconds', 'size'),
+            seconds=('seconds', 'sum'),
+            mean=('seconds', 'mean'),
+            max=('seconds', 'max'),
+            rows=('rows', 'sum'),
+            cells=('cells', 'sum'),
+            peak=('peak', 'max'),
+        ).sort_values('seconds', ascending=False)
+
+    def subset(self, table):
+        """
+        Profiler with records of one table only, e.g. to send them from worker process
+
+        :return: Profiler
+        """
+        profiler = Profiler(memory=self.memory)
+        profiler.table(self._tables[table])
+        profiler.records = [r._replace(table=0) for r in self.records if r.table == table]
+        return profiler
+
+    def merge(self, other):
+        """
+        Add tables and records of other profiler, ids of its tables are shifted
+
+        :param other: Profiler
+        :return: int, id of the first table of other in this profiler
+        """
+        offset = len(self._tables)
+        self._tables.extend(other._tables)
+        self.records.extend(r._replace(table=r.table + offset) if r.table is not None else r for r in other.records)
+        return offset
+
+    def reset(self):
+        self.records = []
+        self._tables = []
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getstate__(self):
+        # callbacks are usually not picklable and are not called in other process
+        state = self.__dict__.copy()
+        state['callbacks'] = []
+        state['_stack'] = []
+        state['_tracing'] = False
+        return state
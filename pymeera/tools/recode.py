@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from pymeera.utils.support import fingerprint
+from pymeera.tools.counting import Factor, factorize
+
+
+def _lookup(codes, table):
+    """
+    Map codes through lookup table, missing code -1 stays missing
+    """
+    # the last element answers for code -1
+    return np.append(table, -1)[codes]
+
+
+def _values(factor):
+    """
+    Values of respondents as float array, NaN for missing answers
+    """
+    return np.append(factor.uniques.astype(np.float64), np.nan)[factor.codes]
+
+
+class RecodeStep(object):
+    """
+        Definition of derived variable. Step is evaluated on codes of its inputs,
+        it does not depend on data, so the same step can be applied to other waves of survey.
+    """
+
+    def __init__(self, variable_id, inputs):
+        """
+
+        :param variable_id: str, derived variable
+        :param inputs: list of variable_ids step depends on
+        """
+        self.variable_id = variable_id
+        self.inputs = list(inputs)
+
+    def evaluate(self, codebook):
+        """
+        :param codebook: CodeBook that gives factors of inputs
+        :return: Factor of derived variable
+        """
+        raise NotImplementedError
+
+    def __repr__(self):
+        return '%s(%s <- %s)' % (type(self).__name__, self.variable_id, ', '.join(self.inputs))
+
+
+class ValueMap(RecodeStep):
+    """
+        Map values of variable to new values, e.g. {1: 1, 2: 1, 3: 2}
+    """
+
+    def __init__(self, variable_id, source, mapping, keep_unmapped=False):
+        """
+
+        :param source: str, variable to recode
+        :param mapping: dict, {value: new value}, None as new value means missing answer
+        :param keep_unmapped: bool, if True values absent in mapping are kept, otherwise they are missing
+        """
+        super(ValueMap, self).__init__(variable_id, [source])
+        self.mapping = mapping
+        self.keep_unmapped = keep_unmapped
+
+    def evaluate(self, codebook):
+        source = codebook.factor(self.inputs[0])
+        new_values = [self.mapping.get(value, value if self.keep_unmapped else None) for value in source.uniques]
+
+        values = list(OrderedDict.fromkeys(v for v in new_values if v is not None))
+        try:
+            values = sorted(values)
+            uniques = np.asarray(values)
+        except TypeError:
+            # values of different types, e.g. numbers and strings, are kept as is in order of source values
+            uniques = np.empty(len(values), dtype=object)
+            uniques[:] = values
+
+        positions = dict((v, idx) for idx, v in enumerate(values))
+        table = np.array([-1 if v is None else positions[v] for v in new_values], dtype=np.int64)
+        return Factor(self.variable_id, _lookup(source.codes, table), uniques)
+
+
+class RangeBins(RecodeStep):
+    """
+        Bin numeric values into ranges [edge_k, edge_k+1), bins are numbered from 1
+    """
+
+    def __init__(self, variable_id, source, edges, values=None):
+        """
+
+        :param source: str, numeric variable
+        :param edges: list of increasing bin edges, values out of edges are missing
+        :param values: list of values of bins, default is 1, 2, ...
+        """
+        super(RangeBins, self).__init__(variable_id, [source])
+        self.edges = list(edges)
+        self.values = list(values) if values is not None else list(range(1, len(self.edges)))
+
+        if len(self.values) != len(self.edges) - 1:
+            raise Exception('Number of values must be equal to number of bins')
+
+    def evaluate(self, codebook):
+        source = codebook.factor(self.inputs[0])
+        bins = np.digitize(source.uniques.astype(np.float64), self.edges) - 1
+        bins[(bins < 0) | (bins >= len(self.values))] = -1
+        return Factor(self.variable_id, _lookup(source.codes, bins), np.asarray(self.values))
+
+
+class Net(RecodeStep):
+    """
+        Net of several variables, e.g. "any of brands" for checkbox question:
+        1 if respondent has any of values in any of sources, 0 if respondent answered sources
+        but without those values, missing if respondent did not answer
+    """
+
+    def __init__(self, variable_id, sources, values=None):
+        """
+
+        :param sources: list of variables
+        :param values: list of values to net, default is any answer
+        """
+        super(Net, self).__init__(variable_id, sources)
+        self.values = None if values is None else list(values)
+
+    def evaluate(self, codebook):
+        answered = np.zeros(len(codebook), dtype=bool)
+        matched = np.zeros(len(codebook), dtype=bool)
+
+        for variable_id in self.inputs:
+            source = codebook.factor(variable_id)
+            if self.values is None:
+                is_value = np.ones(len(source), dtype=bool)
+            else:
+                is_value = np.isin(source.uniques, self.values)
+            answered |= source.codes >= 0
+            matched |= np.append(is_value, False)[source.codes]
+
+        codes = np.where(answered, matched.astype(np.int8), np.int8(-1))
+        return Factor(self.variable_id, codes, np.array([0, 1]))
+
+
+class Computed(RecodeStep):
+    """
+        Variable computed by vectorized function of inputs,
+        function gets float arrays with NaN for missing answers and returns array of values
+    """
+
+    def __init__(self, variable_id, sources, function):
+        """
+
+        :param sources: list of variables
+        :param function: callable, e.g. lambda q1, q2: q1 + q2
+        """
+        super(Computed, self).__init__(variable_id, sources)
+        self.function = function
+
+    def evaluate(self, codebook):
+        result = self.function(*[_values(codebook.factor(v)) for v in self.inputs])
+        return factorize(self.variable_id, pd.Series(np.asarray(result)))
+
+
+def make_step(variable_id, source=None, sources=None, mapping=None, edges=None, values=None, function=None, **kwargs):
+    """
+    Step by its arguments:
+        mapping – ValueMap, edges – RangeBins, function – Computed, otherwise Net
+    """
+    if mapping is not None:
+        return ValueMap(variable_id, source, mapping, **kwargs)
+    if edges is not None:
+        return RangeBins(variable_id, source, edges, values=values)
+    if function is not None:
+        return Computed(variable_id, sources or [source], function)
+    if sources is not None:
+        return Net(variable_id, sources, values=values)
+    raise Exception('Recode step is not defined')
+
+
+class Recoder(object):
+    """
+        Derived variables of survey data.
+        Variable is evaluated only when it is referenced (see CodeBook) and the result is cached
+        until any of its inputs changes.
+    """
+
+    def __init__(self):
+        self.steps = OrderedDict()
+        self._cache = {}
+
+    def __contains__(self, variable_id):
+        return variable_id in self.steps
+
+    @property
+    def variables(self):
+        return list(self.steps)
+
+    def add(self, step):
+        for variable_id in step.inputs:
+            if variable_id == step.variable_id:
+                raise Exception('Variable "%s" can not be derived from itself' % (variable_id, ))
+
+        self.steps[step.variable_id] = step
+        self._cache.pop(step.variable_id, None)
+
+    def _evaluate(self, variable_id, codebook):
+        step = self.steps[variable_id]
+        key = tuple(codebook.fingerprint(v) for v in step.inputs)
+
+        cached = self._cache.get(variable_id)
+        if cached is None or cached[0] != key:
+            factor = step.evaluate(codebook)
+            cached = (key, factor, fingerprint(factor.codes) + fingerprint(factor.uniques))
+            self._cache[variable_id] = cached
+        return cached
+
+    def fingerprint(self, variable_id, codebook):
+        """
+        Content hash of derived variable, it is evaluated if needed
+
+        :return: str
+        """
+        return self._evaluate(variable_id, codebook)[2]
+
+    def factor(self, variable_id, codebook):
+        """
+        :param variable_id: str, derived variable
+        :param codebook: CodeBook of source data
+        :return: Factor
+        """
+        return self._evaluate(variable_id, codebook)[1]
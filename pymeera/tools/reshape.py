@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+"""
+    Reshape of loop and grid questions between wide (variable per child) and long (case per child) layouts.
+
+    Children of every question are stacked into one (respondents, cases) array and raveled,
+    so long layout is built by strided numpy reshapes without loops over respondents.
+"""
+
+from __future__ import print_function, unicode_literals, division
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+
+def _child_id(child):
+    return child if isinstance(child, str) else child.variable_id
+
+
+def _case_of(question_id, variable_id, separator):
+    """
+    Case of child variable is its suffix after question id, e.g. q12_3 -> 3
+    """
+    prefix = question_id + separator
+    return variable_id[len(prefix):] if variable_id.startswith(prefix) else variable_id
+
+
+def grid(structure, questions=None):
+    """
+    Children of loop and grid questions by hierarchical structure
+
+    :param structure: SurveyStructure, plain structure is converted by to_hierarchical
+    :param questions: list of question ids, default is all questions with several children
+    :return: tuple, (OrderedDict {question_id: {case: variable_id}}, list of cases in order of appearance)
+    """
+    if not structure.is_hierarchical:
+        structure = structure.to_hierarchical()
+
+    if questions is None:
+        questions = [
+            q for q in structure.get_all_variables_ids()
+            if len(structure.get_variable_by_id(q).variable_children) > 1
+        ]
+
+    children, cases = OrderedDict(), OrderedDict()
+    for question_id in questions:
+        if question_id not in structure:
+            raise Exception('Question "%s" is not defined in structure' % (question_id, ))
+
+        question_cases = OrderedDict()
+        for child in structure.get_variable_by_id(question_id).variable_children:
+            variable_id = _child_id(child)
+            question_cases[_case_of(question_id, variable_id, structure.multiple_choices_separator)] = variable_id
+        children[question_id] = question_cases
+        cases.update((case, None) for case in question_cases)
+
+    return children, list(cases)
+
+
+def _stack(columns, size):
+    """
+    Stack columns into raveled (size, len(columns)) array, None column is missing
+
+    :return: np.array or pd.Categorical
+    """
+    present = [c for c in columns if c is not None]
+
+    categories = None
+    if present and all(isinstance(c.dtype, pd.CategoricalDtype) for c in present):
+        categories = present[0].cat.categories
+        if not all(c.cat.categories.equals(categories) for c in present[1:]):
+            categories = None
+
+    if categories is not None:
+        stacked = np.full((size, len(columns)), -1, dtype=present[0].cat.codes.dtype)
+        for idx, column in enumerate(columns):
+            if column is not None:
+                stacked[:, idx] = column.cat.codes.to_numpy()
+        return pd.Categorical.from_codes(stacked.ravel(), categories=categories)
+
+    arrays = [None if c is None else np.asarray(c) for c in columns]
+    dtype = np.result_type(*[a.dtype for a in arrays if a is not None]) if present else np.float64
+    if len(present) < len(columns) and dtype.kind in 'iub':
+        dtype = np.dtype(np.float64)
+
+    stacked = np.empty((size, len(columns)), dtype=dtype)
+    for idx, array in enumerate(arrays):
+        stacked[:, idx] = np.nan if array is None else array
+    # row-major (size, cases) buffer: raveled it is already ordered by respondent, then by case
+    return stacked.ravel()
+
+
+def melt(data, structure, questions=None, id_vars=None, respondent_id='respondent', case_id='case'):
+    """
+    Variables to cases: every child of loop or grid question becomes case of respondent
+
+    Example:
+        q1_1, q1_2, q2_1, q2_2 (brand x attribute grid) -> respondent, case, q1, q2
+
+    :param data: pd.DataFrame or ColumnStore
+    :param structure: SurveyStructure
+    :param questions: list of question ids, default is all questions with several children
+    :param id_vars: list of variables repeated for every case, e.g. weight
+    :param respondent_id: str, column of respondent index
+    :param case_id: str, column of case (suffix of child variable)
+    :return: pd.DataFrame
+    """
+    children, cases = grid(structure, questions)
+    if not children:
+        raise Exception('There are no questions to melt')
+
+    size = len(data)
+    index = data.index.to_numpy() if hasattr(data, 'index') else np.arange(size)
+
+    result = OrderedDict()
+    result[respondent_id] = np.repeat(index, len(cases))
+    result[case_id] = pd.Categorical.from_codes(
+        np.tile(np.arange(len(cases), dtype=np.min_scalar_type(-len(cases))), size), categories=cases
+    )
+
+    for variable_id in id_vars or []:
+        column = data[variable_id]
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            result[variable_id] = pd.Categorical.from_codes(
+                np.repeat(column.cat.codes.to_numpy(), len(cases)), categories=column.cat.categories
+            )
+        else:
+            result[variable_id] = np.repeat(column.to_numpy(), len(cases))
+
+    for question_id, question_cases in children.items():
+        for variable_id in question_cases.values():
+            if variable_id not in data.columns:
+                raise Exception('Variable "%s" is not defined in columns' % (variable_id, ))
+        result[question_id] = _stack(
+            [data[question_cases[case]] if case in question_cases else None for case in cases], size
+        )
+
+    return pd.DataFrame(result, columns=list(result))
+
+
+def _scatter(column, respondents, cases, shape):
+    """
+    Place long column to (respondents, cases) array, missing cells are NaN (or code -1)
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        codes = np.full(shape, -1, dtype=column.cat.codes.dtype)
+        codes[respondents, cases] = column.cat.codes.to_numpy()
+        return codes, column.cat.categories
+
+    values = column.to_numpy()
+    if values.dtype.kind in 'iub':
+        dtype = np.dtype(np.float64)
+    elif values.dtype.kind in 'fcMm':
+        dtype = values.dtype
+    else:
+        dtype = np.dtype(object)
+    wide = np.full(shape, np.nan, dtype=dtype) if dtype.kind not in 'Mm' else np.full(shape, 'NaT', dtype=dtype)
+    wide[respondents, cases] = values
+    return wide, None
+
+
+def _ordered_respondents(respondents, cases, number_of_cases):
+    """
+    Respondents of long layout, if every respondent has all cases in the same order one after another,
+    so columns are (respondents, cases) arrays raveled in row-major order
+
+    :return: np.array of respondents or None
+    """
+    size = len(respondents)
+    if not number_of_cases or size % number_of_cases:
+        return None
+    if not (cases.reshape(-1, number_of_cases) == np.arange(number_of_cases)).all():
+        return None
+
+    heads = respondents[::number_of_cases]
+    if not (respondents.reshape(-1, number_of_cases) == heads[:, np.newaxis]).all():
+        return None
+    if pd.isnull(heads).any() or not pd.Index(heads).is_unique:
+        return None
+    return heads
+
+
+def pivot(data, questions=None, id_vars=None, respondent_id='respondent', case_id='case', separator='_'):
+    """
+    Cases to variables: inverse of melt, every case of respondent becomes child variable question_case
+
+    If data is complete and ordered by respondent and case (e.g. result of melt) columns are reshaped as views,
+    otherwise values are scattered to their cells.
+
+    :param data: pd.DataFrame, long layout
+    :param questions: list of columns to spread, default is all except respondent, case and id_vars
+    :param id_vars: list of variables, constant for respondent, value of first case is taken
+    :param respondent_id: str, column of respondent index
+    :param case_id: str, column of case
+    :param separator: str, separator of question and case in names of children
+    :return: pd.DataFrame indexed by respondent
+    """
+    id_vars = list(id_vars or [])
+    if questions is None:
+        questions = [c for c in data.columns if c not in [respondent_id, case_id] + id_vars]
+
+    cases, case_values = pd.factorize(data[case_id], sort=False)
+    if (cases < 0).any():
+        raise Exception('Case must be defined for every row')
+
+    index = _ordered_respondents(data[respondent_id].to_numpy(), cases, len(case_values))
+    complete = index is not None
+    if not complete:
+        respondents, index = pd.factorize(data[respondent_id], sort=False)
+        if (respondents < 0).any():
+            raise Exception('Respondent must be defined for every row')
+
+        flat = respondents.astype(np.int64) * len(case_values) + cases
+        if len(pd.unique(flat)) != len(flat):
+            raise Exception('Case is defined several times for respondent')
+    shape = (len(index), len(case_values))
+
+    result = OrderedDict()
+    if id_vars:
+        # the first case of respondent
+        first = np.arange(0, len(data), shape[1]) if complete else np.unique(respondents, return_index=True)[1]
+        for variable_id in id_vars:
+            result[variable_id] = data[variable_id].iloc[first].array
+
+    for question_id in questions:
+        column = data[question_id]
+        if complete:
+            if isinstance(column.dtype, pd.CategoricalDtype):
+                wide, categories = column.cat.codes.to_numpy().reshape(shape), column.cat.categories
+            else:
+                wide, categories = column.to_numpy().reshape(shape), None
+        else:
+            wide, categories = _scatter(column, respondents, cases, shape)
+
+        for idx, case in enumerate(case_values):
+            values = wide[:, idx]
+            if categories is not None:
+                values = pd.Categorical.from_codes(values, categories=categories)
+            result['%s%s%s' % (question_id, separator, case)] = values
+
+    return pd.DataFrame(result, columns=list(result), index=pd.Index(index, name=respondent_id))
@@ -0,0 +1,284 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import asyncio
+import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from pymeera.utils.exprparser import Expression, combine_filters, filter_text, split_filter
+
+
+def _count_batch(survey, expressions, kwargs):
+    """
+    Count tables of batch in one pass over shared codes, see TableBook.
+    Lazy tables are counted here too, so event loop never counts them
+
+    :return: list of Crosstab or Exception, one per expression
+    """
+    results = []
+    try:
+        for table in survey.cross(list(expressions), **kwargs):
+            results.append(table.evaluate())
+    except Exception:
+        # invalid table stops the book, the rest of tables are counted one by one
+        for expression in expressions[len(results):]:
+            try:
+                results.append(survey.cross(expression, **kwargs).evaluate())
+            except Exception as e:
+                results.append(e)
+    return results
+
+
+class TableService(object):
+    """
+        Asyncio front-end of SurveyData.cross for many concurrent clients, e.g. interactive dashboard.
+
+        Requests that arrive within window are collected together, duplicates are counted once
+        and requests with the same banner, filter and options are counted as one batch (see TableBook)
+        on executor, so event loop is never blocked by counting. Number of batches counted at once is limited
+        by max_in_flight, number of waiting requests by max_pending: when queue is full, callers wait.
+        Duplicate requests get the same Crosstab, it must not be modified.
+
+        async with TableService(sd, weight='w') as service:
+            table = await service.cross('q1 by q2 + q3')
+    """
+
+    def __init__(self, survey, window=.005, max_batch=256, max_pending=1024, max_in_flight=2, executor=None,
+                 **kwargs):
+        """
+
+        :param survey: SurveyData
+        :param window: float, seconds to wait for more requests after the first one
+        :param max_batch: int, maximum number of requests collected in one window
+        :param max_pending: int, maximum number of requests waiting in queue
+        :param max_in_flight: int, maximum number of batches counted at once
+        :param executor: concurrent.futures.Executor, default is thread pool of max_in_flight threads
+        :param kwargs: Crosstab arguments applied to every request
+        :return: instance of TableService
+        """
+        self.survey = survey
+        self.window = window
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.max_in_flight = max_in_flight
+        self.kwargs = kwargs
+        self.stats = OrderedDict([('requests', 0), ('duplicates', 0), ('batches', 0), ('tables', 0)])
+
+        self._executor = executor
+        self._own_executor = executor is None
+        self._queue = None
+        self._in_flight = None
+        self._dispatcher = None
+        self._tasks = set()
+
+    async def start(self):
+        if self._dispatcher is not None:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_in_flight)
+        self._queue = asyncio.Queue(maxsize=self.max_pending)
+        self._in_flight = asyncio.Semaphore(self.max_in_flight)
+        self._dispatcher = asyncio.ensure_future(self._dispatch())
+
+    async def stop(self):
+        """
+        Finish counted batches, requests that are not counted yet are cancelled
+        """
+        if self._dispatcher is None:
+            return
+        self._dispatcher.cancel()
+        try:
+            await self._dispatcher
+        except asyncio.CancelledError:
+            pass
+        self._dispatcher = None
+
+        if self._tasks:
+            await asyncio.gather(*self._tasks)
+        while not self._queue.empty():
+            self._queue.get_nowait()[2].cancel()
+
+        if self._own_executor:
+            self._executor.shutdown()
+            self._executor = None
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    async def cross(self, expression, **kwargs):
+        """
+        Table of expression, it waits while queue of requests is full
+
+        :param expression: str, expression of single table
+        :param kwargs: Crosstab arguments, they take precedence over arguments of service
+        :return: Crosstab
+        """
+        if self._dispatcher is None:
+            raise Exception('Service is not started')
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((expression, dict(self.kwargs, **kwargs), future))
+        return await future
+
+    def client(self):
+        """
+        :return: TableClient of the service
+        """
+        return TableClient(self)
+
+    def _keys(self, expression, kwargs):
+        """
+        Key of request and key of its batch: requests of batch share banner, filter and options
+
+        :return: tuple, (expression with expanded patterns and without filter clause, parsed filter of expression
+            and filter argument, request key, batch key)
+        """
+        if self.survey.structure is not None:
+            expression = self.survey.structure.expand(expression)
+        parsed = Expression.parse(expression=expression)
+
+        condition = kwargs.get('filter')
+        if condition is not None and not isinstance(condition, list):
+            condition = Expression.parse_filter(condition)
+        condition = combine_filters(parsed['filter'], condition)
+        # filter of batch is passed as argument, so the same filter may be written either way
+        expression = ' '.join(split_filter(expression)[0].split())
+
+        # objects such as cache are the same options only if they are the same objects
+        options = json.dumps(sorted((k, v) for k, v in kwargs.items() if k != 'filter'), default=lambda o: id(o))
+        banner = json.dumps([parsed['columns'], parsed['additional_axis']])
+        text = None if condition is None else filter_text(condition)
+
+        return expression, condition, json.dumps([parsed['rows'], banner, text, options]), (banner, text, options)
+
+    def _plan(self, requests):
+        """
+        Batches of requests with duplicates merged
+
+        :param requests: list of (expression, kwargs, future)
+        :return: list of (kwargs, OrderedDict of {request key: (expression, list of futures)})
+        """
+        batches = OrderedDict()
+        for expression, kwargs, future in requests:
+            self.stats['requests'] += 1
+            if future.done():
+                # caller is not waiting anymore
+                continue
+            try:
+                expression, condition, request_key, batch_key = self._keys(expression, kwargs)
+            except Exception as e:
+                future.set_exception(e)
+                continue
+
+            kwargs = dict(kwargs, filter=condition)
+            _, batch = batches.setdefault(batch_key, (kwargs, OrderedDict()))
+            if request_key in batch:
+                self.stats['duplicates'] += 1
+            batch.setdefault(request_key, (expression, []))[1].append(future)
+        return list(batches.values())
+
+    async def _collect(self):
+        """
+        Requests arrived within window after the first one
+        """
+        loop = asyncio.get_running_loop()
+        requests = [await self._queue.get()]
+        deadline = loop.time() + self.window
+
+        try:
+            while len(requests) < self.max_batch:
+                if not self._queue.empty():
+                    requests.append(self._queue.get_nowait())
+                    continue
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    requests.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+        except asyncio.CancelledError:
+            for _, _, future in requests:
+                future.cancel()
+            raise
+        return requests
+
+    async def _dispatch(self):
+        while True:
+            batches = self._plan(await self._collect())
+            while batches:
+                # the next batch waits for free slot, so queue fills up and callers wait
+                try:
+                    await self._in_flight.acquire()
+                except asyncio.CancelledError:
+                    for _, batch in batches:
+                        for _, futures in batch.values():
+                            for future in futures:
+                                future.cancel()
+                    raise
+
+                kwargs, batch = batches.pop(0)
+                task = asyncio.ensure_future(self._run(kwargs, batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, kwargs, batch):
+        try:
+            expressions = [expression for expression, _ in batch.values()]
+            self.stats['batches'] += 1
+            self.stats['tables'] += len(expressions)
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self._executor, _count_batch, self.survey, expressions, kwargs
+                )
+            except Exception as e:
+                results = [e] * len(expressions)
+
+            for (_, futures), result in zip(batch.values(), results):
+                for future in futures:
+                    if future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        future.set_exception(result)
+                    else:
+                        future.set_result(result)
+        finally:
+            self._in_flight.release()
+
+
+class TableClient(object):
+    """
+        In-process client of TableService, it is used the same way as client of remote service,
+        so dashboards can be tested locally without network
+
+        async with TableService(sd) as service:
+            client = service.client()
+            tables = await client.gather(['q1 by q2', 'q3 by q2'], weight='w')
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    async def cross(self, expression, **kwargs):
+        """
+        :return: Crosstab
+        """
+        return await self.service.cross(expression, **kwargs)
+
+    async def gather(self, expressions, return_exceptions=False, **kwargs):
+        """
+        Tables of concurrent requests
+
+        :param expressions: list of str
+        :param return_exceptions: bool, errors of requests are returned in place of tables
+        :param kwargs: Crosstab arguments of every request
+        :return: list of Crosstab
+        """
+        return await asyncio.gather(*[self.service.cross(e, **kwargs) for e in expressions],
+                                    return_exceptions=return_exceptions)
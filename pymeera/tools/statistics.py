@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+    Statistics of crosstab derived from its count tensor (see counting.CrossCounts),
+    raw respondent data is not scanned again.
+
+    Every function gets block of weighted counts with shape (number of row values, number of columns)
+    and returns values for every column at once.
+"""
+
+from __future__ import print_function, unicode_literals, division
+
+import numpy as np
+
+
+def column_percentage(cells, base):
+    """
+    Share of cell in base of column
+
+    :param cells: 2-dimensional np.array
+    :param base: 1-dimensional np.array, base of every column
+    :return: 2-dimensional np.array
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return cells / base
+
+
+def row_percentage(cells):
+    """
+    Share of cell in total of its row within block
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return cells / np.nansum(cells, axis=1, keepdims=True)
+
+
+def table_percentage(cells):
+    """
+    Share of cell in total of block
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return cells / np.nansum(cells)
+
+
+def moments(values, cells):
+    """
+    Weighted mean and variance of values in every column
+
+    Variance is unbiased for frequency weights: sum(w * (x - mean)^2) / (sum(w) - 1)
+
+    :param values: 1-dimensional np.array of numeric values of rows
+    :param cells: 2-dimensional np.array of weighted counts
+    :return: tuple of 1-dimensional np.arrays, (total, mean, variance)
+    """
+    values = values.astype(np.float64)[:, np.newaxis]
+    total = cells.sum(axis=0)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = (cells * values).sum(axis=0) / total
+        variance = (cells * (values - mean) ** 2).sum(axis=0) / (total - 1)
+
+    variance[total <= 1] = np.nan
+    return total, mean, variance
+
+
+def median(values, cells):
+    """
+    Weighted median of values in every column:
+    the smallest value with cumulative count of at least half of column total
+
+    :param values: 1-dimensional np.array of sorted numeric values of rows
+    :param cells: 2-dimensional np.array of weighted counts
+    :return: 1-dimensional np.array
+    """
+    cumulative = np.cumsum(cells, axis=0)
+    total = cumulative[-1] if len(cumulative) else np.zeros(cells.shape[1])
+
+    position = (cumulative >= total / 2.).argmax(axis=0)
+    result = values.astype(np.float64)[position]
+    result[total <= 0] = np.nan
+    return result
+
+
+def effective_base(total, squares):
+    """
+    Kish effective base: (sum of weights)^2 / sum of squared weights
+
+    :param total: 1-dimensional np.array, sum of weights of every column
+    :param squares: 1-dimensional np.array, sum of squared weights of every column
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return total ** 2 / squares
+
+
+def sampling_error(variance, total, squares):
+    """
+    Standard error of mean based on effective base
+
+    :return: 1-dimensional np.array
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.sqrt(variance / effective_base(total, squares))
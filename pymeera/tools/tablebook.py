@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+from pymeera.utils.exprparser import Expression, combine_filters, filter_variables
+from pymeera.utils.support import flatten
+from pymeera.tools.counting import CodeBook
+from pymeera.tools.crosstab import Crosstab
+
+
+class TableBook(object):
+    """
+        Batch of crosstabs over the same data.
+
+        All tables share one CodeBook, so every variable is factorized once
+        and combined codes and bases of banner groups are computed once for the whole book.
+        Tables are evaluated lazily one by one while iterating,
+        every table is counted before it is yielded, even if lazy argument is set,
+        because codes of its variables are released right after that.
+
+        book = TableBook(df, banner='q2 + q3 > q4', stubs=['q1', 'q5', 'q6_1 + q6_2'], weight='w')
+        for table in book:
+            print(table)
+    """
+
+    def __init__(self, data, expressions=None, banner=None, stubs=None, **kwargs):
+        """
+
+        :param data: pd.DataFrame or CodeBook
+        :param expressions: list of str, expressions of tables
+        :param banner: str, columns part of expression shared by all stubs
+        :param stubs: list of str, rows parts of expressions
+        :param kwargs: Crosstab arguments applied to every table
+        :return: instance of TableBook
+        """
+        if expressions is None:
+            expressions = []
+        elif not isinstance(expressions, (list, tuple)):
+            expressions = [expressions]
+
+        if stubs:
+            if banner is None:
+                raise Exception('Banner must be defined for stubs')
+            expressions = list(expressions) + ['%s by %s' % (stub, banner) for stub in stubs]
+
+        if not expressions:
+            raise Exception('Table book is empty')
+
+        self.codebook = data if isinstance(data, CodeBook) else CodeBook(data)
+        self.data = self.codebook.data
+        self.expressions = list(expressions)
+        self.kwargs = kwargs
+
+    def __len__(self):
+        return len(self.expressions)
+
+    def _variables(self, expression):
+        """
+        Variables referenced by table of expression, including variables of its filter and of filter argument
+        """
+        parsed = Expression.parse(expression=expression)
+        condition = self.kwargs.get('filter')
+        if condition is not None and not isinstance(condition, list):
+            condition = Expression.parse_filter(condition)
+        return (flatten(parsed['rows']) + flatten(parsed['columns']) + flatten(parsed['additional_axis'])
+                + filter_variables(combine_filters(parsed['filter'], condition)))
+
+    def _last_usage(self):
+        """
+        Index of the last expression that references variable
+        """
+        last_usage = {}
+        for idx, expression in enumerate(self.expressions):
+            for variable_id in self._variables(expression):
+                last_usage[variable_id] = idx
+        return last_usage
+
+    def __iter__(self):
+        last_usage = self._last_usage()
+
+        for idx, expression in enumerate(self.expressions):
+            if self.kwargs.get('engine') == 'pandas':
+                table = Crosstab(self.data, expression=expression, **self.kwargs)
+            else:
+                table = Crosstab(self.codebook, expression=expression, **self.kwargs)
+            # lazy table counted after drop would factorize its variables again and keep them
+            table.evaluate()
+
+            # keep memory bounded: codes of variables that are not needed anymore are released
+            self.codebook.drop([v for v, last_idx in last_usage.items() if last_idx == idx])
+
+            yield table
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import numpy as np
+
+from pymeera.tools.counting import CodeBook
+
+
+class RakingResult(object):
+    """
+        Weights computed by rake and quality of weighting
+    """
+
+    def __init__(self, weights, iterations, converged, max_error):
+        """
+
+        :param weights: np.array of float, one weight per respondent
+        :param iterations: int, number of iterations made
+        :param converged: bool
+        :param max_error: float, maximum absolute difference between achieved and target proportions
+        """
+        self.weights = weights
+        self.iterations = iterations
+        self.converged = converged
+        self.max_error = max_error
+
+    @property
+    def efficiency(self):
+        """
+        Weighting efficiency: (sum of weights)^2 / (n * sum of squared weights), 1 for equal weights
+        """
+        return self.weights.sum() ** 2 / (len(self.weights) * (self.weights ** 2).sum())
+
+    @property
+    def design_effect(self):
+        """
+        Kish design effect due to weighting: 1 + cv^2 of weights
+        """
+        return 1. / self.efficiency
+
+    def __repr__(self):
+        return 'RakingResult(iterations=%d, converged=%s, efficiency=%.4f, design_effect=%.4f)' % (
+            self.iterations, self.converged, self.efficiency, self.design_effect
+        )
+
+
+class _Margin(object):
+    __slots__ = ['variable_id', 'index', 'codes', 'target']
+
+    def __init__(self, variable_id, index, codes, target):
+        self.variable_id = variable_id
+        self.index = index
+        self.codes = codes
+        self.target = target
+
+
+def _margins(codebook, targets):
+    margins = []
+    for variable_id, target in targets.items():
+        factor = codebook.factor(variable_id)
+
+        # uniques of compact data include unobserved values of its domain, e.g. labeled "Refused",
+        # so values are checked by respondents, not by uniques
+        observed = np.bincount(factor.codes[factor.codes >= 0], minlength=len(factor)) > 0
+        observed_values = factor.uniques[observed].tolist()
+
+        missing = [value for value in observed_values if value not in target]
+        if missing:
+            raise Exception('Target of variable "%s" is not defined for values %s' % (variable_id, missing))
+        unknown = [value for value, share in target.items() if share and value not in set(observed_values)]
+        if unknown:
+            raise Exception('Variable "%s" has no respondents with values %s' % (variable_id, unknown))
+
+        # values without respondents have zero or no target
+        shares = np.array([target.get(value, 0.) for value in factor.uniques.tolist()], dtype=np.float64)
+        shares /= shares.sum()
+
+        # respondents without answer are not adjusted by margin
+        index = None if factor.codes.min(initial=0) >= 0 else np.flatnonzero(factor.codes >= 0)
+        codes = factor.codes if index is None else factor.codes[index]
+        margins.append(_Margin(variable_id, index, codes.astype(np.intp), shares))
+    return margins
+
+
+def _trim(weights, lower, upper, max_iterations=100):
+    """
+    Clip weights to bounds relative to their mean in place,
+    clipping shifts the mean, so it is repeated until weights are within bounds
+    """
+    for _ in range(max_iterations):
+        mean = weights.mean()
+        low = None if lower is None else lower * mean
+        high = None if upper is None else upper * mean
+        if (low is None or weights.min() >= low * (1 - 1e-12)) and (high is None or weights.max() <= high * (1 + 1e-12)):
+            return
+        np.clip(weights, low, high, out=weights)
+
+
+def rake(data, targets, weight=None, tolerance=1e-6, max_iterations=100, trim=None, codebook=None):
+    """
+    Rim weighting (raking): iterative proportional fitting of weights to target marginal distributions
+
+    Every iteration adjusts weights to every margin in turn with one np.bincount per margin.
+    Respondents without answer to variable are not adjusted by its margin.
+    Weights are normalized to mean of 1.
+
+    :param data: pd.DataFrame
+    :param targets: dict, {variable_id: {value: target share or count}}
+    :param weight: str, variable of base (design) weights
+    :param tolerance: float, maximum absolute difference between achieved and target proportions
+    :param max_iterations: int
+    :param trim: tuple, (lower, upper) bounds of weights relative to mean weight, e.g. (0.2, 5.),
+        None bound is not applied
+    :param codebook: CodeBook of data, to reuse factorized variables
+    :return: RakingResult
+
+    Example:
+        result = rake(df, {'gender': {1: .48, 2: .52}, 'age': {1: .3, 2: .4, 3: .3}}, trim=(.3, 3.))
+        df['w'] = result.weights
+        Crosstab(df, 'q1 by q2', weight='w')
+    """
+    if not targets:
+        raise Exception('Targets are empty')
+
+    codebook = codebook or CodeBook(data)
+    margins = _margins(codebook, targets)
+
+    if weight is None:
+        weights = np.ones(len(codebook))
+    else:
+        weights = codebook.weights(weight).copy()
+
+    lower, upper = trim if trim is not None else (None, None)
+
+    converged, max_error, iterations = False, np.inf, 0
+    while iterations < max_iterations:
+        iterations += 1
+
+        for margin in margins:
+            w = weights if margin.index is None else weights[margin.index]
+            achieved = np.bincount(margin.codes, weights=w, minlength=len(margin.target))
+            with np.errstate(divide='ignore', invalid='ignore'):
+                factors = np.where(achieved > 0, margin.target * w.sum() / achieved, 0.)
+            if margin.index is None:
+                weights *= factors[margin.codes]
+            else:
+                weights[margin.index] = w * factors[margin.codes]
+
+        if lower is not None or upper is not None:
+            _trim(weights, lower, upper)
+
+        max_error = 0.
+        for margin in margins:
+            w = weights if margin.index is None else weights[margin.index]
+            achieved = np.bincount(margin.codes, weights=w, minlength=len(margin.target)) / w.sum()
+            max_error = max(max_error, np.abs(achieved - margin.target).max())
+
+        if max_error < tolerance:
+            converged = True
+            break
+
+    weights *= len(weights) / weights.sum()
+    return RakingResult(weights, iterations, converged, max_error)
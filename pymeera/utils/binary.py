@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+    Versioned binary container of metadata and numeric arrays.
+
+    Layout:
+        magic (8 bytes), version (uint16), kind length (uint16), header length (uint32), kind (ascii),
+        header – utf-8 json with metadata and descriptors of arrays,
+        arrays – raw contiguous buffers, every one aligned to ALIGNMENT bytes.
+
+    Loader parses only header, arrays are views of one memory map of the file,
+    so their pages are read by OS only when they are used.
+"""
+
+from __future__ import print_function, unicode_literals, division
+
+import json
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+MAGIC = b'PYMEERA\x00'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+
+_PREFIX = struct.Struct('<8sHHI')
+
+# mode of written files is the same as of files created by open, e.g. to share cache between users
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def to_json_values(values):
+    """
+    Plain python values of numpy scalars, e.g. to store keys of labels
+    """
+    return [v.item() if isinstance(v, np.generic) else v for v in values]
+
+
+def _padding(offset):
+    return -offset % ALIGNMENT
+
+
+def dump(path, kind, meta, arrays=None):
+    """
+    Write container atomically: readers see either previous or new file
+
+    :param path: str
+    :param kind: str, type of content, e.g. 'structure', checked by load
+    :param meta: json serializable object
+    :param arrays: dict, {name: np.array}, arrays of object dtype are not supported
+    """
+    arrays = arrays or {}
+
+    descriptors, offset = [], 0
+    for name, array in arrays.items():
+        array = np.asarray(array)
+        if array.dtype.hasobject:
+            raise Exception('Array "%s" of object dtype can not be stored' % (name, ))
+        descriptors.append({'name': name, 'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset})
+        offset += array.nbytes + _padding(array.nbytes)
+
+    kind = kind.encode('ascii')
+    header = json.dumps({'meta': meta, 'arrays': descriptors}, ensure_ascii=False).encode('utf-8')
+    start = _PREFIX.size + len(kind) + len(header)
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(kind), len(header)))
+            f.write(kind)
+            f.write(header)
+            f.write(b'\x00' * _padding(start))
+            for name, array in arrays.items():
+                data = np.ascontiguousarray(array).tobytes()
+                f.write(data)
+                f.write(b'\x00' * _padding(len(data)))
+        # temporary file is readable only by owner
+        os.chmod(temp_path, 0o666 & ~_UMASK)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def load(path, kind, mmap=True):
+    """
+    Read container written by dump
+
+    :param path: str
+    :param kind: str, expected type of content
+    :param mmap: bool, if True arrays are read only views of memory map, otherwise they are read into memory
+    :return: tuple, (meta, {name: np.array})
+    """
+    with open(path, 'rb') as f:
+        magic, version, kind_length, header_length = _PREFIX.unpack(f.read(_PREFIX.size))
+        if magic != MAGIC:
+            raise Exception('File "%s" is not pymeera binary file' % (path, ))
+        if version > FORMAT_VERSION:
+            raise Exception('Format version %s is not supported' % (version, ))
+
+        stored_kind = f.read(kind_length).decode('ascii')
+        if stored_kind != kind:
+            raise Exception('File "%s" contains %s, not %s' % (path, stored_kind, kind))
+
+        header = json.loads(f.read(header_length).decode('utf-8'))
+        start = _PREFIX.size + kind_length + header_length
+        start += _padding(start)
+
+        arrays = {}
+        if header['arrays']:
+            if mmap:
+                buffer = np.memmap(path, dtype=np.uint8, mode='r')
+            else:
+                f.seek(0)
+                buffer = np.frombuffer(f.read(), dtype=np.uint8)
+
+            for descriptor in header['arrays']:
+                dtype, shape = np.dtype(descriptor['dtype']), tuple(descriptor['shape'])
+                begin = start + descriptor['offset']
+                size = int(np.prod(shape)) * dtype.itemsize
+                arrays[descriptor['name']] = buffer[begin:begin + size].view(dtype).reshape(shape)
+
+    return header['meta'], arrays
+
+
+def dump_labels(path, variable_labels=None, value_labels=None):
+    """
+    Write variable and value labels, value ids keep their types (e.g. int keys are not converted to str)
+    """
+    dump(path, 'labels', {
+        'variable_labels': variable_labels,
+        'value_labels': None if value_labels is None else [
+            [variable_id, [to_json_values(pair) for pair in labels.items()]]
+            for variable_id, labels in value_labels.items()
+        ]
+    })
+
+
+def load_labels(path):
+    """
+    :return: tuple, (variable_labels, value_labels)
+    """
+    meta, _ = load(path, 'labels')
+    value_labels = meta['value_labels']
+    if value_labels is not None:
+        value_labels = dict((variable_id, dict(labels)) for variable_id, labels in value_labels)
+    return meta['variable_labels'], value_labels
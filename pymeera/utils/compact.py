@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import numpy as np
+import pandas as pd
+
+# more distinct values than that are not answer codes but continuous data, e.g. ids or weights
+MAX_CATEGORIES = 32767
+
+
+def _is_integral(values):
+    if values.dtype.kind in 'iu':
+        return True
+    if values.dtype.kind != 'f':
+        return False
+    return bool(np.all(np.mod(values, 1) == 0))
+
+
+def compact_series(series, domain=None, max_categories=MAX_CATEGORIES):
+    """
+    Convert answers to the smallest codes
+
+    Answer codes and labeled values are converted to categorical with smallest integer codes,
+    missing answers are stored as code -1. Other integer columns are downcasted,
+    continuous data (e.g. weights) is left as is.
+
+    :param series: pd.Series
+    :param domain: iterable, all possible values of variable, e.g. keys of value labels
+    :param max_categories: int, maximum number of categories of unlabeled variable
+    :return: pd.Series
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype) or series.dtype.kind == 'b':
+        return series
+
+    observed = series.dropna()
+    values = observed.to_numpy()
+
+    if series.dtype.kind in 'iuf' and not _is_integral(values):
+        return series
+
+    categories = pd.Index(pd.unique(values))
+    if domain:
+        categories = categories.append(pd.Index(list(domain))).unique()
+    elif len(categories) > max_categories:
+        if series.dtype.kind in 'iu' or (series.dtype.kind == 'f' and len(observed) == len(series)):
+            return pd.to_numeric(series, downcast='integer')
+        return series
+
+    try:
+        categories = categories.sort_values()
+    except TypeError:
+        # values of incomparable types are kept in order of appearance
+        pass
+
+    return series.astype(pd.CategoricalDtype(categories=categories))
+
+
+def compact_frame(data, value_labels=None, structure=None, max_categories=MAX_CATEGORIES):
+    """
+    Convert all columns of data frame with compact_series
+
+    :param data: pd.DataFrame
+    :param value_labels: nested dict, {variable_id: {value_id: value_label}}, defines domain of variables
+    :param structure: SurveyStructure, variable_values define domain of variables
+    :param max_categories: int
+    :return: pd.DataFrame
+    """
+    value_labels = value_labels or {}
+
+    columns = {}
+    for variable_id in data.columns:
+        domain = value_labels.get(variable_id)
+        if domain is None and structure is not None and variable_id in structure:
+            domain = structure.get_variable_by_id(variable_id).variable_values
+        columns[variable_id] = compact_series(data[variable_id], domain=domain, max_categories=max_categories)
+
+    return pd.DataFrame(columns, index=data.index)
@@ -1,44 +1,238 @@
 # -*- coding: utf-8 -*-
 
 from __future__ import print_function, unicode_literals, division
+import json
+import re
+import threading
 import warnings
-from pyparsing import (Literal, CaselessLiteral, Word, Group, ungroup,
-                       ZeroOrMore, Forward, alphanums, ParseResults)
+from pyparsing import (Literal, CaselessLiteral, CaselessKeyword, Word, Group, ungroup, Regex, QuotedString,
+                       ZeroOrMore, Forward, alphanums, ParseResults, ParserElement, ParseException,
+                       one_of, infix_notation, OpAssoc)
 
+from collections import namedtuple, OrderedDict
 from itertools import product
 
 
+def _build_grammar():
+
+    _by = CaselessLiteral('by')
+    _add = Literal('+').suppress()
+    _nest = Literal('>').suppress()
+    _lpar = Literal('(').suppress()
+    _rpar = Literal(')').suppress()
+    _variable = ~_by + Word(alphanums + '_' + '.')
+
+    def _p_act(s, l , t):
+        # dirty hack to unpack group permutations
+        # if has lists in result than it is multidimension cross
+        levels_array = list(map(lambda v: isinstance(v, ParseResults), t))
+        if sum(levels_array):
+            # find where second level of cross starts
+            first_cross_starts_at = levels_array.index(True)
+            t = t.as_list()
+            levels = [t[:first_cross_starts_at]]
+            levels.extend(t[first_cross_starts_at:])
+            return list(map(lambda v: list(v), product(*levels)))
+        return t
+
+    expr = Forward()
+    atom = _variable | (_lpar + ungroup(expr) + _rpar)
+    cross = Forward()
+    cross << (atom + ZeroOrMore(Group(_nest + atom))).set_parse_action(_p_act)
+    add = Forward()
+    add << cross + ZeroOrMore(_add + cross)
+    expr << Group(add + ZeroOrMore(add))
+    return expr
+
+
+# comparison operators of filter and their normalized form
+_OPERATORS = {'=': '=', '==': '=', '!=': '!=', '<>': '!=', '<': '<', '<=': '<=', '>': '>', '>=': '>='}
+
+
+def _build_filter_grammar():
+    """
+    Filter clause, e.g. 'region = 3 and (age >= 35 or q5 in (1, 2)) and not city = "Moscow"'.
+    Condition is a tree of lists: [operator, variable, value], ['in', variable, [values]],
+    ['not', condition], ['and', condition, ...] and ['or', condition, ...]
+    """
+    _and, _or, _not, _in = map(CaselessKeyword, ('and', 'or', 'not', 'in'))
+    _variable = ~(_and | _or | _not | _in) + Word(alphanums + '_' + '.')
+
+    number = Regex(r'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?')
+    number.set_parse_action(lambda t: float(t[0]) if any(c in t[0] for c in '.eE') else int(t[0]))
+    value = number | QuotedString("'", esc_char='\\') | QuotedString('"', esc_char='\\')
+
+    comparison = _variable + one_of(list(_OPERATORS)) + value
+    comparison.set_parse_action(lambda t: [[_OPERATORS[t[1]], t[0], t[2]]])
+    values = Group(value + ZeroOrMore(Literal(',').suppress() + value))
+    membership = _variable + _in.suppress() + Literal('(').suppress() + values + Literal(')').suppress()
+    membership.set_parse_action(lambda t: [['in', t[0], t[1].as_list()]])
+
+    def _operand(item):
+        # result of nested operation is wrapped into its own ParseResults
+        if isinstance(item, ParseResults):
+            item = item.as_list()
+            if len(item) == 1 and isinstance(item[0], list):
+                item = item[0]
+        return item
+
+    def _unary(t):
+        return [['not', _operand(t[0][1])]]
+
+    def _binary(t):
+        operator = t[0][1].lower()
+        operands = [_operand(o) for o in t[0][0::2]]
+        # nested operations of the same operator are flattened, e.g. "a and (b and c)"
+        return [[operator] + [item for o in operands for item in (o[1:] if o[0] == operator else [o])]]
+
+    return infix_notation(membership | comparison, [
+        (_not, 1, OpAssoc.RIGHT, _unary),
+        (_and, 2, OpAssoc.LEFT, _binary),
+        (_or, 2, OpAssoc.LEFT, _binary),
+    ])
+
+
+# grammar is stateless, so it is compiled once and shared by all parsers
+ParserElement.enable_packrat()
+_GRAMMAR = _build_grammar()
+_FILTER_GRAMMAR = _build_filter_grammar()
+
+
+def _as_condition(item):
+    if isinstance(item, ParseResults):
+        item = item.as_list()
+    if isinstance(item, list):
+        return [_as_condition(i) for i in item]
+    return item
+
+
+def filter_text(condition):
+    """
+    Normalized text of filter condition, operands of "and" and "or" are sorted,
+    so equivalent filters have the same text
+
+    :param condition: tree of lists, see Expression.parse_filter
+    :return: str
+    """
+    operator = condition[0]
+    if operator in ('and', 'or'):
+        operands = sorted(filter_text(c) if c[0] not in ('and', 'or') else '(%s)' % (filter_text(c), )
+                          for c in condition[1:])
+        return (' %s ' % (operator, )).join(operands)
+    if operator == 'not':
+        operand = filter_text(condition[1])
+        return 'not %s' % (operand if condition[1][0] in ('in', 'not') + tuple(_OPERATORS.values())
+                           else '(%s)' % (operand, ))
+    if operator == 'in':
+        return '%s in (%s)' % (condition[1], ', '.join(json.dumps(v, ensure_ascii=False) for v in condition[2]))
+    return '%s %s %s' % (condition[1], operator, json.dumps(condition[2], ensure_ascii=False))
+
+
+def filter_variables(condition):
+    """
+    :param condition: tree of lists, see Expression.parse_filter
+    :return: list of variable_ids referenced by condition
+    """
+    if condition is None:
+        return []
+    if condition[0] in ('and', 'or', 'not'):
+        return list(OrderedDict.fromkeys(v for c in condition[1:] for v in filter_variables(c)))
+    return [condition[1]]
+
+
+def combine_filters(*conditions):
+    """
+    Condition satisfied by respondents who satisfy all conditions, None conditions are skipped
+
+    :return: tree of lists or None
+    """
+    conditions = [c for c in conditions if c is not None]
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return ['and'] + [operand for c in conditions for operand in (c[1:] if c[0] == 'and' else [c])]
+
+
+CacheInfo = namedtuple('CacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+
+class LRUCache(object):
+    """
+        Thread safe bounded cache with least recently used eviction
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+_QUOTED = re.compile(r'"(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\'')
+_WHERE = re.compile(r'\s+where\s+', re.IGNORECASE)
+_BY = re.compile(r' by ', re.IGNORECASE)
+
+
+def _normalize(expression):
+    # whitespace of quoted values is a part of value
+    parts = _QUOTED.split(expression)
+    quoted = _QUOTED.findall(expression) + ['']
+    return ''.join(re.sub(r'\s+', ' ', part) + value for part, value in zip(parts, quoted)).strip()
+
+
+def split_filter(expression):
+    """
+    Split expression at "where" keyword, quoted values of filter may contain the keyword
+
+    :param expression: str, e.g. 'q1 by q2 WHERE city = "a where b"'
+    :return: tuple, (tables description, filter clause or None)
+    """
+    quoted = _QUOTED.search(expression)
+    match = _WHERE.search(expression, 0, len(expression) if quoted is None else quoted.start())
+    if match is None:
+        return expression, None
+    return expression[:match.start()], expression[match.end():]
+
+
+def _copy_groups(groups):
+    return None if groups is None else [list(group) for group in groups]
+
+
 class Expression(object):
 
-    def __init__(self):
+    # parsed parts of expressions shared between tables,
+    # e.g. banner is parsed once for all tables that use it
+    _cache = LRUCache()
 
-        _by = CaselessLiteral('by')
-        _add = Literal('+').suppress()
-        _nest = Literal('>').suppress()
-        _lpar = Literal('(').suppress()
-        _rpar = Literal(')').suppress()
-        _variable = ~_by + Word(alphanums + '_' + '.')
-
-        def _p_act(s, l , t):
-            # dirty hack to unpack group permutations
-            # if has lists in result than it is multidimension cross
-            levels_array = list(map(lambda v: isinstance(v, ParseResults), t))
-            if sum(levels_array):
-                # find where second level of cross starts
-                first_cross_starts_at = levels_array.index(True)
-                t = t.asList()
-                levels = [t[:first_cross_starts_at]]
-                levels.extend(t[first_cross_starts_at:])
-                return list(map(lambda v: list(v), product(*levels)))
-            return t
-
-        self.expr = Forward()
-        atom = _variable | (_lpar + ungroup(self.expr) + _rpar)
-        cross = Forward()
-        cross << (atom + ZeroOrMore(Group(_nest + atom))).setParseAction(_p_act)
-        add = Forward()
-        add << cross + ZeroOrMore(_add + cross)
-        self.expr << Group(add + ZeroOrMore(add))
+    def __init__(self):
+        self.expr = _GRAMMAR
 
     @classmethod
     def parse(cls, expression):
@@ -48,6 +242,7 @@ class Expression(object):
         First nested level - rows,
         Second - columns
         Third - dimension (optional, is used for pandas.Panel creation)
+        Optional filter clause after "where" restricts table to subsample, see parse_filter
 
         :param expression: string
         :return: list, structure that defines how to cross variables
@@ -62,39 +257,91 @@ class Expression(object):
                     ['q4', 'q5', 'q6'],
                     ['q6', 'q7']
                 ],
-                additional_axis: [['q8']]
+                additional_axis: [['q8']],
+                filter: None
              }
 
-        """
-        parser = cls()
+             ExpressionParser.parse('q1 by q2 where region = 3 and age >= 35')['filter']
+             ['and', ['=', 'region', 3], ['>=', 'age', 35]]
 
-        parts = expression.split(' by ')
+        """
+        expression, condition = split_filter(expression)
+        parts = _BY.split(_normalize(expression))
 
         if len(parts) < 2:
             raise Exception('You have defined less than 2 dimensions')
         if len(parts) > 3:
             warnings.warn('You have defined more than 3 dimensions')
 
-        rows = parser._parse_part(part=parts[0]).asList()
-        columns = parser._parse_part(part=parts[1]).asList()
-        additional_axis = None if len(parts) < 3 else parser._parse_part(part=parts[2]).asList()
-
-        def _to_one_depth_list(item):
-            if isinstance(item, (list, tuple)):
-                return item
-            else:
-                return [item]
+        rows = cls._parse_cached(parts[0])
+        columns = cls._parse_cached(parts[1])
+        additional_axis = None if len(parts) < 3 else cls._parse_cached(parts[2])
 
         return {
-            'rows': list(map(_to_one_depth_list, rows)),
-            'columns': list(map(_to_one_depth_list, columns)),
-            'additional_axis': list(map(_to_one_depth_list, additional_axis)) if additional_axis else None
+            'rows': rows,
+            'columns': columns,
+            'additional_axis': additional_axis if additional_axis else None,
+            'filter': cls.parse_filter(condition) if condition else None
         }
 
+    @classmethod
+    def parse_filter(cls, condition):
+        """
+        Parse filter condition: comparisons of variable with number or quoted string (=, !=, <, <=, >, >=),
+        membership (in) and their combinations by "not", "and", "or" and parentheses.
+        Respondents without answer do not satisfy any comparison. Result is cached by normalized condition.
+
+        :param condition: str, e.g. 'region = 3 and (age >= 35 or q5 in (1, 2))'
+        :return: tree of lists, e.g. ['and', ['=', 'region', 3], ['or', ['>=', 'age', 35], ['in', 'q5', [1, 2]]]]
+        """
+        key = ('where', _normalize(condition))
+        tree = cls._cache.get(key)
+        if tree is None:
+            try:
+                tree = _as_condition(_FILTER_GRAMMAR.parse_string(key[1], parse_all=True)[0])
+            except ParseException as e:
+                raise Exception('Filter "%s" is not valid at position %d' % (condition, e.loc))
+            cls._cache.put(key, tree)
+        return json.loads(json.dumps(tree))
+
+    @classmethod
+    def _parse_cached(cls, part):
+        """
+        Parse one dimension of expression, result is cached by normalized part
+
+        :return: list of variable groups, a copy of cached one
+        """
+        groups = cls._cache.get(part)
+        if groups is None:
+            groups = list(map(_to_one_depth_list, cls()._parse_part(part=part).as_list()))
+            cls._cache.put(part, groups)
+        return _copy_groups(groups)
+
+    @classmethod
+    def cache_info(cls):
+        """
+        :return: CacheInfo, (hits, misses, maxsize, currsize) of parsed parts cache
+        """
+        return cls._cache.info()
+
+    @classmethod
+    def cache_clear(cls):
+        cls._cache.clear()
+
     def _parse_part(self, part):
-        banner = self.expr.parseString(part)
+        try:
+            banner = self.expr.parse_string(part, parse_all=True)
+        except ParseException as e:
+            raise Exception('Expression "%s" is not valid at position %d' % (part, e.loc))
         return banner[0]
 
 
+def _to_one_depth_list(item):
+    if isinstance(item, (list, tuple)):
+        return item
+    else:
+        return [item]
+
+
 if __name__ == '__main__':
     print(Expression.parse('q1+q2 by q2 + (q3 + q4) > q5 > q6 + q6 > q7'))
\ No newline at end of file
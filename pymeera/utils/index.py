@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import re
+from bisect import bisect_left
+from collections import OrderedDict
+from fnmatch import translate
+
+# characters of glob pattern that end its literal prefix
+_WILDCARDS = re.compile(r'[*?\[]')
+
+
+class VariableIndex(object):
+    """
+        Lookups of variable ids of survey structure:
+            children of question – O(1),
+            variables with prefix – O(log n + k) by bisection of sorted ids,
+            glob pattern, e.g. q1*_3 – only variables with its literal prefix are matched.
+
+        Results are in order of variables in structure.
+    """
+
+    def __init__(self, separator='_'):
+        self.separator = separator
+        self._order = {}
+        self._counter = 0
+        self._questions = {}
+        self._sorted = None
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, variable_id):
+        return variable_id in self._order
+
+    def question(self, variable_id):
+        return variable_id.split(self.separator)[0]
+
+    def add(self, variable_id):
+        if variable_id in self._order:
+            self.remove(variable_id)
+
+        self._order[variable_id] = self._counter
+        self._counter += 1
+        self._questions.setdefault(self.question(variable_id), OrderedDict())[variable_id] = None
+        self._sorted = None
+
+    def remove(self, variable_id):
+        self._order.pop(variable_id)
+        question_id = self.question(variable_id)
+        self._questions[question_id].pop(variable_id)
+        if not self._questions[question_id]:
+            del self._questions[question_id]
+        self._sorted = None
+
+    def children(self, question_id):
+        """
+        :return: list of variable ids of question, e.g. q12 -> q12_1, q12_2, ...
+        """
+        return list(self._questions.get(question_id, ()))
+
+    def prefix(self, prefix):
+        """
+        :return: list of variable ids that start with prefix
+        """
+        if self._sorted is None:
+            self._sorted = sorted(self._order)
+
+        found = []
+        for idx in range(bisect_left(self._sorted, prefix), len(self._sorted)):
+            if not self._sorted[idx].startswith(prefix):
+                break
+            found.append(self._sorted[idx])
+        return sorted(found, key=self._order.__getitem__)
+
+    def match(self, pattern):
+        """
+        :param pattern: str, glob pattern of variable ids, e.g. q1*_3
+        :return: list of matched variable ids
+        """
+        wildcard = _WILDCARDS.search(pattern)
+        if wildcard is None:
+            return [pattern] if pattern in self._order else []
+
+        regex = re.compile(translate(pattern))
+        return [v for v in self.prefix(pattern[:wildcard.start()]) if regex.match(v)]
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from pymeera.utils.compact import _is_integral
+from pymeera.utils.exprparser import Expression, combine_filters, filter_variables
+from pymeera.utils.support import flatten
+
+# rows of file converted at once, peak memory is one chunk of wide dtypes over compact arrays
+CHUNK_SIZE = 100000
+
+# float32 keeps integers up to 2**24 exactly
+_MAX_FLOAT32_INTEGER = 2 ** 24
+
+
+def referenced_variables(expressions, weight=None, filter=None):
+    """
+    Variables referenced by tables of expressions, including variables of filters and weight,
+    in order of the first reference (see Crosstab._flat_variables)
+
+    :param expressions: list of str, glob patterns must be expanded
+    :param weight: str, id of weight variable
+    :param filter: str or parsed condition applied to every table
+    :return: list of variable ids
+    """
+    if filter is not None and not isinstance(filter, list):
+        filter = Expression.parse_filter(filter)
+
+    variables = OrderedDict()
+    for expression in expressions:
+        parsed = Expression.parse(expression=expression)
+        for variable_id in (flatten(parsed['rows']) + flatten(parsed['columns']) + flatten(parsed['additional_axis'])
+                            + filter_variables(combine_filters(parsed['filter'], filter))):
+            variables[variable_id] = True
+    if weight:
+        variables[weight] = True
+    return list(variables)
+
+
+def downcast_series(series):
+    """
+    Smallest numeric dtype that keeps values exactly: integers are downcasted,
+    integral floats with missing answers (e.g. answer codes) are stored as float32, other columns are left as is
+
+    :param series: pd.Series
+    :return: pd.Series
+    """
+    if series.dtype.kind in 'iu':
+        return pd.to_numeric(series, downcast='integer')
+    if series.dtype == np.float64:
+        values = series.to_numpy()
+        values = values[~np.isnan(values)]
+        if _is_integral(values) and (not len(values) or np.abs(values).max() < _MAX_FLOAT32_INTEGER):
+            return series.astype(np.float32)
+    return series
+
+
+def concat_chunks(chunks, columns=None):
+    """
+    Frame of chunks, every chunk is downcasted before the next one is read
+
+    :param chunks: iterable of pd.DataFrame with the same columns
+    :param columns: list of variable ids of empty frame, if there are no chunks, e.g. file has no rows
+    :return: pd.DataFrame
+    """
+    frames = []
+    for chunk in chunks:
+        frames.append(pd.DataFrame(OrderedDict((c, downcast_series(chunk[c])) for c in chunk.columns)))
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, ignore_index=True)
+
+
+def csv_columns(path, **kwargs):
+    """
+    Variable ids of csv file, only header is read
+
+    :param kwargs: pd.read_csv arguments, e.g. sep or encoding
+    :return: list of variable ids
+    """
+    return pd.read_csv(path, nrows=0, **kwargs).columns.tolist()
+
+
+def read_csv(path, variables=None, chunksize=CHUNK_SIZE, **kwargs):
+    """
+    Projected columns of csv file read in chunks into compact arrays
+
+    :param path: str
+    :param variables: list of variable ids, default is all columns
+    :param chunksize: int, rows of chunk
+    :param kwargs: pd.read_csv arguments
+    :return: pd.DataFrame, columns are in order of variables
+    """
+    reader = pd.read_csv(path, usecols=variables, chunksize=chunksize, **kwargs)
+    with reader:
+        data = concat_chunks(reader)
+    if variables is not None:
+        data = data[list(variables)]
+    return data
+
+
+def _pyreadstat():
+    try:
+        import pyreadstat
+    except ImportError:
+        raise Exception('pyreadstat is required to read SPSS files')
+    return pyreadstat
+
+
+def sav_columns(path):
+    """
+    Variable ids of SPSS file, only metadata is read
+    """
+    _, meta = _pyreadstat().read_sav(path, metadataonly=True)
+    return list(meta.column_names)
+
+
+def read_sav(path, variables=None, chunksize=CHUNK_SIZE):
+    """
+    Projected columns of SPSS file read in chunks into compact arrays,
+    labels are taken from metadata read before data, so file may have no rows
+
+    :param path: str
+    :param variables: list of variable ids, default is all columns
+    :param chunksize: int, rows of chunk
+    :return: tuple, (pd.DataFrame, variable_labels, value_labels)
+    """
+    pyreadstat = _pyreadstat()
+    _, meta = pyreadstat.read_sav(path, metadataonly=True)
+
+    chunks = pyreadstat.read_file_in_chunks(pyreadstat.read_sav, path, chunksize=chunksize, usecols=variables,
+                                            apply_value_formats=False)
+    data = concat_chunks((chunk for chunk, _ in chunks),
+                         columns=list(meta.column_names) if variables is None else list(variables))
+    if variables is not None:
+        data = data[list(variables)]
+
+    variable_labels = dict((k, v) for k, v in meta.column_names_to_labels.items() if v is not None)
+    value_labels = dict((k, dict(v)) for k, v in meta.variable_value_labels.items())
+    return data, variable_labels, value_labels
+
+
+def structure_items(variables, variable_labels=None, value_labels=None):
+    """
+    Variables of structure described by labels, see SurveyStructure.from_list
+
+    :return: list of dicts
+    """
+    variable_labels = variable_labels or {}
+    value_labels = value_labels or {}
+
+    items = []
+    for variable_id in variables:
+        values = value_labels.get(variable_id) or {}
+        items.append({
+            'variable_id': variable_id,
+            'variable_label': variable_labels.get(variable_id) or '',
+            'variable_values': OrderedDict(values.items()),
+        })
+    return items
@@ -0,0 +1,190 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import io
+import json
+import os
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from pymeera.utils import binary
+from pymeera.utils.binary import to_json_values
+
+STORE_VERSION = 2
+META_FILE = 'meta.json'
+LABELS_FILE = 'labels.bin'
+STRUCTURE_FILE = 'structure.bin'
+
+
+def write_store(path, data, variable_labels=None, value_labels=None, structure=None):
+    """
+    Write survey data as columnar store: one contiguous typed array per variable
+    and meta.json with dtypes and categories, labels and structure are stored in binary files (see utils.binary)
+
+    Categorical variables are stored as integer codes (-1 is missing) with list of categories,
+    text variables are converted to categorical.
+
+    :param path: str, directory, is created if not exists
+    :param data: pd.DataFrame
+    :param variable_labels: dict, {variable_id: variable_label}
+    :param value_labels: nested dict, {variable_id: {value_id: value_label}}
+    :param structure: SurveyStructure
+    """
+    if not os.path.isdir(path):
+        os.makedirs(path)
+
+    columns = []
+    for idx, variable_id in enumerate(data.columns):
+        series = data[variable_id]
+        if series.dtype == object:
+            series = series.astype('category')
+
+        column = {'variable_id': variable_id, 'file': '%06d.bin' % (idx, ), 'categories': None}
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            array = np.ascontiguousarray(series.cat.codes.to_numpy())
+            column['categories'] = to_json_values(series.cat.categories)
+        else:
+            array = np.ascontiguousarray(series.to_numpy())
+
+        column['dtype'] = array.dtype.str
+        array.tofile(os.path.join(path, column['file']))
+        columns.append(column)
+
+    meta = {
+        'version': STORE_VERSION,
+        'size': len(data),
+        'columns': columns,
+        'labels': LABELS_FILE,
+        'structure': None if structure is None else STRUCTURE_FILE
+    }
+    binary.dump_labels(os.path.join(path, LABELS_FILE), variable_labels=variable_labels, value_labels=value_labels)
+    if structure is not None:
+        structure.save(os.path.join(path, STRUCTURE_FILE))
+
+    with io.open(os.path.join(path, META_FILE), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+
+
+class ColumnStore(object):
+    """
+        Read only columnar survey data opened with np.memmap.
+        Opening reads only meta.json, every column is mapped on first access
+        and its pages are loaded by OS only when they are read.
+
+        store = ColumnStore('/data/study')
+        store['q1']                     # pd.Series
+        store[['q1', 'q2']]             # pd.DataFrame of projected columns
+        store['w'] = weights            # column kept in memory, files of store are not changed
+    """
+
+    def __init__(self, path):
+        with io.open(os.path.join(path, META_FILE), encoding='utf-8') as f:
+            meta = json.load(f)
+
+        if meta['version'] != STORE_VERSION:
+            raise Exception('Store version %s is not supported' % (meta['version'], ))
+
+        self.path = path
+        self.meta = meta
+        self._size = meta['size']
+        self._columns = dict((c['variable_id'], c) for c in meta['columns'])
+        self._arrays = {}
+        self._added = OrderedDict()
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, variable_id):
+        return variable_id in self._columns or variable_id in self._added
+
+    @property
+    def columns(self):
+        stored = [c['variable_id'] for c in self.meta['columns'] if c['variable_id'] not in self._added]
+        return pd.Index(stored + list(self._added), dtype=object)
+
+    def labels(self):
+        """
+        :return: tuple, (variable_labels, value_labels)
+        """
+        return binary.load_labels(os.path.join(self.path, self.meta['labels']))
+
+    @property
+    def variable_labels(self):
+        return self.labels()[0]
+
+    @property
+    def value_labels(self):
+        return self.labels()[1]
+
+    def array(self, variable_id):
+        """
+        Memory mapped array of variable, codes for categorical variables
+
+        :return: np.memmap
+        """
+        if variable_id in self._added:
+            return self._added[variable_id]
+        if variable_id not in self._arrays:
+            if variable_id not in self._columns:
+                raise KeyError(variable_id)
+            column = self._columns[variable_id]
+            dtype = np.dtype(column['dtype'])
+            if self._size:
+                array = np.memmap(os.path.join(self.path, column['file']), dtype=dtype, mode='r', shape=(self._size, ))
+            else:
+                array = np.empty(0, dtype=dtype)
+            self._arrays[variable_id] = array
+        return self._arrays[variable_id]
+
+    def codes(self, variable_id):
+        """
+        Stored codes and categories of categorical variable, they are used by CodeBook as is
+
+        :return: tuple, (codes, categories) or None if variable is not categorical
+        """
+        categories = self._categories(variable_id)
+        if categories is None:
+            return None
+        return self.array(variable_id), np.asarray(categories)
+
+    def _categories(self, variable_id):
+        if variable_id in self._added or variable_id not in self._columns:
+            return None
+        return self._columns[variable_id]['categories']
+
+    def __getitem__(self, key):
+        if isinstance(key, (list, tuple, pd.Index)):
+            return pd.DataFrame(dict((v, self[v]) for v in key), columns=list(key))
+
+        categories = self._categories(key)
+        if categories is None:
+            return pd.Series(self.array(key), name=key, copy=False)
+        return pd.Series(pd.Categorical.from_codes(self.array(key), categories=categories), name=key)
+
+    def __setitem__(self, variable_id, values):
+        """
+        Add column or replace stored one in memory, e.g. weights computed by rake
+        """
+        array = np.asarray(values)
+        if array.shape != (self._size, ):
+            raise Exception('Column "%s" must have %d values' % (variable_id, self._size))
+        self._added[variable_id] = array
+
+    def to_frame(self, columns=None):
+        """
+        Load columns into memory
+
+        :param columns: list of variable_ids, default is all columns
+        :return: pd.DataFrame
+        """
+        return self[list(self.columns if columns is None else columns)]
+
+    def release(self, variables=None):
+        """
+        Unmap columns, they will be mapped again on next access
+        """
+        for variable_id in list(self._arrays if variables is None else variables):
+            self._arrays.pop(variable_id, None)
@@ -2,58 +2,46 @@
 
 from __future__ import print_function, unicode_literals, division
 
+import hashlib
 
-def hash_index(v, group):
-    """
-    Hash values to store hierarchical index
-
-    :param v: index value
-    :param group: variables from which index was derived
-    :return: str
+import numpy as np
+import pandas as pd
 
-    v = [1, 2]
-    group = ['q1', 'q2]
 
-    return 'q1::1__q2::2'
+def flatten(groups):
     """
-    if not isinstance(v, (list, tuple)):
-        _hash = list(zip(group, [v]))
-    else:
-        _hash = list(zip(group, v))
-    return '__'.join(list(map(lambda x: '%s::%s' % (x[0], x[1]), _hash)))
+    Flatten groups of variables
 
+    :param groups: 2-dimensional iterable or None
+    :return: list
 
-def unhash_index(_hash):
-    """
-    Decode hased value to tuple
-
-    :param _hash: str, hash_index result
-    :return: tuple of tuples
+    groups = [['q1'], ['q2', 'q3']]
 
-    hash = 'q1::1__q2::2'
-    return ((q1, 1), (q2, 2))
+    return ['q1', 'q2', 'q3']
     """
-    try:
-        return tuple(map(lambda x: tuple(x.split('::')), _hash.split('__')))
-    except:
-        print(_hash)
+    if not groups:
+        return []
+    return [item for sublist in groups for item in sublist]
 
 
-def equlize_size(lst):
+def fingerprint(values):
     """
-    Equalize size of incoming iterables
+    Content hash of column, it changes whenever any value of column changes
 
-    :param args: 2-dimensional iterables
-    :return: tuple of tuples
+    :param values: pd.Series or np.array
+    :return: str, hex digest
     """
+    digest = hashlib.blake2b(digest_size=16)
 
-    max_size = max(map(lambda x: len(x), lst))
-    ret = []
-
-    for v in lst:
-        ret.append(tuple(v) + (('', ''),) * (max_size - len(v)))
-
-    return tuple(ret)
-
+    if isinstance(getattr(values, 'dtype', None), pd.CategoricalDtype):
+        digest.update(repr(list(values.cat.categories)).encode('utf-8'))
+        values = values.cat.codes
 
+    array = np.asarray(values)
+    digest.update(array.dtype.str.encode('utf-8'))
+    if array.dtype.kind in 'biufcmM':
+        digest.update(np.ascontiguousarray(array))
+    else:
+        digest.update(pd.util.hash_array(array.astype(object)))
 
+    return digest.hexdigest()
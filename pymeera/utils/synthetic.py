@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+    Reproducible synthetic survey data, e.g. for benchmarks and tests.
+
+    Variables:
+        q1, q2, ...            single choice questions, codes 1..values
+        m1_1, ..., m1_k, ...   multiple choice questions, one variable per choice,
+                               value is code of choice if it is chosen, otherwise missing
+        weight                 positive weights with mean 1
+"""
+
+from __future__ import print_function, unicode_literals, division
+
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from pymeera.survey import SurveyData, SurveyStructure, VariableStructure
+
+
+def make_frame(respondents=1000, single=10, multi=5, choices=5, values=5, missing=.1, weight='weight',
+               separator='_', seed=0):
+    """
+    :param respondents: int, number of rows
+    :param single: int, number of single choice questions
+    :param multi: int, number of multiple choice questions
+    :param choices: int, number of choices of multiple choice question
+    :param values: int, number of answer codes of single choice question
+    :param missing: float, share of respondents without answer to question
+    :param weight: str, weight variable, None for unweighted data
+    :param separator: str, separator of question and choice
+    :param seed: int
+    :return: pd.DataFrame
+    """
+    rng = np.random.default_rng(seed)
+    columns = OrderedDict()
+
+    for question in range(1, single + 1):
+        # answers are not uniform, so tables have cells of different size
+        shares = rng.dirichlet(np.ones(values))
+        codes = (rng.choice(values, size=respondents, p=shares) + 1).astype(np.float64)
+        codes[rng.random(respondents) < missing] = np.nan
+        columns['q%d' % (question, )] = codes
+
+    for question in range(1, multi + 1):
+        skipped = rng.random(respondents) < missing
+        shares = rng.uniform(.1, .7, choices)
+        for choice in range(1, choices + 1):
+            chosen = (rng.random(respondents) < shares[choice - 1]) & ~skipped
+            columns['m%d%s%d' % (question, separator, choice)] = np.where(chosen, float(choice), np.nan)
+
+    if weight:
+        weights = rng.lognormal(0., .5, respondents)
+        columns[weight] = weights / weights.mean()
+
+    return pd.DataFrame(columns)
+
+
+def make_structure(data, values=5, separator='_'):
+    """
+    Plain SurveyStructure of frame made by make_frame
+
+    :return: SurveyStructure
+    """
+    structure = SurveyStructure(multiple_choice_separator=separator)
+    for variable_id in data.columns:
+        if variable_id.startswith('q'):
+            variable_values = OrderedDict((code, 'Answer %d' % (code, )) for code in range(1, values + 1))
+            survey_type = 'radio'
+        elif variable_id.startswith('m'):
+            choice = int(variable_id.split(separator)[-1])
+            variable_values = OrderedDict([(choice, 'Choice %d' % (choice, ))])
+            survey_type = 'checkbox'
+        else:
+            variable_values, survey_type = None, None
+
+        structure.add_variable(VariableStructure(
+            variable_id=variable_id,
+            variable_type='float',
+            variable_label='Label of %s' % (variable_id, ),
+            variable_survey_type=survey_type,
+            variable_values=variable_values
+        ))
+    return structure
+
+
+def make_survey(respondents=1000, values=5, separator='_', compact=False, **kwargs):
+    """
+    SurveyData with structure and labels, see make_frame for arguments
+
+    :param compact: bool, see SurveyData
+    :return: SurveyData
+    """
+    data = make_frame(respondents=respondents, values=values, separator=separator, **kwargs)
+    structure = make_structure(data, values=values, separator=separator)
+
+    return SurveyData(
+        data,
+        variable_labels=dict((v, structure.get_variable_by_id(v).variable_label) for v in data.columns),
+        value_labels=dict((v, dict(structure.get_variable_by_id(v).variable_values)) for v in data.columns),
+        structure=structure,
+        compact=compact
+    )
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import unittest
+import tempfile
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.survey import SurveyStructure, VariableStructure
+from pymeera.tools.crosstab import Crosstab
+from pymeera.utils import binary
+from tests.test_crosstab import make_data
+
+
+class TestBinary(unittest.TestCase):
+
+    def setUp(self):
+        self.path = os.path.join(tempfile.mkdtemp(), 'file.bin')
+
+    def test_container(self):
+        arrays = {'a': np.arange(5, dtype=np.int8), 'b': np.ones((3, 2)), 'empty': np.empty(0)}
+        binary.dump(self.path, 'test', {'x': [1, 'y']}, arrays)
+
+        meta, loaded = binary.load(self.path, 'test')
+        self.assertEqual(meta, {'x': [1, 'y']})
+        for name, array in arrays.items():
+            np.testing.assert_array_equal(loaded[name], array)
+            self.assertEqual(loaded[name].dtype, array.dtype)
+        self.assertFalse(loaded['b'].flags.writeable)
+        self.assertEqual(loaded['b'].ctypes.data % binary.ALIGNMENT, 0)
+
+        with self.assertRaises(Exception):
+            binary.load(self.path, 'structure')
+
+        umask = os.umask(0)
+        os.umask(umask)
+        self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o666 & ~umask)
+
+    def test_labels(self):
+        binary.dump_labels(self.path, {'q1': 'Q1'}, {'q1': {1: 'a', 2.5: 'b'}, 'q2': {'x': 'c'}})
+        variable_labels, value_labels = binary.load_labels(self.path)
+        self.assertEqual(variable_labels, {'q1': 'Q1'})
+        self.assertEqual(value_labels, {'q1': {1: 'a', 2.5: 'b'}, 'q2': {'x': 'c'}})
+
+    def test_structure(self):
+        structure = SurveyStructure()
+        for variable_id in ['q1_1', 'q1_2', 'q2']:
+            structure.add_variable(VariableStructure(
+                variable_id=variable_id, variable_label=variable_id.upper(), variable_type='int',
+                variable_values={1: 'no', 2: 'yes'}
+            ))
+        structure.add_variable(VariableStructure(variable_id='q3', variable_values={1.: 'no', 2.: 'yes'}))
+
+        for source in [structure, structure.to_hierarchical()]:
+            source.save(self.path)
+            loaded = SurveyStructure.load(self.path)
+            self.assertEqual(loaded.to_list(), source.to_list())
+            self.assertEqual(loaded.is_hierarchical, source.is_hierarchical)
+
+        loaded = SurveyStructure.load(self.path)
+        self.assertIsInstance(list(loaded.get_variable_by_id('q3').variable_values)[0], float)
+
+        # shared sets of labels are loaded as independent dicts
+        loaded.get_variable_by_id('q1').variable_values[3] = 'maybe'
+        self.assertNotIn(3, loaded.get_variable_by_id('q2').variable_values)
+
+    def test_crosstab(self):
+        df = make_data()
+        df['city'] = np.array(['Moscow', 'Paris', 'Rome', 'Oslo'] * 50, dtype=object)
+        kwargs = dict(weight='w', show_column_percentage=True, show_mean=True, title='T')
+
+        for expression in ['q1 + q2 > q3 by r1 > r2 + q2', 'q1 by city']:
+            table = Crosstab(df, expression=expression, **kwargs)
+            table.save(self.path)
+
+            loaded = Crosstab.load(self.path)
+            self.assertIsNone(loaded.data)
+            self.assertEqual(loaded.title, 'T')
+            pd.testing.assert_frame_equal(loaded._crosstab, table._crosstab)
+
+        loaded.append(df)
+        self.assertEqual(loaded._crosstab.iloc[-1].sum(), 2 * table._crosstab.iloc[-1].sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
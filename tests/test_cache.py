@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import unittest
+import multiprocessing
+import tempfile
+import sys
+import os
+
+import pandas as pd
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.survey import SurveyData
+from pymeera.tools.cache import ResultCache, ENTRY_SUFFIX
+from pymeera.tools.crosstab import Crosstab
+from tests.test_crosstab import make_data
+
+EXPRESSIONS = ['q1 by r1', 'q2 by r1 > r2', 'q3 + q1 by q2', 'q1 > q2 by r2']
+
+
+def _cross(args):
+    path, expression = args
+    return Crosstab(make_data(), expression=expression, weight='w', cache=ResultCache(path))._crosstab
+
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.cache = ResultCache(self.path)
+
+    def test_hit(self):
+        df = make_data()
+        expected = Crosstab(df, expression='q1 + q2 by r1 > r2', weight='w', cache=self.cache)
+        self.assertEqual(self.cache.info()[:2], (0, 1))
+
+        with mock.patch.object(Crosstab, '_evaluate', side_effect=AssertionError('evaluated')):
+            table = Crosstab(df, expression='q1 + q2 by r1 > r2', weight='w', cache=self.cache)
+        self.assertEqual(self.cache.info()[:2], (1, 1))
+        pd.testing.assert_frame_equal(table._crosstab, expected._crosstab)
+
+        # statistics are derived from cached counts
+        table = Crosstab(df, expression='q1 + q2 by r1 > r2', weight='w', show_column_percentage=True,
+                         cache=self.cache)
+        self.assertEqual(self.cache.hits, 2)
+        pd.testing.assert_frame_equal(
+            table._crosstab,
+            Crosstab(df, expression='q1 + q2 by r1 > r2', weight='w', show_column_percentage=True)._crosstab
+        )
+
+    def test_corrupt_entry(self):
+        df = make_data()
+        expected = Crosstab(df, expression='q1 by r1', weight='w', cache=self.cache)
+        entry, = [os.path.join(self.path, name) for name in os.listdir(self.path) if name.endswith(ENTRY_SUFFIX)]
+
+        for content in [b'garbage', open(entry, 'rb').read()[:200]]:
+            with open(entry, 'wb') as f:
+                f.write(content)
+            table = Crosstab(df, expression='q1 by r1', weight='w', cache=self.cache)
+            pd.testing.assert_frame_equal(table._crosstab, expected._crosstab)
+            # bad entry is replaced by counted one
+            hits = self.cache.hits
+            Crosstab(df, expression='q1 by r1', weight='w', cache=self.cache)
+            self.assertEqual(self.cache.hits, hits + 1)
+
+    def test_key(self):
+        df = make_data()
+        Crosstab(df, expression='q1 by r1', cache=self.cache)
+        Crosstab(df, expression='q1 by r1', weight='w', cache=self.cache)
+        Crosstab(df, expression='q1 by r1', column_total=False, cache=self.cache)
+        self.assertEqual(self.cache.misses, 3)
+
+        # only referenced variables address entry
+        df['q3'] = 1
+        Crosstab(df, expression='q1 by r1', cache=self.cache)
+        self.assertEqual(self.cache.hits, 1)
+
+        df.loc[0, 'q1'] = 5
+        Crosstab(df, expression='q1 by r1', cache=self.cache)
+        self.assertEqual(self.cache.misses, 4)
+
+    def test_filter_key(self):
+        df = make_data()
+        Crosstab(df, expression='q1 by r1', cache=self.cache)
+        Crosstab(df, expression='q1 by r1 where r2 >= 2 and q2 = 1', cache=self.cache)
+        self.assertEqual(self.cache.misses, 2)
+
+        # normalized filter addresses entry
+        Crosstab(df, expression='q1 by r1', filter='q2 = 1 and  r2>=2', cache=self.cache)
+        self.assertEqual(self.cache.hits, 1)
+
+        # values of filter variables address entry too
+        df.loc[df['q2'] == 1, 'r2'] = 3.
+        table = Crosstab(df, expression='q1 by r1 where r2 >= 2 and q2 = 1', cache=self.cache)
+        self.assertEqual(self.cache.misses, 3)
+        pd.testing.assert_frame_equal(
+            table._crosstab, Crosstab(df[df['q2'] == 1], expression='q1 by r1')._crosstab
+        )
+
+    def test_survey_data(self):
+        sd = SurveyData(make_data())
+        sd.recode(variable_id='top', source='q3', mapping={4: 1, 3: 1})
+        first = sd.cross('top by r1', cache=self.cache)
+        second = sd.cross('top by r1', cache=self.cache)
+        self.assertEqual(self.cache.hits, 1)
+        pd.testing.assert_frame_equal(first._crosstab, second._crosstab)
+
+    def test_eviction(self):
+        df = make_data()
+        Crosstab(df, expression=EXPRESSIONS[0], cache=self.cache)
+        entry_size = self.cache.info().currsize
+
+        cache = ResultCache(self.path, max_size=int(2.5 * entry_size))
+        for expression in EXPRESSIONS:
+            Crosstab(df, expression=expression, cache=cache)
+        self.assertLessEqual(cache.info().currsize, cache.max_size)
+
+        # the most recently used entry is kept
+        hits = cache.hits
+        Crosstab(df, expression=EXPRESSIONS[-1], cache=cache)
+        self.assertEqual(cache.hits, hits + 1)
+
+        cache.clear()
+        self.assertEqual(cache.info(), (0, 0, cache.max_size, 0))
+
+    def test_processes(self):
+        pool = multiprocessing.Pool(processes=4)
+        try:
+            tables = pool.map(_cross, [(self.path, e) for e in EXPRESSIONS * 4])
+        finally:
+            pool.close()
+            pool.join()
+
+        for expression, table in zip(EXPRESSIONS * 4, tables):
+            expected = Crosstab(make_data(), expression=expression, weight='w', cache=self.cache)._crosstab
+            pd.testing.assert_frame_equal(table, expected)
+        self.assertEqual(self.cache.hits, len(tables))
+
+
+if __name__ == '__main__':
+    unittest.main()
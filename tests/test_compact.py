@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import unittest
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.survey import SurveyData, SurveyStructure
+from pymeera.utils.compact import compact_series
+from pymeera.tools.crosstab import Crosstab
+from tests.test_crosstab import make_data
+
+
+class TestCompact(unittest.TestCase):
+
+    def test_answers(self):
+        series = compact_series(pd.Series([1., np.nan, 3.]), domain={1: 'a', 2: 'b', 3: 'c'})
+
+        self.assertEqual(series.cat.codes.dtype, np.int8)
+        self.assertEqual(series.cat.codes.tolist(), [0, -1, 2])
+        self.assertEqual(series.cat.categories.tolist(), [1, 2, 3])
+
+    def test_continuous(self):
+        weights = pd.Series([.5, 1.5, 1.])
+        self.assertIs(compact_series(weights), weights)
+
+        ids = compact_series(pd.Series(np.arange(100, dtype=np.int64)), max_categories=10)
+        self.assertEqual(ids.dtype, np.int8)
+
+    def test_domain_from_structure(self):
+        structure = SurveyStructure.from_list([{'variable_id': 'q1', 'variable_values': {1: 'a', 5: 'b'}}])
+        sd = SurveyData(pd.DataFrame({'q1': [1., 1., np.nan], 'w': [.5, 1., 2.]}), structure=structure, compact=True)
+
+        self.assertEqual(sd.data['q1'].cat.categories.tolist(), [1, 5])
+        self.assertEqual(sd.data['w'].dtype, np.float64)
+
+    def test_crosstab(self):
+        df = make_data()
+        sd = SurveyData(df, compact=True)
+
+        for column in ['q1', 'q2', 'q3', 'r1', 'r2']:
+            self.assertEqual(sd.data[column].cat.codes.dtype, np.int8)
+
+        expression = 'q1 + q2 > q3 by r1 > r2 + q2'
+        compact = sd.cross(expression, weight='w')._crosstab
+        plain = Crosstab(df, expression=expression, weight='w')._crosstab
+
+        pd.testing.assert_frame_equal(compact, plain, check_index_type=False, check_column_type=False)
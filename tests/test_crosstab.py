@@ -0,0 +1,674 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import unittest
+import tempfile
+import types
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.survey import SurveyData, SurveyStructure
+from pymeera.tools.crosstab import Crosstab, ENGINES
+from pymeera.tools.tablebook import TableBook
+from pymeera.tools.parallel import ParallelTableBook
+from pymeera.tools.counting import CodeBook, SparseBlock, compile_filter, cross_counts
+
+
+def make_data(size=200, seed=0):
+    rnd = np.random.RandomState(seed)
+    df = pd.DataFrame({
+        'q1': rnd.randint(1, 4, size).astype(float),
+        'q2': rnd.randint(1, 3, size),
+        'q3': rnd.randint(1, 5, size).astype(float),
+        'r1': rnd.randint(1, 3, size),
+        'r2': rnd.randint(1, 4, size).astype(float),
+        'w': rnd.uniform(0.5, 2., size),
+    })
+    df.loc[rnd.rand(size) < .2, 'q1'] = np.nan
+    df.loc[rnd.rand(size) < .2, 'q3'] = np.nan
+    df.loc[rnd.rand(size) < .1, 'r2'] = np.nan
+    return df
+
+
+def make_deep_data(size=1000, variables=5, values=12, seed=0):
+    rnd = np.random.RandomState(seed)
+    df = pd.DataFrame(dict(('d%d' % (k, ), rnd.randint(1, values + 1, size).astype(float)) for k in range(variables)))
+    df['q1'] = rnd.randint(1, 4, size).astype(float)
+    df['w'] = rnd.uniform(.5, 2., size)
+    df.loc[rnd.rand(size) < .1, 'd0'] = np.nan
+    df.loc[rnd.rand(size) < .1, 'q1'] = np.nan
+    return df
+
+
+class TestCrosstab(unittest.TestCase):
+
+    def assertSameTable(self, expression, **kwargs):
+        df = make_data()
+        legacy = Crosstab(data=df, expression=expression, engine='pandas', **kwargs)._crosstab
+        fast = Crosstab(data=df, expression=expression, **kwargs)._crosstab
+
+        self.assertEqual(set(legacy.index), set(fast.index))
+        self.assertEqual(set(legacy.columns), set(fast.columns))
+        pd.testing.assert_frame_equal(
+            fast.reindex(index=legacy.index, columns=legacy.columns),
+            legacy.astype(float),
+            check_dtype=False,
+            check_index_type=False,
+            check_column_type=False
+        )
+
+    def test_simple(self):
+        self.assertSameTable('q1 by r1')
+
+    def test_stacked(self):
+        self.assertSameTable('q1 + q3 by r1 + r2')
+
+    def test_nested(self):
+        self.assertSameTable('q1 + q2 > q3 by r1 > r2 + q2')
+
+    def test_weighted(self):
+        self.assertSameTable('q1 + q2 > q3 by r1 > r2 + q2', weight='w')
+
+    def test_counts(self):
+        df = pd.DataFrame({'q1': [1, 1, 2, None], 'q2': [1, 2, 2, 2]})
+        cross = Crosstab(data=df, expression='q1 by q2')
+
+        self.assertEqual(cross._counts.cells[0, 0].tolist(), [[1, 1], [0, 1]])
+        self.assertEqual(cross._counts.base[0].tolist(), [1, 2])
+
+    def test_weighted_block_without_observations(self):
+        df = pd.DataFrame({'q1': [1, None], 'q2': [1, 2], 'q3': [None, 1], 'w': [1., 2.]})
+        cross = Crosstab(data=df, expression='q1 + q2 by q3', weight='w')
+
+        self.assertEqual(cross._counts.cells[0, 0].dtype, np.float64)
+        self.assertEqual(cross._crosstab.values.tolist(), [[2.], [2.]])
+
+    def test_unknown_engine(self):
+        with self.assertRaises(Exception):
+            Crosstab(data=make_data(), expression='q1 by r1', engine='spark')
+
+    def test_structured_axes(self):
+        df = pd.DataFrame({'q::1': [1, 2, 2], 'q__2': [1.5, 2.5, None], 'w': [1, 1, 1]})
+        cross = Crosstab(data=df, rows=[['q__2']], columns=[['q::1']])
+
+        self.assertEqual(cross._crosstab.columns.tolist(), [('q::1', 1), ('q::1', 2)])
+        self.assertEqual(
+            cross._crosstab.index.tolist(),
+            [('q__2', 1.5, '$COUNT$'), ('q__2', 2.5, '$COUNT$'), ('$BASE$', '', '$COUNT$')]
+        )
+        self.assertIsInstance(cross._crosstab.columns.get_level_values(1)[0], (int, np.integer))
+
+    def test_labeled(self):
+        df = pd.DataFrame({'q1': [1, 2, 2], 'q2': [1, 1, 2]})
+        cross = Crosstab(data=df, expression='q1 by q2')
+
+        table = cross.labeled(variable_labels={'q1': 'Gender'}, value_labels={'q1': {1: 'Male', 2: 'Female'}})
+        self.assertEqual(table.index.tolist()[:2], [('Gender', 'Male', '$COUNT$'), ('Gender', 'Female', '$COUNT$')])
+        self.assertEqual(table.columns.tolist(), [('q2', 1), ('q2', 2)])
+        self.assertEqual(cross._crosstab.index.tolist()[0], ('q1', 1, '$COUNT$'))
+
+
+class TestTableBook(unittest.TestCase):
+
+    def test_banner_with_stubs(self):
+        df = make_data()
+        sd = SurveyData(df)
+
+        tables = sd.cross(banner='r1 + r1 > r2', stubs=['q1', 'q2 + q3'], weight='w')
+        self.assertIsInstance(tables, types.GeneratorType)
+
+        tables = list(tables)
+        self.assertEqual(len(tables), 2)
+        for table, expression in zip(tables, ['q1 by r1 + r1 > r2', 'q2 + q3 by r1 + r1 > r2']):
+            single = Crosstab(data=df, expression=expression, weight='w')
+            pd.testing.assert_frame_equal(table._crosstab, single._crosstab)
+
+    def test_parallel_codes_released(self):
+        df = make_data()
+        book = ParallelTableBook(df, expressions=['q1 + q2 by r1', 'q3 by r1 > r2'], weight='w', workers=2)
+        factor = book.codebook.factor
+        cached = []
+
+        def _factor(variable_id):
+            cached.append(len(book.codebook._factors))
+            return factor(variable_id)
+
+        with mock.patch.object(book.codebook, 'factor', side_effect=_factor):
+            tables = iter(book)
+            table = next(tables)
+        tables.close()
+
+        # every factor is released once its codes are in shared memory
+        self.assertEqual(cached, [0] * 5)
+        self.assertEqual((book.codebook._factors, book.codebook._weights), ({}, {}))
+        pd.testing.assert_frame_equal(table._crosstab, Crosstab(df, expression='q1 + q2 by r1', weight='w')._crosstab)
+
+    def test_shared_codebook(self):
+        df = make_data()
+        book = TableBook(df, expressions=['q1 by r1 > r2', 'q3 by r1 > r2'])
+
+        tables = iter(book)
+        first = next(tables)
+        # banner is still needed by the second table, stub is released
+        self.assertIn(('r1', 'r2'), book.codebook._groups)
+        self.assertNotIn('q1', book.codebook._factors)
+
+        second = next(tables)
+        self.assertIs(first._codebook, second._codebook)
+        self.assertEqual(book.codebook._factors, {})
+
+    def test_single_expression(self):
+        table = SurveyData(make_data()).cross('q1 by r1')
+        self.assertIsInstance(table, Crosstab)
+
+    def test_parallel(self):
+        df = make_data()
+        expressions = ['q1 by r1 + r1 > r2', 'q2 + q3 by r1 + r1 > r2', 'q2 > q3 by q1', 'q1 by r1 + r1 > r2']
+
+        tables = SurveyData(df).cross(expressions, weight='w', workers=2, chunksize=1)
+        self.assertIsInstance(tables, types.GeneratorType)
+
+        for table, expression in zip(tables, expressions):
+            self.assertIsNone(table.data)
+            single = Crosstab(data=df, expression=expression, weight='w')
+            pd.testing.assert_frame_equal(table._crosstab, single._crosstab)
+
+
+class TestStreaming(unittest.TestCase):
+
+    def test_chunks(self):
+        df = make_data(size=500)
+        expression = 'q1 + q2 > q3 by r1 > r2 + q2'
+
+        chunks = (df.iloc[start:start + 70] for start in range(0, len(df), 70))
+        streamed = Crosstab(chunks, expression=expression, weight='w')
+        whole = Crosstab(df, expression=expression, weight='w')
+
+        self.assertIsNone(streamed.data)
+        pd.testing.assert_frame_equal(streamed._crosstab, whole._crosstab)
+
+    def test_new_values_in_chunks(self):
+        df = pd.DataFrame({'q1': [1, 1, 2, 3, 3], 'q2': [1, 2, 2, 2, 3]})
+        chunks = iter([df.iloc[:2], df.iloc[2:3], df.iloc[3:]])
+
+        streamed = Crosstab(chunks, expression='q1 by q2')
+        whole = Crosstab(df, expression='q1 by q2')
+
+        pd.testing.assert_frame_equal(streamed._crosstab, whole._crosstab)
+        self.assertEqual(streamed._counts.levels['q2'].tolist(), [1, 2, 3])
+
+    def test_csv_chunks(self):
+        df = make_data(size=300)
+        path = os.path.join(tempfile.mkdtemp(), 'survey.csv')
+        df.to_csv(path, index=False)
+
+        streamed = Crosstab(pd.read_csv(path, chunksize=64), expression='q1 + q3 by r1 > r2', weight='w')
+        whole = Crosstab(pd.read_csv(path), expression='q1 + q3 by r1 > r2', weight='w')
+        pd.testing.assert_frame_equal(streamed._crosstab, whole._crosstab)
+
+    def test_missing_variable(self):
+        with self.assertRaises(Exception):
+            Crosstab(iter([make_data()]), expression='q1 by q9')
+
+
+class TestBase(unittest.TestCase):
+
+    def test_checkbox_base(self):
+        df = pd.DataFrame({'q1_1': [1, None, None, 1], 'q1_2': [None, 1, None, 1], 'r': [1, 1, 1, 2]})
+
+        for engine in ENGINES:
+            table = Crosstab(df, expression='q1_1 + q1_2 by r', engine=engine)._crosstab
+            self.assertEqual(table.loc[('$BASE$', '', '$COUNT$')].tolist(), [2, 1])
+
+    def test_total_and_weights(self):
+        df = make_data()
+        cross = Crosstab(df, expression='q1 + q3 by r1 + r2', weight='w', engine='pandas')
+
+        self.assertEqual(cross.data['__TOTAL__'].dtype, np.float64)
+        self.assertEqual(cross.data['__WEIGHT__'].dtype, np.float64)
+        self.assertEqual(list(cross._answered), [frozenset(['q1', 'q3'])])
+
+        in_base = df['q1'].notna() | df['q3'].notna()
+        np.testing.assert_array_equal(cross.data['__WEIGHT__'].to_numpy(), df['w'].where(in_base).to_numpy())
+
+    def test_answered_cache(self):
+        book = TableBook(make_data(), expressions=['q1 + q3 by r1', 'q3 + q1 by r2', 'q2 by r2'])
+        tables = iter(book)
+        next(tables)
+
+        mask = book.codebook._answered[frozenset(['q1', 'q3'])]
+        self.assertIs(book.codebook.answered(['q3', 'q1']), mask)
+
+
+class TestStatistics(unittest.TestCase):
+
+    def setUp(self):
+        self.df = make_data(size=400)
+        self.cross = Crosstab(self.df, expression='q1 + q2 > q3 by r1', weight='w',
+                              show_column_percentage=True, show_row_percentage=True, show_table_percentage=True,
+                              show_mean=True, show_median=True, show_std=True, show_variance=True,
+                              show_sampling_error=True)
+        self.table = self.cross._crosstab
+
+    def _row(self, variable, value, statistics_type):
+        key = (variable, value) + ('', '') + (statistics_type, )
+        return self.table.loc[key]
+
+    def test_percentages(self):
+        counts = self._row('q1', 1., '$COUNT$')
+        base = self.table.loc[('$BASE$', '', '', '', '$COUNT$')]
+
+        np.testing.assert_allclose(self._row('q1', 1., '$COLUMN_PCT$'), counts / base)
+        q1_counts = self.table.xs('$COUNT$', level='__STATISTICS__TYPE__').loc['q1']
+        np.testing.assert_allclose(self._row('q1', 1., '$ROW_PCT$'), counts / counts.sum())
+        np.testing.assert_allclose(self._row('q1', 1., '$TABLE_PCT$'), counts / q1_counts.values.sum())
+
+    def test_summary(self):
+        df = self.df[self.df['q1'].notna() & (self.df['r1'] == 2)]
+        x, w = df['q1'].to_numpy(), df['w'].to_numpy()
+
+        mean = np.average(x, weights=w)
+        variance = (w * (x - mean) ** 2).sum() / (w.sum() - 1)
+        effective_base = w.sum() ** 2 / (w ** 2).sum()
+
+        self.assertAlmostEqual(self._row('q1', '', '$MEAN$')[('r1', 2)], mean)
+        self.assertAlmostEqual(self._row('q1', '', '$VARIANCE$')[('r1', 2)], variance)
+        self.assertAlmostEqual(self._row('q1', '', '$STD$')[('r1', 2)], np.sqrt(variance))
+        self.assertAlmostEqual(self._row('q1', '', '$SAMPLING_ERROR$')[('r1', 2)], np.sqrt(variance / effective_base))
+
+        order = np.argsort(x)
+        cumulative = np.cumsum(w[order])
+        median = x[order][np.searchsorted(cumulative, cumulative[-1] / 2.)]
+        self.assertEqual(self._row('q1', '', '$MEDIAN$')[('r1', 2)], median)
+
+    def test_no_summary_for_nested_rows(self):
+        self.assertNotIn('$MEAN$', self.table.loc['q2'].index.get_level_values(-1))
+
+    def test_pandas_engine_counts_only(self):
+        with self.assertRaises(Exception):
+            Crosstab(self.df, expression='q1 by r1', engine='pandas', show_mean=True)
+
+
+class TestIncremental(unittest.TestCase):
+
+    def test_append_and_remove(self):
+        df = make_data(size=300)
+        expression = 'q1 + q2 > q3 by r1 > r2 + q2'
+        kwargs = dict(weight='w', show_column_percentage=True, show_mean=True)
+
+        table = Crosstab(df.iloc[:100], expression=expression, **kwargs)
+        table.append(df.iloc[100:200])
+        table.append(df.iloc[200:])
+        pd.testing.assert_frame_equal(table._crosstab, Crosstab(df, expression=expression, **kwargs)._crosstab)
+
+        rejected = df.iloc[[5, 50, 150, 250]]
+        table.remove(rejected)
+        pd.testing.assert_frame_equal(
+            table._crosstab, Crosstab(df.drop(rejected.index), expression=expression, **kwargs)._crosstab
+        )
+
+    def test_shared_batch_codebook(self):
+        df = make_data()
+        tables = [Crosstab(df.iloc[:150], expression=e) for e in ['q1 by r1', 'q3 by r1 + r2']]
+
+        batch = CodeBook(df.iloc[150:])
+        for table in tables:
+            table.append(df.iloc[150:], codebook=batch)
+
+        self.assertIn(('r1', ), batch._groups)
+        pd.testing.assert_frame_equal(tables[1]._crosstab, Crosstab(df, expression='q3 by r1 + r2')._crosstab)
+
+
+class TestLayers(unittest.TestCase):
+
+    def setUp(self):
+        self.df = make_data(size=2000)
+        self.kwargs = dict(weight='w', show_column_percentage=True, show_table_percentage=True, show_mean=True)
+
+    def assertSameLayer(self, layer, expected):
+        # rows observed only in other layers are empty
+        pd.testing.assert_frame_equal(layer.loc[expected.index, expected.columns], expected,
+                                      check_names=False, check_column_type=False)
+        self.assertTrue(layer.drop(expected.index).isnull().all().all())
+
+    def test_layers(self):
+        table = Crosstab(self.df, expression='q1 + q2 by r1 + r2 by q3', **self.kwargs)
+        self.assertEqual(table.layers, [(0, (1., )), (0, (2., )), (0, (3., )), (0, (4., ))])
+
+        for _, (value, ) in table.layers:
+            expected = Crosstab(self.df[self.df['q3'] == value], expression='q1 + q2 by r1 + r2', **self.kwargs)
+            self.assertSameLayer(table.layer(value), expected._crosstab)
+
+    def test_nested_and_stacked_layers(self):
+        table = Crosstab(self.df, expression='q1 by r1 by q2 > r2 + q3', **self.kwargs)
+
+        layer = table.layer((1, 3.))
+        expected = Crosstab(self.df[(self.df['q2'] == 1) & (self.df['r2'] == 3.)], expression='q1 by r1', **self.kwargs)
+        self.assertSameLayer(layer, expected._crosstab)
+
+        expected = Crosstab(self.df[self.df['q3'] == 4.], expression='q1 by r1', **self.kwargs)
+        self.assertSameLayer(table.layer(4., layer_group=1), expected._crosstab)
+
+    def test_tensor(self):
+        table = Crosstab(self.df, expression='q1 by r1 by q3', weight='w')
+        tensor = table.tensor()
+        self.assertEqual(tensor.shape, (3, 4, 2))
+        self.assertTrue(np.shares_memory(tensor, table._counts.cells[0, 0]))
+
+        layer = self.df[self.df['q3'] == 2.]
+        expected = layer.groupby(['q1', 'r1'])['w'].sum().unstack().to_numpy()
+        np.testing.assert_allclose(tensor[:, 1, :], expected)
+
+    def test_chunks_and_append(self):
+        expression = 'q1 by r1 by q3'
+        expected = Crosstab(self.df, expression=expression, **self.kwargs)
+
+        chunks = (self.df.iloc[i:i + 500] for i in range(0, len(self.df), 500))
+        pd.testing.assert_frame_equal(Crosstab(chunks, expression=expression, **self.kwargs)._crosstab,
+                                      expected._crosstab)
+
+        table = Crosstab(self.df.iloc[:1000], expression=expression, **self.kwargs)
+        table.append(self.df.iloc[1000:])
+        pd.testing.assert_frame_equal(table._crosstab, expected._crosstab)
+
+    def test_pandas_engine(self):
+        with self.assertRaises(Exception):
+            Crosstab(self.df, expression='q1 by r1 by q3', engine='pandas')
+
+
+class TestSparse(unittest.TestCase):
+
+    def setUp(self):
+        self.df = make_deep_data()
+        self.deep = 'd0 > d1 > d2 > d3 > d4'
+        self.kwargs = dict(weight='w', show_column_percentage=True, show_row_percentage=True, show_mean=True)
+
+    def assertSameTable(self, expression, data=None, **kwargs):
+        data = self.df if data is None else data
+        kwargs = dict(self.kwargs, **kwargs)
+        sparse = Crosstab(data, expression=expression, sparse=True, **kwargs)
+        pd.testing.assert_frame_equal(
+            sparse._crosstab, Crosstab(data, expression=expression, sparse=False, **kwargs)._crosstab
+        )
+        return sparse
+
+    def test_automatic(self):
+        table = Crosstab(self.df, expression='q1 by %s' % (self.deep, ), weight='w')
+        counts = table._counts
+
+        # 12 ** 5 combinations, but at most one per respondent
+        self.assertEqual(list(counts.keys), [tuple(self.deep.split(' > '))])
+        self.assertLessEqual(counts.cells[0, 0].shape[1], len(self.df))
+        self.assertNotIn(('q1', ), counts.keys)
+
+        self.assertEqual(Crosstab(self.df, expression='q1 by d0 > d1', weight='w')._counts.keys, {})
+
+    def test_sparse_block(self):
+        # 12 ** 3 rows and 12 ** 2 columns are dense groups, but their block is mostly empty
+        expression = 'd0 > d1 > d2 by d3 > d4'
+        table = Crosstab(self.df, expression=expression, **self.kwargs)
+        dense = Crosstab(self.df, expression=expression, sparse=False, **self.kwargs)
+        counts = table._counts
+
+        self.assertEqual(counts.keys, {})
+        self.assertIsInstance(counts.cells[0, 0], SparseBlock)
+        self.assertLessEqual(len(counts.cells[0, 0].keys), len(self.df))
+        pd.testing.assert_frame_equal(table._crosstab, dense._crosstab)
+        np.testing.assert_allclose(counts.dense(0, 0), dense._counts.dense(0, 0))
+        self.assertSameTable(expression, weight=None)
+
+    def test_sparse_block_size(self):
+        # every group has 64000 cells, block has 4.1e9 cells, dense block does not fit in memory
+        rnd = np.random.RandomState(0)
+        df = pd.DataFrame(dict(('v%d' % (k, ), rnd.randint(1, 41, 20000)) for k in range(6)))
+        counts = cross_counts(CodeBook(df), [['v0', 'v1', 'v2']], [['v3', 'v4', 'v5']])
+
+        block = counts.observed[0, 0]
+        self.assertIsInstance(block, SparseBlock)
+        self.assertEqual(block.shape, (64000, 64000))
+        self.assertEqual(block.values.sum(), len(df))
+        np.testing.assert_array_equal(block.sum(axis=0), counts.base_observed[0])
+
+    def test_same_table(self):
+        self.assertSameTable('q1 by %s' % (self.deep, ))
+        self.assertSameTable('q1 + d0 > d1 > d2 by d2 > d3 > d4 + d3')
+        self.assertSameTable('q1 + d1 by q1 + d0 > d1 by d3 > d4')
+        self.assertSameTable('q1 by d0 > d1 by d2 > d3 > d4 + q1')
+
+    def test_layer_and_tensor(self):
+        table = self.assertSameTable('q1 by d0 by d1 > d2')
+        dense = Crosstab(self.df, expression='q1 by d0 by d1 > d2', sparse=False, **self.kwargs)
+
+        self.assertEqual(table.layers, dense.layers)
+        pd.testing.assert_frame_equal(table.layer((3., 4.)), dense.layer((3., 4.)))
+        np.testing.assert_array_equal(table.tensor(), dense.tensor())
+
+    def test_append_and_chunks(self):
+        expression = 'q1 by %s + d0' % (self.deep, )
+        expected = Crosstab(self.df, expression=expression, sparse=False, **self.kwargs)
+
+        table = Crosstab(self.df.iloc[:400], expression=expression, sparse=True, **self.kwargs)
+        table.append(self.df.iloc[400:])
+        pd.testing.assert_frame_equal(table._crosstab, expected._crosstab)
+
+        table.remove(self.df.iloc[:200])
+        pd.testing.assert_frame_equal(
+            table._crosstab, Crosstab(self.df.iloc[200:], expression=expression, sparse=False, **self.kwargs)._crosstab
+        )
+
+        chunks = iter([self.df.iloc[:100], self.df.iloc[100:]])
+        table = Crosstab(chunks, expression=expression, **self.kwargs)
+        pd.testing.assert_frame_equal(table._crosstab, expected._crosstab)
+
+    def test_sparse_and_dense_counts(self):
+        rows, columns = [['q1']], [['d0', 'd1', 'd2'], ['d3']]
+        first = cross_counts(CodeBook(self.df.iloc[:300]), rows, columns, weight='w', sparse=True)
+        second = cross_counts(CodeBook(self.df.iloc[300:]), rows, columns, weight='w', sparse=False)
+        expected = cross_counts(CodeBook(self.df), rows, columns, weight='w', sparse=False)
+
+        total = first + second
+        # group sparse in any of counts is sparse in their sum
+        self.assertEqual(set(total.keys), {('q1', ), ('d0', 'd1', 'd2'), ('d3', )})
+        for j in range(len(columns)):
+            np.testing.assert_allclose(total.dense(0, j), expected.dense(0, j))
+            np.testing.assert_allclose(total.base[j], expected.base[j][total.keys[tuple(columns[j])]])
+
+    def test_save_and_load(self):
+        expression = 'q1 by %s' % (self.deep, )
+        table = Crosstab(self.df, expression=expression, sparse=True, **self.kwargs)
+        path = os.path.join(tempfile.mkdtemp(), 'table.bin')
+        table.save(path)
+
+        loaded = Crosstab.load(path)
+        self.assertEqual(list(loaded._counts.keys), list(table._counts.keys))
+        pd.testing.assert_frame_equal(loaded._crosstab, table._crosstab)
+
+
+class TestLazy(unittest.TestCase):
+
+    def setUp(self):
+        self.df = make_data()
+        self.expression = 'q1 + q2 > q3 by r1 + r2'
+
+    def test_deferred(self):
+        with mock.patch.object(Crosstab, '_evaluate') as evaluate:
+            table = Crosstab(self.df, expression=self.expression, weight='w', lazy=True)
+            evaluate.assert_not_called()
+
+        # expression is checked at once
+        with self.assertRaises(Exception):
+            Crosstab(self.df, expression='q1 by missing', lazy=True)
+
+        pd.testing.assert_frame_equal(table._crosstab,
+                                      Crosstab(self.df, expression=self.expression, weight='w')._crosstab)
+        self.assertIs(table.evaluate(), table)
+
+    def test_lazy_book(self):
+        expressions = ['q1 by r1 > r2', 'q3 by r1 > r2', 'q2 by r1']
+        book = TableBook(self.df, expressions=expressions, weight='w', lazy=True)
+        tables = list(book)
+
+        # tables are counted while their codes are shared, released codes are not factorized again
+        self.assertTrue(all(table._table is not None for table in tables))
+        self.assertEqual(book.codebook._factors, {})
+        for table, expression in zip(tables, expressions):
+            pd.testing.assert_frame_equal(table.evaluate()._crosstab,
+                                          Crosstab(self.df, expression=expression, weight='w')._crosstab)
+        self.assertEqual(book.codebook._factors, {})
+
+    def test_lazy_pandas_engine(self):
+        table = Crosstab(self.df, expression=self.expression, weight='w', engine='pandas', lazy=True)
+        self.assertIs(table.data, self.df)
+        pd.testing.assert_frame_equal(
+            table._crosstab, Crosstab(self.df, expression=self.expression, weight='w', engine='pandas')._crosstab
+        )
+
+    def test_views(self):
+        table = Crosstab(self.df, expression=self.expression, weight='w', lazy=True, show_mean=True)
+
+        with mock.patch('pymeera.tools.crosstab.cross_counts', wraps=cross_counts) as counted:
+            views = [table.counts(), table.column_percentage(), table.row_percentage(), table.table_percentage()]
+            self.assertEqual(counted.call_count, 1)
+        expected = table._crosstab.copy()
+
+        for view, option in zip(views, ['show_counts', 'show_column_percentage', 'show_row_percentage',
+                                        'show_table_percentage']):
+            kwargs = dict((o, o == option) for o in ['show_counts', 'show_column_percentage', 'show_row_percentage',
+                                                     'show_table_percentage'])
+            pd.testing.assert_frame_equal(
+                view, Crosstab(self.df, expression=self.expression, weight='w', **kwargs)._crosstab
+            )
+
+        # views are independent and do not change the table
+        views[1].iloc[0, 0] = -1.
+        self.assertNotEqual(table.column_percentage().iloc[0, 0], -1.)
+        pd.testing.assert_frame_equal(table._crosstab, expected)
+        self.assertEqual(set(table._crosstab.index.get_level_values(-1)), {'$COUNT$', '$MEAN$'})
+
+        counts = Crosstab(self.df, expression=self.expression)
+        percentages = counts.as_cpct()
+        pd.testing.assert_frame_equal(percentages, counts.column_percentage())
+        pd.testing.assert_frame_equal(counts.counts(), counts._crosstab)
+        self.assertFalse(np.shares_memory(counts.counts().values, counts._crosstab.values))
+        self.assertEqual(counts._crosstab.iloc[0, 0], Crosstab(self.df, expression=self.expression)._crosstab.iloc[0, 0])
+
+        table = Crosstab(self.df, expression=self.expression, engine='pandas')
+        expected = table._crosstab.copy()
+        percentages = table.as_cpct()
+        pd.testing.assert_frame_equal(table._crosstab, expected)
+        pd.testing.assert_frame_equal(percentages.iloc[:-1], expected.iloc[:-1] / expected.iloc[-1])
+
+        with self.assertRaises(Exception):
+            table.view('$MEAN$')
+
+    def test_views_after_append(self):
+        table = Crosstab(self.df.iloc[:100], expression=self.expression, weight='w')
+        table.column_percentage()
+        table.append(self.df.iloc[100:])
+        pd.testing.assert_frame_equal(
+            table.column_percentage(),
+            Crosstab(self.df, expression=self.expression, weight='w', show_counts=False,
+                     show_column_percentage=True)._crosstab
+        )
+
+
+class TestFilter(unittest.TestCase):
+
+    def setUp(self):
+        self.df = make_data(size=500)
+        self.df['region'] = np.random.RandomState(1).choice(['north', 'south', 'west'], len(self.df))
+        self.kwargs = dict(weight='w', show_column_percentage=True, show_mean=True)
+
+    def test_filtered_table(self):
+        expected = Crosstab(self.df[(self.df['r2'] >= 2) & (self.df['q2'] == 1)], expression='q1 + q3 by r1',
+                            **self.kwargs)
+
+        table = Crosstab(self.df, expression='q1 + q3 by r1 where r2 >= 2 and q2 = 1', **self.kwargs)
+        pd.testing.assert_frame_equal(table._crosstab, expected._crosstab)
+
+        # filter argument is combined with filter of expression
+        table = Crosstab(self.df, expression='q1 + q3 by r1 where r2 >= 2', filter='q2 = 1', **self.kwargs)
+        self.assertEqual(table.filter, ['and', ['>=', 'r2', 2], ['=', 'q2', 1]])
+        pd.testing.assert_frame_equal(table._crosstab, expected._crosstab)
+
+    def test_missing_answers(self):
+        # respondents without answer to r2 match neither comparison, but match its negation
+        table = Crosstab(self.df, expression='q1 by r1', filter='not r2 in (1, 2)', **self.kwargs)
+        expected = Crosstab(self.df[~self.df['r2'].isin([1, 2])], expression='q1 by r1', **self.kwargs)
+        pd.testing.assert_frame_equal(table._crosstab, expected._crosstab)
+
+        table = Crosstab(self.df, expression='q1 by r1', filter='r2 != 3', **self.kwargs)
+        expected = Crosstab(self.df[self.df['r2'].notnull() & (self.df['r2'] != 3)], expression='q1 by r1',
+                            **self.kwargs)
+        pd.testing.assert_frame_equal(table._crosstab, expected._crosstab)
+
+    def test_string_values_and_engines(self):
+        subset = self.df[self.df['region'].isin(['north', 'west']) & (self.df['r1'] == 2)]
+        for engine in ENGINES:
+            table = Crosstab(self.df, expression='q1 + q2 by r2 where region in ("north", "west") and r1 = 2',
+                             weight='w', engine=engine)
+            expected = Crosstab(subset, expression='q1 + q2 by r2', weight='w', engine=engine)
+            pd.testing.assert_frame_equal(table._crosstab, expected._crosstab)
+
+        with self.assertRaises(Exception):
+            Crosstab(self.df, expression='q1 by r1 where region > 2')
+        with self.assertRaises(Exception):
+            Crosstab(self.df, expression='q1 by r1 where missing = 2')
+
+    def test_patterns(self):
+        self.df.loc[:9, 'region'] = 'n*h'
+        structure = SurveyStructure.from_list([{'variable_id': v} for v in self.df.columns])
+        sd = SurveyData(self.df, structure=structure)
+
+        # quoted value of filter is not glob pattern
+        table = sd.cross('q* by r1 where region = "n*h"', weight='w')
+        expected = Crosstab(self.df.iloc[:10], expression='q1 + q2 + q3 by r1', weight='w')
+        pd.testing.assert_frame_equal(table._crosstab, expected._crosstab)
+
+    def test_layers_chunks_and_append(self):
+        expression = 'q1 by r1 by q2 where r2 >= 2'
+        expected = Crosstab(self.df[self.df['r2'] >= 2], expression='q1 by r1 by q2', **self.kwargs)
+
+        chunks = (self.df.iloc[i:i + 100] for i in range(0, len(self.df), 100))
+        pd.testing.assert_frame_equal(Crosstab(chunks, expression=expression, **self.kwargs)._crosstab,
+                                      expected._crosstab)
+
+        table = Crosstab(self.df.iloc[:200], expression=expression, **self.kwargs)
+        table.append(self.df.iloc[200:])
+        pd.testing.assert_frame_equal(table._crosstab, expected._crosstab)
+
+        path = os.path.join(tempfile.mkdtemp(), 'table.bin')
+        table.save(path)
+        self.assertEqual(Crosstab.load(path).filter, ['>=', 'r2', 2])
+
+    def test_shared_mask(self):
+        codebook = CodeBook(self.df)
+        with mock.patch('pymeera.tools.counting.compile_filter', wraps=compile_filter) as compiled:
+            tables = list(TableBook(codebook, banner='r1 + r2', stubs=['q1', 'q2', 'q3'], weight='w',
+                                    filter='region = "south" and q2 = 1'))
+            # the whole condition is compiled once, its comparisons are compiled by recursive calls
+            self.assertEqual(len([c for c in compiled.call_args_list if c[0][0][0] == 'and']), 1)
+
+        expected = Crosstab(self.df[(self.df['region'] == 'south') & (self.df['q2'] == 1)],
+                            expression='q3 by r1 + r2', weight='w')
+        pd.testing.assert_frame_equal(tables[-1]._crosstab, expected._crosstab)
+        # mask is released with the last table that uses its variables
+        self.assertEqual(codebook._masks, {})
+
+        Crosstab(codebook, expression='q1 by r1 where region = "south" and q2 = 1')
+        Crosstab(codebook, expression='q3 by r2 where q2 = 1 and  region = "south"')
+        self.assertEqual(list(codebook._masks), ['q2 = 1 and region = "south"'])
+
+        codebook.drop(['region'])
+        self.assertEqual(codebook._masks, {})
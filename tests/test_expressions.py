@@ -8,7 +8,7 @@ import os
 
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from pymeera.utils.exprparser import Expression
+from pymeera.utils.exprparser import Expression, filter_text, filter_variables, combine_filters, split_filter
 
 
 class TestExpressionParser(unittest.TestCase):
@@ -87,3 +87,83 @@ class TestExpressionParser(unittest.TestCase):
             parsed['columns']
         )
         self.assertEqual([['q7']], parsed['additional_axis'])
+
+    def test_cache(self):
+        Expression.cache_clear()
+
+        Expression.parse(expression='q1 by q2 + q3')
+        parsed = Expression.parse(expression='q4 by  q2 +  q3')
+
+        info = Expression.cache_info()
+        self.assertEqual(info.misses, 3)
+        self.assertEqual(info.hits, 1)
+        self.assertEqual(info.currsize, 3)
+        self.assertEqual([['q2'], ['q3']], parsed['columns'])
+
+    def test_cache_returns_copies(self):
+        parsed = Expression.parse(expression='q1 by q2 > q3')
+        parsed['columns'][0].append('q4')
+        parsed['columns'].append(['q5'])
+
+        self.assertEqual([['q2', 'q3']], Expression.parse(expression='q1 by q2 > q3')['columns'])
+
+
+class TestFilter(unittest.TestCase):
+
+    def test_where(self):
+        parsed = Expression.parse(expression='q1 + q2 by q3 by q4  where region = 3 and age >= 35')
+
+        self.assertEqual([['q1'], ['q2']], parsed['rows'])
+        self.assertEqual([['q4']], parsed['additional_axis'])
+        self.assertEqual(['and', ['=', 'region', 3], ['>=', 'age', 35]], parsed['filter'])
+        self.assertIsNone(Expression.parse(expression='q1 by q2')['filter'])
+
+        parsed = Expression.parse(expression='q1 BY q2 WHERE a = 1')
+        self.assertEqual([['q2']], parsed['columns'])
+        self.assertEqual(['=', 'a', 1], parsed['filter'])
+        with self.assertRaises(Exception):
+            Expression.parse(expression='q1 by q2 = 1')
+
+    def test_quoted_values(self):
+        parsed = Expression.parse(expression='q1  by q2 where city = "New  York" or city = "a where  b"')
+        self.assertEqual(['or', ['=', 'city', 'New  York'], ['=', 'city', 'a where  b']], parsed['filter'])
+        self.assertEqual(['=', 'city', 'New York'], Expression.parse_filter('city  =  "New York"'))
+        self.assertEqual(['=', 'city', 'New  York'], Expression.parse_filter('city = "New  York"'))
+        self.assertEqual(('q1 by q2', 'city = " where "'), split_filter('q1 by q2  Where  city = " where "'))
+        self.assertEqual(('q1 by q2', None), split_filter('q1 by q2'))
+
+    def test_conditions(self):
+        self.assertEqual(['!=', 'city', 'Moscow'], Expression.parse_filter('city <> "Moscow"'))
+        self.assertEqual(['in', 'q5', [1, 2.5, 'x']], Expression.parse_filter("q5 in (1, 2.5, 'x')"))
+        self.assertEqual(
+            ['or', ['not', ['<', 'a', -1]], ['and', ['=', 'b', 1], ['=', 'c', 2], ['=', 'd', 3]]],
+            Expression.parse_filter('NOT a < -1 or b == 1 and (c = 2 and d = 3)')
+        )
+
+        for condition in ['region', 'region = ', 'region = 3 and', 'q1 in ()', 'and = 1']:
+            with self.assertRaises(Exception):
+                Expression.parse_filter(condition)
+
+    def test_normalized_text(self):
+        text = filter_text(Expression.parse_filter('(age>=35  AND region=3) or not q5 in (1, 2)'))
+        self.assertEqual('(age >= 35 and region = 3) or not q5 in (1, 2)', text)
+        self.assertEqual(text, filter_text(Expression.parse_filter('not q5 in (1,2) or region = 3 and age >= 35')))
+        self.assertEqual(text, filter_text(Expression.parse_filter(text)))
+
+    def test_variables(self):
+        condition = Expression.parse_filter('region = 3 and (age >= 35 or region in (1, 2)) and not q5 = "x"')
+        self.assertEqual(['region', 'age', 'q5'], filter_variables(condition))
+        self.assertEqual([], filter_variables(None))
+
+    def test_combine(self):
+        self.assertIsNone(combine_filters(None, None))
+        self.assertEqual(['=', 'a', 1], combine_filters(None, ['=', 'a', 1]))
+        self.assertEqual(
+            ['and', ['=', 'a', 1], ['=', 'b', 2], ['=', 'c', 3]],
+            combine_filters(Expression.parse_filter('a = 1 and b = 2'), ['=', 'c', 3])
+        )
+
+    def test_cache_returns_copies(self):
+        condition = Expression.parse_filter('region in (1, 2)')
+        condition[2].append(3)
+        self.assertEqual(['in', 'region', [1, 2]], Expression.parse_filter('region  in (1, 2)'))
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import unittest
+import tempfile
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.survey import SurveyData
+from pymeera.utils import loaders
+from tests.test_crosstab import make_data
+
+
+def make_wide_data(size=200):
+    df = make_data(size=size)
+    for k in range(1, 4):
+        df['m_%d' % (k, )] = np.where(np.arange(size) % (k + 1) == 0, k, np.nan)
+    df['text'] = ['open answer %d' % (i, ) for i in range(size)]
+    return df
+
+
+class TestLoaders(unittest.TestCase):
+
+    def setUp(self):
+        self.df = make_wide_data()
+        self.path = os.path.join(tempfile.mkdtemp(), 'data.csv')
+        self.df.to_csv(self.path, index=False)
+
+    def test_referenced_variables(self):
+        self.assertEqual(loaders.referenced_variables(['q1 by r1 + r2', 'q3 > q1 by r1 where q2 = 1'], weight='w'),
+                         ['q1', 'r1', 'r2', 'q3', 'q2', 'w'])
+        self.assertEqual(loaders.referenced_variables(['q1 by r1'], filter='q2 in (1, 2)'), ['q1', 'r1', 'q2'])
+
+    def test_downcast(self):
+        frame = loaders.concat_chunks([self.df.iloc[:50], self.df.iloc[50:]])
+
+        self.assertEqual(frame['q2'].dtype, np.int8)
+        self.assertEqual(frame['q1'].dtype, np.float32)
+        self.assertEqual(frame['w'].dtype, np.float64)
+        np.testing.assert_array_equal(frame['q1'].to_numpy(), self.df['q1'].to_numpy())
+        self.assertEqual(loaders.downcast_series(pd.Series([1., 2 ** 30, np.nan])).dtype, np.float64)
+
+    def test_read_csv(self):
+        with mock.patch.object(pd, 'read_csv', wraps=pd.read_csv) as read:
+            sd = SurveyData.read_csv(self.path, expressions=['q1 by r1', 'm_* by r2'], weight='w',
+                                     filter='q2 = 1', value_labels={'q1': {1: 'a', 2: 'b', 3: 'c'}, 'q3': {1: 'x'}},
+                                     variable_labels={'q1': 'Q1', 'text': 'Text'}, chunksize=64)
+
+        self.assertEqual(list(sd.data.columns), ['q1', 'r1', 'q2', 'm_1', 'm_2', 'm_3', 'r2', 'w'])
+        self.assertEqual(read.call_args_list[-1][1]['usecols'], list(sd.data.columns))
+        self.assertEqual(sd.variable_labels, {'q1': 'Q1'})
+        self.assertEqual(list(sd.value_labels), ['q1'])
+        self.assertIsInstance(sd.data['q1'].dtype, pd.CategoricalDtype)
+        self.assertEqual(sd.structure.get_variable_by_id('q1').variable_label, 'Q1')
+        self.assertEqual(sd.structure.select('m_*'), ['m_1', 'm_2', 'm_3'])
+
+        expected = SurveyData(self.df)
+        for expression in ['q1 by r1', 'm_1 + m_2 + m_3 by r2']:
+            table = sd.cross(expression, weight='w', filter='q2 = 1')
+            # labels keep compact dtypes of loaded columns
+            pd.testing.assert_frame_equal(
+                table._crosstab, expected.cross(expression, weight='w', filter='q2 = 1')._crosstab,
+                check_index_type=False, check_column_type=False
+            )
+
+    def test_read_all(self):
+        sd = SurveyData.read_csv(self.path, compact=False)
+        self.assertEqual(list(sd.data.columns), list(self.df.columns))
+        self.assertEqual(sd.data['r2'].dtype, np.float32)
+
+        with self.assertRaises(Exception):
+            SurveyData.read_csv(self.path, expressions=['q1 by missing'])
+
+        sd = SurveyData.read_csv(self.path, expressions=['m_* by r1 where text != "open*"'])
+        self.assertEqual(list(sd.data.columns), ['m_1', 'm_2', 'm_3', 'r1', 'text'])
+
+    def test_read_sav(self):
+        meta = mock.Mock(column_names=list(self.df.columns),
+                         column_names_to_labels={'q1': 'Q1', 'r1': 'Region', 'text': None},
+                         variable_value_labels={'q1': {1.: 'a', 2.: 'b'}, 'q3': {1.: 'x'}})
+        pyreadstat = mock.Mock()
+        pyreadstat.read_sav.return_value = (None, meta)
+
+        def _chunks(read, path, chunksize, usecols, **kwargs):
+            for start in range(0, len(self.df), chunksize):
+                yield self.df[usecols].iloc[start:start + chunksize], meta
+
+        pyreadstat.read_file_in_chunks.side_effect = _chunks
+        with mock.patch.dict(sys.modules, {'pyreadstat': pyreadstat}):
+            sd = SurveyData.read_sav('data.sav', expressions=['q1 by r1'], chunksize=64)
+
+        self.assertEqual(list(sd.data.columns), ['q1', 'r1'])
+        self.assertEqual(sd.variable_labels, {'q1': 'Q1', 'r1': 'Region'})
+        self.assertEqual(sd.value_labels, {'q1': {1.: 'a', 2.: 'b'}})
+        self.assertEqual(sd.structure.get_variable_by_id('r1').variable_label, 'Region')
+        pd.testing.assert_frame_equal(sd.cross('q1 by r1')._crosstab, SurveyData(self.df).cross('q1 by r1')._crosstab,
+                                      check_index_type=False, check_column_type=False)
+
+        # labels of file without rows are read from metadata
+        pyreadstat.read_file_in_chunks.side_effect = lambda *args, **kwargs: iter([])
+        with mock.patch.dict(sys.modules, {'pyreadstat': pyreadstat}):
+            sd = SurveyData.read_sav('empty.sav', expressions=['q1 by r1'])
+        self.assertEqual((len(sd.data), list(sd.data.columns)), (0, ['q1', 'r1']))
+        self.assertEqual(sd.variable_labels, {'q1': 'Q1', 'r1': 'Region'})
+
+        with mock.patch.dict(sys.modules, {'pyreadstat': None}):
+            with self.assertRaises(Exception):
+                SurveyData.read_sav('data.sav')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import unittest
+import sys
+import os
+
+import pandas as pd
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.tools.crosstab import Crosstab
+from pymeera.tools.tablebook import TableBook
+from pymeera.tools import parallel
+from pymeera.tools.counting import CodeBook
+from pymeera.tools.parallel import ParallelTableBook
+from pymeera.tools.profiling import Profiler, NULL_STAGE, stage
+from tests.test_crosstab import make_data
+
+STUBS = ['q1', 'q2 + q3', 'q1 > q2']
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_table_stages(self):
+        profiler = Profiler()
+        df = make_data()
+        table = Crosstab(df, expression='q1 + q2 by r1 + r2', weight='w', profiler=profiler)
+        stats = table.stats
+
+        self.assertEqual(set(stats['stage']), {'table', 'count', 'codes', 'block', 'base', 'render'})
+        self.assertEqual(set(stats['expression']), {'q1 + q2 by r1 + r2'})
+
+        blocks = stats[stats['stage'] == 'block']
+        self.assertEqual(sorted(zip(blocks['row_group'], blocks['column_group'])), [(0, 0), (0, 1), (1, 0), (1, 1)])
+        self.assertEqual(list(blocks['rows']), [len(df)] * 4)
+        # q1 has 3 values, r1 2 values
+        self.assertEqual(blocks[(blocks['row_group'] == 0) & (blocks['column_group'] == 0)]['cells'].item(), 6)
+
+        # nested stages take part of time of enclosing one
+        total = stats[stats['stage'] == 'table']['seconds'].item()
+        self.assertLessEqual(stats[stats['stage'] == 'count']['seconds'].item(), total)
+        self.assertEqual(stats[stats['stage'] == 'render']['cells'].item(), table._crosstab.size)
+        self.assertTrue(stats['peak'].isnull().all())
+
+    def test_disabled(self):
+        table = Crosstab(make_data(), expression='q1 by r1')
+        self.assertIsNone(table.stats)
+
+        self.assertIs(stage(None, 'count', rows=1), NULL_STAGE)
+        with stage(None, 'render') as rendered:
+            rendered.cells = 1
+        self.assertFalse(hasattr(NULL_STAGE, 'cells'))
+
+    def test_pandas_engine(self):
+        profiler = Profiler()
+        Crosstab(make_data(), expression='q1 + q2 by r1', weight='w', engine='pandas', profiler=profiler)
+        self.assertEqual(
+            set(profiler.frame()['stage']), {'copy', 'table', 'total_and_weights', 'crosstab', 'base', 'concat'}
+        )
+
+    def test_memory(self):
+        profiler = Profiler(memory=True)
+        Crosstab(make_data(size=20000), expression='q1 + q2 by r1 > r2', weight='w', profiler=profiler)
+        stats = profiler.frame().set_index('stage')
+
+        # the whole table allocates at least arrays of codes of every block
+        self.assertGreater(stats.loc['table', 'peak'], 20000 * 8)
+        self.assertGreaterEqual(stats.loc['table', 'peak'], stats['peak'].max())
+
+    def test_batch(self):
+        records = []
+        profiler = Profiler(callbacks=[records.append])
+        tables = list(TableBook(make_data(), banner='r1 + r2', stubs=STUBS, weight='w', profiler=profiler))
+
+        self.assertEqual(records, profiler.records)
+        self.assertEqual(len(set(profiler.frame()['table'])), len(STUBS))
+        for idx, table in enumerate(tables):
+            self.assertEqual(set(table.stats['table']), {idx})
+
+        summary = profiler.summary()
+        self.assertEqual(summary.loc['table', 'calls'], len(STUBS))
+        self.assertEqual(summary.loc['block', 'calls'], 2 * (1 + 2 + 1))
+        self.assertAlmostEqual(summary.loc['block', 'seconds'], profiler.frame().query('stage == "block"')['seconds'].sum())
+
+        by_table = profiler.summary(by=['expression', 'stage'])
+        self.assertEqual(by_table.loc[('q2 + q3 by r1 + r2', 'block'), 'calls'], 4)
+
+    def test_merge(self):
+        first, second = Profiler(), Profiler()
+        Crosstab(make_data(), expression='q1 by r1', profiler=first)
+        Crosstab(make_data(), expression='q2 by r1', profiler=second)
+        Crosstab(make_data(), expression='q3 by r1', profiler=second)
+
+        self.assertEqual(first.merge(second), 1)
+        frame = first.frame()
+        self.assertEqual(list(frame.drop_duplicates('table')['expression']), ['q1 by r1', 'q2 by r1', 'q3 by r1'])
+
+        subset = first.subset(2)
+        self.assertEqual(set(subset.frame()['table']), {0})
+        pd.testing.assert_frame_equal(subset.frame().drop(columns='table'),
+                                      frame[frame['table'] == 2].drop(columns='table').reset_index(drop=True))
+
+    def test_parallel(self):
+        profiler = Profiler()
+        book = ParallelTableBook(make_data(), banner='r1 + r2', stubs=STUBS, weight='w', workers=2,
+                                 profiler=profiler)
+        tables = list(book)
+
+        self.assertEqual(list(profiler.frame().drop_duplicates('table')['expression']),
+                         ['%s by r1 + r2' % stub for stub in STUBS])
+        self.assertEqual(profiler.summary().loc['table', 'calls'], len(STUBS))
+        self.assertEqual(set(tables[-1].stats['expression']), {'q1 > q2 by r1 + r2'})
+
+    def test_worker_records(self):
+        worker = Profiler()
+        state = {'codebook': CodeBook(make_data()), 'kwargs': {'weight': 'w', 'profiler': worker}}
+        with mock.patch.dict(parallel._WORKER, state):
+            tables = [parallel._evaluate_table('%s by r1' % stub) for stub in STUBS]
+
+        # worker keeps no history, every table carries only its own records
+        self.assertEqual(len(worker), 0)
+        for stub, table in zip(STUBS, tables):
+            self.assertEqual(set(table.stats['expression']), {'%s by r1' % stub})
+            self.assertEqual(set(table.stats['table']), {0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import unittest
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.survey import SurveyData
+from pymeera.tools import counting
+from pymeera.tools.counting import CodeBook
+from pymeera.tools.recode import Recoder, ValueMap, RangeBins, Net, Computed
+
+
+def make_wave(size=300, seed=0):
+    rnd = np.random.RandomState(seed)
+    df = pd.DataFrame({
+        'age': rnd.randint(14, 80, size).astype(float),
+        'q5': rnd.choice([1, 2, 3, 4, 5], size),
+        'b1': rnd.choice([1, np.nan], size),
+        'b2': rnd.choice([2, np.nan], size),
+        'w': rnd.uniform(.5, 2., size),
+    })
+    df.loc[rnd.rand(size) < .1, 'age'] = np.nan
+    return df
+
+
+def resolve(df, *steps):
+    recoder = Recoder()
+    for step in steps:
+        recoder.add(step)
+    factor = CodeBook(df, recoder=recoder).factor(steps[-1].variable_id)
+    return pd.Series(np.append(factor.uniques.astype(object), np.nan)[factor.codes], index=df.index)
+
+
+class TestSteps(unittest.TestCase):
+
+    def test_value_map(self):
+        df = make_wave()
+        result = resolve(df, ValueMap('top2', 'q5', {4: 1, 5: 1, 1: 0, 2: 0}))
+
+        expected = df['q5'].map({4: 1, 5: 1, 1: 0, 2: 0})
+        pd.testing.assert_series_equal(result.astype(float), expected.astype(float), check_names=False)
+
+    def test_value_map_keep_unmapped(self):
+        df = make_wave()
+        result = resolve(df, ValueMap('q5r', 'q5', {5: 4}, keep_unmapped=True))
+        self.assertEqual(sorted(result.unique()), [1, 2, 3, 4])
+        self.assertEqual((result == 4).sum(), df['q5'].isin([4, 5]).sum())
+
+    def test_value_map_mixed_types(self):
+        df = make_wave()
+        codebook = CodeBook(df)
+        factor = ValueMap('q5r', 'q5', {1: 'top'}, keep_unmapped=True).evaluate(codebook)
+        self.assertEqual(factor.uniques.tolist(), ['top', 2, 3, 4, 5])
+        self.assertEqual((factor.codes == 1).sum(), (df['q5'] == 2).sum())
+
+        sd = SurveyData(df)
+        sd.recode(variable_id='q5r', source='q5', mapping={1: 'top'}, keep_unmapped=True)
+        table = sd.cross('q5r by b1 where q5r = 2')
+        self.assertEqual(table._crosstab.index[0][:2], ('q5r', 2))
+
+    def test_range_bins(self):
+        df = make_wave()
+        result = resolve(df, RangeBins('age_group', 'age', [18, 35, 55, 100], values=['18-34', '35-54', '55+']))
+
+        expected = pd.cut(df['age'], [18, 35, 55, 100], right=False, labels=['18-34', '35-54', '55+'])
+        pd.testing.assert_series_equal(result, expected.astype(object).where(expected.notnull(), np.nan),
+                                       check_names=False, check_dtype=False)
+
+    def test_net(self):
+        df = make_wave()
+        result = resolve(df, Net('any', ['b1', 'b2']))
+
+        answered = df[['b1', 'b2']].notnull().any(axis=1)
+        self.assertTrue((result[answered] == 1).all())
+        self.assertTrue(result[~answered].isnull().all())
+
+    def test_computed(self):
+        df = make_wave()
+        result = resolve(df, Computed('q5x2', ['q5'], lambda q5: q5 * 2))
+        pd.testing.assert_series_equal(result.astype(float), df['q5'] * 2., check_names=False)
+
+    def test_chain(self):
+        df = make_wave()
+        result = resolve(df, ValueMap('top2', 'q5', {4: 1, 5: 1}), Net('top2_net', ['top2']))
+        self.assertEqual((result == 1).sum(), df['q5'].isin([4, 5]).sum())
+
+    def test_self_reference(self):
+        with self.assertRaises(Exception):
+            Recoder().add(ValueMap('q5', 'q5', {1: 2}))
+
+
+class TestSurveyRecode(unittest.TestCase):
+
+    def test_cross(self):
+        df = make_wave()
+        sd = SurveyData(df)
+        sd.recode(variable_id='top2', source='q5', mapping={4: 1, 5: 1})
+        sd.recode(variable_id='age_group', source='age', edges=[18, 35, 55, 100])
+
+        table = sd.cross('top2 by age_group', weight='w')
+
+        df['top2'] = df['q5'].map({4: 1, 5: 1})
+        df['age_group'] = pd.cut(df['age'], [18, 35, 55, 100], right=False, labels=False) + 1
+        expected = SurveyData(df).cross('top2 by age_group', weight='w')
+        np.testing.assert_allclose(table._crosstab.values, expected._crosstab.values)
+
+    def test_lazy(self):
+        df = make_wave()
+        sd = SurveyData(df)
+        calls = []
+        sd.recode(variable_id='q5x2', sources=['q5'], function=lambda q5: calls.append(1) or q5 * 2)
+
+        self.assertEqual(len(calls), 0)
+        sd.cross('q5 by b1')
+        self.assertEqual(len(calls), 0)
+
+        sd.cross('q5x2 by b1')
+        sd.cross('q5x2 by b2')
+        self.assertEqual(len(calls), 1)
+
+    def test_input_changed(self):
+        df = make_wave()
+        sd = SurveyData(df)
+        sd.recode(variable_id='top2', source='q5', mapping={4: 1, 5: 1})
+        before = sd.cross('top2 by b1')
+
+        sd['q5'] = sd.data['q5'].replace(1, 5)
+        after = sd.cross('top2 by b1')
+        self.assertGreater(after._crosstab.values[0, 0], before._crosstab.values[0, 0])
+
+    def test_fingerprints_kept(self):
+        sd = SurveyData(make_wave())
+        sd.recode(variable_id='top2', source='q5', mapping={4: 1, 5: 1})
+        sd.cross('top2 by b1')
+
+        with mock.patch.object(counting, 'fingerprint', wraps=counting.fingerprint) as hashed:
+            sd.cross('top2 by b1')
+            sd.cross('top2 by b2')
+        self.assertEqual(hashed.call_count, 0)
+
+        sd['q5'] = sd.data['q5']
+        with mock.patch.object(counting, 'fingerprint', wraps=counting.fingerprint) as hashed:
+            sd.cross('top2 by b1')
+        self.assertEqual(hashed.call_count, 1)
+
+        sd.data = make_wave(seed=1)
+        self.assertEqual(sd._fingerprints, {})
+
+    def test_replay(self):
+        first = SurveyData(make_wave(seed=0))
+        first.recode(variable_id='top2', source='q5', mapping={4: 1, 5: 1})
+        first.recode(variable_id='any', sources=['b1', 'b2'])
+        self.assertEqual([step.variable_id for step in first.data_transformation_history], ['top2', 'any'])
+
+        df = make_wave(seed=1)
+        second = SurveyData(df)
+        second.replay(first.data_transformation_history)
+        self.assertEqual(len(second.data_transformation_history), 2)
+
+        table = second.cross('top2 by any')
+        answered = df[['b1', 'b2']].notnull().any(axis=1)
+        self.assertEqual(table._crosstab.values[-1].sum(), (answered & df['q5'].isin([4, 5])).sum())
+
+    def test_table_book(self):
+        sd = SurveyData(make_wave())
+        sd.recode(variable_id='top2', source='q5', mapping={4: 1, 5: 1})
+        tables = list(sd.cross(stubs=['top2', 'q5'], banner='b1 + b2'))
+        self.assertEqual(len(tables), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
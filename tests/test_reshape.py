@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import unittest
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.survey import SurveyData, SurveyStructure, VariableStructure
+from pymeera.tools.reshape import grid, melt, pivot
+
+
+def make_grid(size=50, brands=3, seed=0):
+    rnd = np.random.RandomState(seed)
+    df = pd.DataFrame({'w': rnd.uniform(.5, 2., size)}, index=np.arange(100, 100 + size))
+    structure = SurveyStructure()
+    structure.add_variable(VariableStructure(variable_id='w'))
+    for question_id in ['q1', 'q2']:
+        for brand in range(1, brands + 1):
+            variable_id = '%s_%d' % (question_id, brand)
+            df[variable_id] = rnd.choice([1., 2., 3., np.nan], size)
+            structure.add_variable(VariableStructure(variable_id=variable_id, variable_values={brand: 'b%d' % brand}))
+    return df, structure
+
+
+class TestReshape(unittest.TestCase):
+
+    def test_grid(self):
+        _, structure = make_grid(brands=2)
+        children, cases = grid(structure)
+        self.assertEqual(list(children), ['q1', 'q2'])
+        self.assertEqual(cases, ['1', '2'])
+        self.assertEqual(children['q2'], {'1': 'q2_1', '2': 'q2_2'})
+
+    def test_melt(self):
+        df, structure = make_grid()
+        long = melt(df, structure, id_vars=['w'])
+
+        self.assertEqual(list(long.columns), ['respondent', 'case', 'w', 'q1', 'q2'])
+        self.assertEqual(len(long), len(df) * 3)
+
+        expected = pd.melt(df.reset_index(), id_vars=['index'], value_vars=['q1_1', 'q1_2', 'q1_3'])
+        expected = expected.sort_values(['index', 'variable'], kind='stable')
+        np.testing.assert_array_equal(long['q1'].to_numpy(), expected['value'].to_numpy())
+        np.testing.assert_array_equal(long['respondent'].to_numpy(), expected['index'].to_numpy())
+        np.testing.assert_array_equal(long['w'].to_numpy(), np.repeat(df['w'].to_numpy(), 3))
+
+    def test_melt_missing_case(self):
+        df, structure = make_grid()
+        structure.remove('q2_3')
+        long = melt(df, structure)
+        self.assertTrue(long.loc[long['case'] == '3', 'q2'].isnull().all())
+
+    def test_melt_categorical(self):
+        df, structure = make_grid()
+        sd = SurveyData(df, structure=structure, compact=True)
+        long = melt(sd.data, structure)
+        self.assertIsInstance(long['q1'].dtype, pd.CategoricalDtype)
+        np.testing.assert_array_equal(long['q1'].astype(float).to_numpy(), melt(df, structure)['q1'].to_numpy())
+
+    def test_round_trip(self):
+        df, structure = make_grid()
+        wide = pivot(melt(df, structure, id_vars=['w']), id_vars=['w'])
+        pd.testing.assert_frame_equal(wide, df, check_names=False)
+
+    def test_pivot_scatter(self):
+        df, structure = make_grid()
+        long = melt(df, structure)
+        shuffled = long.sample(frac=1., random_state=0).iloc[:-5]
+
+        wide = pivot(shuffled)
+        expected = pivot(long).loc[wide.index]
+        removed = long.loc[~long.index.isin(shuffled.index)]
+        for _, row in removed.iterrows():
+            expected.loc[row['respondent'], 'q1_' + row['case']] = np.nan
+            expected.loc[row['respondent'], 'q2_' + row['case']] = np.nan
+        pd.testing.assert_frame_equal(wide, expected[wide.columns])
+
+    def test_pivot_duplicates(self):
+        long = pd.DataFrame({'respondent': [1, 1], 'case': ['1', '1'], 'q1': [1, 2]})
+        with self.assertRaises(Exception):
+            pivot(long)
+
+    def test_survey_data(self):
+        df, structure = make_grid()
+        sd = SurveyData(df, value_labels={'q1_1': {1: 'a'}, 'q1_2': {2: 'b'}}, structure=structure)
+        long = sd.vars_to_cases(id_vars=['w'])
+        self.assertEqual(long.value_labels['q1'], {1: 'a', 2: 'b'})
+
+        table = long.cross('q1 by q2', weight='w')
+        counts = long.data.dropna(subset=['q1', 'q2']).groupby(['q1', 'q2'])['w'].sum()
+        self.assertAlmostEqual(np.nansum(table._crosstab.values[:-1]), counts.sum())
+
+        wide = long.cases_to_vars(id_vars=['w'])
+        pd.testing.assert_frame_equal(wide.data, df, check_names=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
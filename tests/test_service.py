@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import unittest
+import asyncio
+import threading
+import time
+import sys
+import os
+
+import pandas as pd
+
+try:
+    from unittest import mock
+except ImportError:
+    import mock
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.survey import SurveyData, SurveyStructure
+from pymeera.tools import service as service_module
+from pymeera.tools.service import TableService
+from tests.test_crosstab import make_data
+
+
+class TestTableService(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.df = make_data()
+        self.sd = SurveyData(self.df)
+
+    async def test_coalesce(self):
+        expressions = ['q1 by r1', 'q3 by r1', 'q1 by  r1', 'q2 by r1 + r2', 'q1 by r1', 'q3 by r1 + r2']
+
+        async with TableService(self.sd, window=.05, weight='w') as service:
+            with mock.patch.object(service_module, '_count_batch', wraps=service_module._count_batch) as counted:
+                tables = await service.client().gather(expressions)
+
+        # two banners, duplicates are counted once
+        self.assertEqual(dict(service.stats), {'requests': 6, 'duplicates': 2, 'batches': 2, 'tables': 4})
+        self.assertEqual(sorted(call[0][1] for call in counted.call_args_list),
+                         [['q1 by r1', 'q3 by r1'], ['q2 by r1 + r2', 'q3 by r1 + r2']])
+        self.assertIs(tables[0], tables[4])
+
+        for expression, table in zip(expressions, tables):
+            pd.testing.assert_frame_equal(table._crosstab, self.sd.cross(expression, weight='w')._crosstab)
+
+    async def test_filters_and_options(self):
+        async with TableService(self.sd, window=.05) as service:
+            client = service.client()
+            tables = await asyncio.gather(
+                client.cross('q1 by r1  where  q2 = 1'),
+                client.cross('q3 by r1', filter='q2 = 1'),
+                client.cross('q3 by r1'),
+                client.cross('q3 by r1', weight='w'),
+            )
+
+        self.assertEqual(service.stats['batches'], 3)
+        pd.testing.assert_frame_equal(
+            tables[1]._crosstab, self.sd.cross('q3 by r1', filter='q2 = 1')._crosstab
+        )
+        pd.testing.assert_frame_equal(tables[3]._crosstab, self.sd.cross('q3 by r1', weight='w')._crosstab)
+
+    async def test_lazy(self):
+        async with TableService(self.sd, window=.05, lazy=True) as service:
+            tables = await service.client().gather(['q1 by r1', 'q3 by r1', 'q1 by'], return_exceptions=True)
+
+        for table in tables[:2]:
+            self.assertIsNotNone(table._table)
+        pd.testing.assert_frame_equal(tables[1]._crosstab, self.sd.cross('q3 by r1')._crosstab)
+        self.assertIsInstance(tables[2], Exception)
+
+        # tables counted one by one after book failed are evaluated too
+        table = self.sd.cross('q1 by r1', lazy=True)
+        with mock.patch.object(self.sd, 'cross', side_effect=[Exception('book'), table]):
+            self.assertIs(service_module._count_batch(self.sd, ['q1 by r1'], {'lazy': True})[0], table)
+        self.assertIsNotNone(table._table)
+
+    async def test_patterns(self):
+        self.df['city'] = ['a*b', 'c'] * (len(self.df) // 2)
+        structure = SurveyStructure.from_list([{'variable_id': v} for v in self.df.columns])
+        sd = SurveyData(self.df, structure=structure)
+
+        async with TableService(sd, window=.05) as service:
+            table = await service.cross('q* by r1 where city = "a*b"')
+
+        pd.testing.assert_frame_equal(table._crosstab,
+                                      sd.cross('q1 + q2 + q3 by r1', filter='city = "a*b"')._crosstab)
+
+    async def test_errors(self):
+        async with TableService(self.sd, window=.05) as service:
+            results = await service.client().gather(['q1 by r1', 'q1 by', 'missing by r1', 'q3 by r1'],
+                                                    return_exceptions=True)
+
+        self.assertIsInstance(results[1], Exception)
+        self.assertIsInstance(results[2], Exception)
+        pd.testing.assert_frame_equal(results[3]._crosstab, self.sd.cross('q3 by r1')._crosstab)
+
+        with self.assertRaises(Exception):
+            await TableService(self.sd).cross('q1 by r1')
+
+    async def test_backpressure(self):
+        running, peak = [0], [0]
+        lock = threading.Lock()
+
+        def _slow_batch(survey, expressions, kwargs):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(.02)
+            with lock:
+                running[0] -= 1
+            return [survey.cross(e, **kwargs) for e in expressions]
+
+        expressions = ['q1 by r1', 'q2 by r2', 'q3 by r1 > r2'] * 4
+        with mock.patch.object(service_module, '_count_batch', _slow_batch):
+            async with TableService(self.sd, window=0, max_batch=1, max_pending=2, max_in_flight=2) as service:
+                requests = [asyncio.ensure_future(service.cross(e)) for e in expressions]
+                queued = []
+                while not all(r.done() for r in requests):
+                    queued.append(service._queue.qsize())
+                    await asyncio.sleep(.005)
+                tables = await asyncio.gather(*requests)
+
+        self.assertLessEqual(max(queued), 2)
+        self.assertEqual(peak[0], 2)
+        self.assertEqual(service.stats['batches'], len(expressions))
+        pd.testing.assert_frame_equal(tables[-1]._crosstab, self.sd.cross('q3 by r1 > r2')._crosstab)
+
+    async def test_stop(self):
+        service = TableService(self.sd, window=1.)
+        await service.start()
+        request = asyncio.ensure_future(service.cross('q1 by r1'))
+        await asyncio.sleep(.01)
+        await service.stop()
+
+        with self.assertRaises(asyncio.CancelledError):
+            await request
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import unittest
+import json
+import tempfile
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.survey import SurveyData, SurveyStructure
+from pymeera.utils.store import ColumnStore
+from pymeera.tools.crosstab import Crosstab
+from tests.test_crosstab import make_data
+
+
+class TestColumnStore(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def test_roundtrip(self):
+        df = make_data()
+        df['city'] = ['Moscow', 'Paris', None, 'Rome'] * 50
+        structure = SurveyStructure.from_list([{'variable_id': 'q1', 'variable_label': 'Q1', 'variable_values': {1: 'a'}}])
+
+        SurveyData(df, variable_labels={'q1': 'Q1'}, value_labels={'q1': {1: 'a', 2: 'b'}},
+                   structure=structure, compact=True).save(self.path)
+        sd = SurveyData.open(self.path)
+
+        self.assertIsInstance(sd.data, ColumnStore)
+        self.assertEqual(sd.variable_labels, {'q1': 'Q1'})
+        self.assertEqual(sd.value_labels['q1'], {1: 'a', 2: 'b'})
+        self.assertEqual(sd.structure.get_variable_by_id('q1').variable_values, {1: 'a'})
+
+        self.assertEqual(sd.data['city'].tolist()[:3], ['Moscow', 'Paris', np.nan])
+        np.testing.assert_array_equal(sd.data['w'].to_numpy(), df['w'].to_numpy())
+        np.testing.assert_array_equal(sd.data['q3'].astype(float).to_numpy(), df['q3'].to_numpy())
+
+    def test_lazy_columns(self):
+        df = make_data()
+        SurveyData(df, compact=True).save(self.path)
+        sd = SurveyData.open(self.path)
+
+        self.assertEqual(sd.data._arrays, {})
+
+        expression = 'q1 + q2 > q3 by r1 > r2'
+        table = sd.cross(expression, weight='w')
+        self.assertEqual(set(sd.data._arrays), {'q1', 'q2', 'q3', 'r1', 'r2', 'w'})
+        self.assertIsInstance(sd.data._arrays['q1'], np.memmap)
+
+        pd.testing.assert_frame_equal(
+            table._crosstab, Crosstab(df, expression=expression, weight='w')._crosstab,
+            check_index_type=False, check_column_type=False
+        )
+
+    def test_added_column(self):
+        df = make_data()
+        SurveyData(df, compact=True).save(self.path)
+        sd = SurveyData.open(self.path)
+        result = sd.rake({'q2': {1: .5, 2: .5}}, weight_id='rw')
+
+        self.assertIn('rw', sd.data)
+        self.assertEqual(list(sd.data.columns)[-1], 'rw')
+        np.testing.assert_array_equal(sd.data['rw'].to_numpy(), result.weights)
+        self.assertNotIn('rw', ColumnStore(self.path))
+
+        df['rw'] = result.weights
+        pd.testing.assert_frame_equal(
+            sd.cross('q1 by r1', weight='rw')._crosstab, Crosstab(df, expression='q1 by r1', weight='rw')._crosstab,
+            check_index_type=False, check_column_type=False
+        )
+
+        sd.data['w'] = np.ones(len(df))
+        self.assertEqual(sd.data['w'].sum(), len(df))
+        with self.assertRaises(Exception):
+            sd.data['x'] = np.ones(3)
+
+    def test_version(self):
+        SurveyData(make_data()).save(self.path)
+        meta_path = os.path.join(self.path, 'meta.json')
+        with open(meta_path) as f:
+            meta = json.load(f)
+        meta['version'] = 1
+        with open(meta_path, 'w') as f:
+            json.dump(meta, f)
+
+        with self.assertRaises(Exception):
+            SurveyData.open(self.path)
+
+    def test_projection(self):
+        SurveyData(make_data()).save(self.path)
+        store = ColumnStore(self.path)
+
+        self.assertEqual(list(store[['q1', 'w']].columns), ['q1', 'w'])
+        self.assertEqual(set(store._arrays), {'q1', 'w'})
@@ -70,3 +70,41 @@ class TestSurveyStructures(unittest.TestCase):
         self.assertEqual(list(map(lambda x: x.variable_id, children)), ['a1_1', 'a1_2'])
         self.assertEqual(vals, {11: 'a1_a', 12: 'a1_b'})
 
+    def test_to_hierarchical_keeps_plain(self):
+        ss = SurveyStructure.from_list([
+            {'variable_id': 'a1_1', 'variable_values': {1: 'a'}},
+            {'variable_id': 'a1_2', 'variable_values': {2: 'b'}},
+            {'variable_id': 'a2'},
+        ])
+        hierarchical = ss.to_hierarchical(convert_exceptions=['a1_2'])
+
+        self.assertEqual(hierarchical.get_all_variables_ids(), ['a1', 'a1_2', 'a2'])
+        hierarchical.get_variable_by_id('a1').variable_values[3] = 'c'
+        self.assertEqual(ss.get_variable_by_id('a1_1').variable_values, {1: 'a'})
+
+    def test_indexes(self):
+        ss = SurveyStructure.from_list([
+            {'variable_id': v} for v in ['q1_3', 'q1_1', 'q10_3', 'q12_1', 'q12_2', 'q2', 'q1_2']
+        ])
+
+        self.assertEqual(ss.children('q12'), ['q12_1', 'q12_2'])
+        self.assertEqual(ss.children('q1'), ['q1_3', 'q1_1', 'q1_2'])
+        self.assertEqual(ss.with_prefix('q1_'), ['q1_3', 'q1_1', 'q1_2'])
+        self.assertEqual(ss.select('q1*_3'), ['q1_3', 'q10_3'])
+        self.assertEqual(ss.select('q12_?'), ['q12_1', 'q12_2'])
+        self.assertEqual(ss.select('q2'), ['q2'])
+
+        ss.remove('q10_3')
+        self.assertEqual(ss.select('q1*_3'), ['q1_3'])
+        self.assertNotIn('q10_3', ss)
+
+    def test_expand(self):
+        ss = SurveyStructure.from_list([{'variable_id': v} for v in ['q1_3', 'q10_3', 'q2']])
+        self.assertEqual(ss.expand('q1*_3 by q2'), '(q1_3 + q10_3) by q2')
+        with self.assertRaises(Exception):
+            ss.expand('q3* by q2')
+
+        # values of filter are not patterns
+        self.assertEqual(ss.expand('q1*_3 by q2  where city = "a*b" or q2 = 1'),
+                         '(q1_3 + q10_3) by q2  where city = "a*b" or q2 = 1')
+
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import unittest
+import tempfile
+import json
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.utils.synthetic import make_frame, make_survey
+from benchmarks import suite
+
+
+class TestSynthetic(unittest.TestCase):
+
+    def test_frame(self):
+        df = make_frame(respondents=5000, single=3, multi=2, choices=4, values=6, missing=.2)
+
+        self.assertEqual(list(df.columns), ['q1', 'q2', 'q3'] + ['m%d_%d' % (q, c) for q in (1, 2) for c in range(1, 5)]
+                         + ['weight'])
+        self.assertTrue(set(df['q1'].dropna().unique()) <= set(range(1, 7)))
+        self.assertAlmostEqual(df['q1'].isnull().mean(), .2, delta=.03)
+        self.assertEqual(set(df['m1_3'].dropna().unique()), {3.})
+        self.assertAlmostEqual(df['weight'].mean(), 1.)
+        self.assertTrue((df['weight'] > 0).all())
+
+    def test_reproducible(self):
+        pd.testing.assert_frame_equal(make_frame(respondents=100, seed=3), make_frame(respondents=100, seed=3))
+        self.assertFalse(make_frame(respondents=100, seed=3).equals(make_frame(respondents=100, seed=4)))
+
+    def test_survey(self):
+        sd = make_survey(respondents=500, single=2, multi=1, choices=3)
+        structure = sd.structure.to_hierarchical()
+
+        self.assertEqual(structure.get_all_variables_ids(), ['q1', 'q2', 'm1', 'weight'])
+        self.assertEqual(len(structure.get_variable_by_id('m1').variable_children), 3)
+        self.assertEqual(sd.value_labels['m1_2'], {2: 'Choice 2'})
+
+        table = sd.cross('m1_1 + m1_2 + m1_3 by q1', weight='weight')
+        self.assertGreater(np.nansum(table._crosstab.values[:-1]), 0)
+
+
+class TestBenchmarks(unittest.TestCase):
+
+    def test_run_and_compare(self):
+        report = suite.run(sizes=[200], repeat=1, verbose=False)
+        self.assertEqual([r['case'] for r in report['results']], list(suite.CASES))
+
+        path = suite.save(report, os.path.join(tempfile.mkdtemp(), 'report.json'))
+        with open(path) as f:
+            stored = json.load(f)
+
+        slower = json.loads(json.dumps(stored))
+        slower['results'][0]['min'] *= 2
+        rows = suite.compare(stored, slower, threshold=.5)
+        self.assertEqual(len(rows), len(suite.CASES))
+        self.assertTrue(rows[0][-1])
+        self.assertFalse(any(row[-1] for row in rows[1:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
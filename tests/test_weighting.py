@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import print_function, unicode_literals, division
+
+import unittest
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from pymeera.survey import SurveyData
+from pymeera.tools.weighting import rake
+
+
+def make_sample(size=5000, seed=1):
+    rnd = np.random.RandomState(seed)
+    df = pd.DataFrame({
+        'gender': rnd.choice([1, 2], size, p=[.6, .4]),
+        'age': rnd.choice([1, 2, 3], size, p=[.5, .3, .2]).astype(float),
+        'region': rnd.choice([1, 2, 3, 4], size),
+    })
+    df.loc[rnd.rand(size) < .05, 'age'] = np.nan
+    return df
+
+
+TARGETS = {
+    'gender': {1: .48, 2: .52},
+    'age': {1: 30, 2: 40, 3: 30},
+    'region': {1: .1, 2: .2, 3: .3, 4: .4},
+}
+
+
+class TestRaking(unittest.TestCase):
+
+    def test_margins(self):
+        df = make_sample()
+        result = rake(df, TARGETS, tolerance=1e-8)
+
+        self.assertTrue(result.converged)
+        self.assertAlmostEqual(result.weights.mean(), 1.)
+
+        for variable_id, target in TARGETS.items():
+            valid = df[variable_id].notna().to_numpy()
+            shares = pd.Series(result.weights[valid]).groupby(df[variable_id].to_numpy()[valid]).sum()
+            shares /= shares.sum()
+            total = float(sum(target.values()))
+            for value, share in target.items():
+                self.assertAlmostEqual(shares[value], share / total, places=6)
+
+    def test_quality(self):
+        result = rake(make_sample(), TARGETS)
+        w = result.weights
+
+        self.assertAlmostEqual(result.efficiency, w.sum() ** 2 / (len(w) * (w ** 2).sum()))
+        self.assertAlmostEqual(result.design_effect, 1 + (w.std() / w.mean()) ** 2)
+        self.assertLess(result.efficiency, 1.)
+
+    def test_trim(self):
+        result = rake(make_sample(), TARGETS, trim=(.8, 1.2), max_iterations=10)
+
+        self.assertLessEqual(result.weights.max() / result.weights.mean(), 1.2 + 1e-9)
+        self.assertGreaterEqual(result.weights.min() / result.weights.mean(), .8 - 1e-9)
+
+    def test_unknown_value(self):
+        with self.assertRaises(Exception):
+            rake(make_sample(), {'gender': {1: .5}})
+        with self.assertRaises(Exception):
+            rake(make_sample(), {'gender': {1: .5, 2: .3, 3: .2}})
+
+    def test_empty_values(self):
+        df = make_sample()
+        # "Refused" is labeled, but nobody has chosen it
+        compact = SurveyData(df, value_labels={'gender': {1: 'Male', 2: 'Female', 9: 'Refused'}}, compact=True)
+
+        expected = rake(df, {'gender': {1: .5, 2: .5}}).weights
+        np.testing.assert_allclose(rake(compact.data, {'gender': {1: .5, 2: .5}}).weights, expected)
+        for data in (df, compact.data):
+            np.testing.assert_allclose(rake(data, {'gender': {1: .5, 2: .5, 9: 0}}).weights, expected)
+            with self.assertRaises(Exception):
+                rake(data, {'gender': {1: .5, 2: .3, 9: .2}})
+
+    def test_survey_data_weight(self):
+        sd = SurveyData(make_sample())
+        sd.rake({'gender': {1: .48, 2: .52}}, weight_id='w')
+
+        table = sd.cross('gender by region', weight='w')._crosstab
+        base = table.loc[('$BASE$', '', '$COUNT$')].sum()
+        self.assertAlmostEqual(table.loc[('gender', 1, '$COUNT$')].sum() / base, .48)